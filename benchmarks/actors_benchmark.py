@@ -0,0 +1,60 @@
+"""Scaling of ChatExecutor with the number of workers
+
+Many chats send bursts of updates whose handlers block for a while, as handlers do
+while they wait for engines and Telegram. Reports updates per second for every
+worker count, and checks that the updates of each chat ran in order and never
+overlapped.
+
+Usage: python benchmarks/actors_benchmark.py [--chats 64] [--updates 20] [--handler-ms 5]
+"""
+import argparse
+import threading
+import time
+from telego.telegram.actors import ChatExecutor
+
+WORKERS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def run(workers, args):
+    executor = ChatExecutor(workers=workers, mailbox_size=args.updates)
+    executor.start()
+    seen = {chat_id: [] for chat_id in range(args.chats)}
+    running = set()
+    violations = []
+    lock = threading.Lock()
+
+    def handle(chat_id, number):
+        with lock:
+            if chat_id in running:
+                violations.append(chat_id)
+            running.add(chat_id)
+        time.sleep(args.handler_ms / 1000)
+        with lock:
+            running.discard(chat_id)
+            seen[chat_id].append(number)
+
+    started = time.perf_counter()
+    futures = [executor.submit(chat_id, handle, chat_id, number)
+               for number in range(args.updates) for chat_id in range(args.chats)]
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - started
+    executor.stop()
+    ordered = all(numbers == list(range(args.updates)) for numbers in seen.values())
+    updates = args.chats * args.updates
+    print('{:3d} workers {:9.0f} updates/s {:8.2f}s  in order: {}  overlaps: {}'.format(
+        workers, updates / elapsed, elapsed, ordered, len(violations)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure ChatExecutor scaling')
+    parser.add_argument('--chats', type=int, default=64)
+    parser.add_argument('--updates', type=int, default=20, help='updates per chat')
+    parser.add_argument('--handler-ms', type=float, default=5, help='milliseconds each handler blocks')
+    args = parser.parse_args()
+    for workers in WORKERS:
+        run(workers, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Compare telego Board with gomill
+
+Replays random games, and optionally the main line of every SGF file in a
+directory, on both boards and checks that positions and simple ko points are
+identical after every move. Then measures plays per second of Board against the
+gomill wrapper that telego used before.
+
+Usage: python benchmarks/board_benchmark.py [SGF_DIRECTORY]
+"""
+import os
+import random
+import re
+import sys
+import timeit
+import gomill.boards
+from telego.board import Board, BLACK, WHITE, COLUMN_LETTERS
+from telego.gtp.entities import Move, StoneColor
+
+SIZES = (9, 13, 19)
+GAMES = 10
+
+
+class GomillBoard:
+    """Board wrapper replaced by telego.board.Board
+
+    """
+
+    def __init__(self, size):
+        self._board = gomill.boards.Board(size)
+
+    def play(self, color, move):
+        color = StoneColor(color)
+        move = Move(move)
+        self._board.play(move.row_index, move.col_index, color.value)
+
+
+def random_game(size, seed, max_moves=None):
+    """Generate a random game of legal moves
+
+    :return: list of (color, row, col)
+    """
+    rng = random.Random(seed)
+    board = Board(size)
+    moves = []
+    color = BLACK
+    max_moves = max_moves or size * size
+    while len(moves) < max_moves:
+        candidates = [point for point in range(size * size) if board.check_point(color, point) is None]
+        if not candidates:
+            break
+        point = rng.choice(candidates)
+        board.play_point(color, point)
+        moves.append(('b' if color == BLACK else 'w', point // size, point % size))
+        color = BLACK + WHITE - color
+    return moves
+
+
+def sgf_games(directory):
+    """Read main line moves of SGF files
+
+    Only first-variation B/W properties are read, which is enough for game records.
+    """
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.sgf'):
+            continue
+        with open(os.path.join(directory, name), encoding='utf8', errors='replace') as f:
+            text = f.read()
+        size = re.search(r'SZ\[(\d+)\]', text)
+        size = int(size.group(1)) if size else 19
+        main_line = text.split(')')[0]
+        moves = []
+        for color, point in re.findall(r';\s*([BW])\[([a-z]{2})?\]', main_line):
+            if point and point != 'tt':
+                moves.append((color.lower(), size - 1 - (ord(point[1]) - ord('a')), ord(point[0]) - ord('a')))
+        yield name, size, moves
+
+
+def verify(size, moves):
+    ours = Board(size)
+    theirs = gomill.boards.Board(size)
+    for number, (color, row, col) in enumerate(moves, 1):
+        ko = ours.play(color, '{}{}'.format(COLUMN_LETTERS[col], row + 1))
+        expected_ko = theirs.play(row, col, color)
+        if ko != expected_ko:
+            return 'ko differs at move {}: {} != {}'.format(number, ko, expected_ko)
+        for r in range(size):
+            for c in range(size):
+                if ours.get(r, c) != theirs.get(r, c):
+                    return 'position differs at move {}'.format(number)
+    return None
+
+
+def benchmark(size, games):
+    texts = [[(color, '{}{}'.format(COLUMN_LETTERS[col], row + 1)) for color, row, col in moves] for moves in games]
+    points = [[(BLACK if color == 'b' else WHITE, row * size + col) for color, row, col in moves] for moves in games]
+    plays = sum(len(moves) for moves in games)
+
+    def run(board_class, moves_list):
+        for moves in moves_list:
+            board = board_class(size)
+            for color, move in moves:
+                board.play(color, move)
+
+    def run_points():
+        for moves in points:
+            board = Board(size)
+            for color, point in moves:
+                board.play_point(color, point)
+
+    results = {
+        'gomill wrapper': min(timeit.repeat(lambda: run(GomillBoard, texts), number=1, repeat=3)),
+        'Board.play': min(timeit.repeat(lambda: run(Board, texts), number=1, repeat=3)),
+        'Board.play_point': min(timeit.repeat(run_points, number=1, repeat=3)),
+    }
+    for name, seconds in results.items():
+        print('{:2d}x{:<2d} {:18s} {:10.0f} plays/s'.format(size, size, name, plays / seconds))
+
+
+def main():
+    failures = 0
+    corpus = {size: [random_game(size, seed) for seed in range(GAMES)] for size in SIZES}
+    for size, games in corpus.items():
+        for seed, moves in enumerate(games):
+            error = verify(size, moves)
+            if error:
+                failures += 1
+                print('random {}x{} game {}: {}'.format(size, size, seed, error))
+    if len(sys.argv) > 1:
+        for name, size, moves in sgf_games(sys.argv[1]):
+            error = verify(size, moves)
+            if error:
+                failures += 1
+                print('{}: {}'.format(name, error))
+    print('verification failures: {}'.format(failures))
+    for size, games in corpus.items():
+        benchmark(size, games)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Memory of live and compacted games
+
+Games of random legal moves are built on 9x9 and 19x19 boards at several lengths,
+against the fake engine running in process. Bytes held per game are measured with
+tracemalloc for live Game objects and for their CompactGame. Every compacted game
+is rebuilt with Game.from_compact() and checked against the original, and the
+time to rebuild and resume a game is reported.
+
+Usage: python benchmarks/compact_memory.py [--games 200]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+from telego.board import Board
+from telego.game import Game
+from telego.gtp.base import Command, Response
+from telego.gtp.entities import Move, StoneColor
+from telego.gtp.fake import FakeEngine
+
+LENGTHS = {9: (0, 20, 40, 60), 19: (0, 50, 150, 250)}
+
+
+class LocalEngine:
+    """Fake engine answering GTP commands in process
+
+    """
+
+    def __init__(self):
+        self._engine = FakeEngine(seed=1)
+        self._pending = None
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def is_alive(self):
+        return True
+
+    def send_command(self, command):
+        self._pending = command
+
+    def recv_response(self):
+        return self._answer(self._pending)
+
+    def pipeline(self, commands):
+        return [self._answer(command) for command in commands]
+
+    def _answer(self, command):
+        if not isinstance(command, Command):
+            command = Command(command)
+        return Response(self._engine.handle(str(command)).encode('utf8'))
+
+
+def random_moves(size, length, rng):
+    board = Board(size)
+    moves = []
+    while len(moves) < length:
+        color = StoneColor.BLACK if len(moves) % 2 == 0 else StoneColor.WHITE
+        legal = [Move.from_point(*divmod(point, size)) for point in range(size * size)]
+        legal = [move for move in legal if board.check(color, move) is None]
+        if not legal:
+            break
+        move = rng.choice(legal)
+        board.play(color, move)
+        moves.append(move)
+    return moves
+
+
+def build_games(engine, size, move_lists, superko):
+    games = []
+    for moves in move_lists:
+        game = Game(StoneColor.BLACK, engine, board_size=size, superko=superko)
+        game.setup()
+        game.replay(moves)
+        games.append(game)
+    return games
+
+
+def same_game(a, b):
+    if (a.board.colors, a.board.hash, a.board.ko) != (b.board.colors, b.board.hash, b.board.ko):
+        return False
+    if a.board.ko is not None and a.board.ko_color != b.board.ko_color:
+        return False
+    if (a.moves, a.state, a.is_player_turn(), a.final_score(), a.player_color) != \
+            (b.moves, b.state, b.is_player_turn(), b.final_score(), b.player_color):
+        return False
+    if a.history.hashes() != b.history.hashes():
+        return False
+    return all(a.board.check(color, Move.from_point(*divmod(point, a.board_size)), superko=True) ==
+               b.board.check(color, Move.from_point(*divmod(point, a.board_size)), superko=True)
+               for color in (StoneColor.BLACK, StoneColor.WHITE) for point in range(a.board_size ** 2))
+
+
+def measure(engine, size, length, count, rng):
+    move_lists = [random_moves(size, length, rng) for _ in range(count)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    games = build_games(engine, size, move_lists, superko=length % 2 == 0)
+    live = tracemalloc.get_traced_memory()[0] - before
+    before = tracemalloc.get_traced_memory()[0]
+    compacts = [game.compact() for game in games]
+    compact = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    rebuilt = []
+    for item in compacts:
+        game = Game.from_compact(item, engine)
+        game.resume()
+        rebuilt.append(game)
+    resume = (time.perf_counter() - started) / count
+    mismatches = sum(1 for a, b in zip(games, rebuilt) if not same_game(a, b))
+    return live / count, compact / count, resume, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare memory of live and compacted games')
+    parser.add_argument('--games', type=int, default=200, help='games per board size and length')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    engine = LocalEngine()
+    print('size  moves  live bytes/game  compact bytes/game  ratio  resume ms  mismatches')
+    for size, lengths in LENGTHS.items():
+        for length in lengths:
+            live, compact, resume, mismatches = measure(engine, size, length, args.games, rng)
+            print('{:>4}  {:>5}  {:>15.0f}  {:>18.0f}  {:>5.1f}  {:>9.3f}  {:>10}'.format(
+                size, length, live, compact, live / compact, resume * 1000, mismatches))
+
+
+if __name__ == '__main__':
+    main()
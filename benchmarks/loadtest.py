@@ -0,0 +1,295 @@
+"""Load test of GameHandler without Telegram
+
+Simulated chats play games against the fake engine (telego.gtp.fake) through
+GameHandler, with a bot object that accepts messages instead of sending them. Every
+scenario reports latency percentiles per command, games per minute, engine spawns
+and memory held per game. Players use fixed seeds, and every engine started, also
+on a restart, takes the next seed of a fixed sequence. So runs are repeatable, and
+a restarted engine does not run into the fault it was restarted for again.
+
+Usage: python benchmarks/loadtest.py [--scenario NAME] [--chats 16] [--games 2] [--moves 40] [--think 0.01]
+"""
+import argparse
+import functools
+import gettext
+import itertools
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from telego.board import BLACK, WHITE, COLUMN_LETTERS
+from telego.game import GameState
+from telego.gtp.base import GTP
+from telego.gtp.farm import EngineFarm, FarmGTP
+from telego.gtp.mux import EngineMultiplexer, MultiplexedGTP
+from telego.gtp.pool import GTPPool, PooledGTP
+from telego.gtp.server import GTPServer
+from telego.gtp.supervisor import SupervisedGTP, SupervisorStats
+from telego.scheduler import GenmoveScheduler
+from telego.telegram.handlers.game_handler import GameHandler
+from telego.telegram.outbox import Outbox
+
+SCENARIOS = ('pool', 'pool-scheduler', 'mux', 'mux-scheduler', 'farm')
+
+
+class FakeMessage:
+
+    def __init__(self, message_id, chat_id):
+        self.message_id = message_id
+        self.chat_id = chat_id
+        self.photo = []
+
+
+class FakeBot:
+    """Bot that counts messages instead of sending them
+
+    """
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self.messages = 0
+        self.computer_replies = {}
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self._cond:
+            self.messages += 1
+            self._count_reply(chat_id, text)
+            return FakeMessage(next(self._ids), chat_id)
+
+    def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        with self._cond:
+            self.messages += 1
+            self._count_reply(chat_id, text)
+            return FakeMessage(message_id, chat_id)
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        with self._cond:
+            self.messages += 1
+            return FakeMessage(next(self._ids), chat_id)
+
+    def _count_reply(self, chat_id, text):
+        if text.startswith('Computer: '):
+            self.computer_replies[chat_id] = self.computer_replies.get(chat_id, 0) + 1
+            self._cond.notify_all()
+
+    def replies(self, chat_id):
+        with self._cond:
+            return self.computer_replies.get(chat_id, 0)
+
+    def wait_replies(self, chat_id, count, timeout):
+        with self._cond:
+            return self._cond.wait_for(lambda: self.computer_replies.get(chat_id, 0) >= count, timeout)
+
+
+class FakeUpdate:
+
+    def __init__(self, chat_id):
+        self.message = FakeMessage(0, chat_id)
+
+
+class Results:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.games = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def record(self, command, seconds):
+        with self._lock:
+            self.latencies.setdefault(command, []).append(seconds)
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+def player_move(game, rng):
+    """Random legal move of player, pass if there is none
+
+    """
+    board = game.board
+    size = board.size
+    color = BLACK if game.player_color.value == 'b' else WHITE
+    candidates = [point for point in range(size * size) if board.check_point(color, point) is None]
+    if not candidates or len(game.moves) > size * size * 2:
+        return 'pass'
+    row, col = divmod(rng.choice(candidates), size)
+    return '{}{}'.format(COLUMN_LETTERS[col], row + 1)
+
+
+def play_chat(handler, bot, chat_id, args, results):
+    rng = random.Random(chat_id)
+    update = FakeUpdate(chat_id)
+    for _ in range(args.games):
+        started = time.perf_counter()
+        try:
+            handler.start(bot, update, ['b'])
+        except Exception:
+            results.count('errors')
+            continue
+        results.record('start', time.perf_counter() - started)
+        game = handler._games.get(chat_id)
+        if game is None:
+            results.count('errors')
+            continue
+        for _ in range(args.moves):
+            if game.state != GameState.ACTIVE:
+                break
+            replies = bot.replies(chat_id)
+            started = time.perf_counter()
+            try:
+                handler.play(bot, update, [player_move(game, rng)])
+            except Exception:
+                results.count('errors')
+                break
+            if game.state == GameState.ACTIVE and game.is_computer_turn():
+                if not bot.wait_replies(chat_id, replies + 1, args.timeout):
+                    results.count('timeouts')
+                    break
+            results.record('play', time.perf_counter() - started)
+        started = time.perf_counter()
+        handler.board(bot, update)
+        results.record('board', time.perf_counter() - started)
+        if game.state == GameState.ACTIVE:
+            handler.play(bot, update, ['resign'])
+        if game.state == GameState.ACTIVE:
+            results.count('errors')
+            continue
+        results.count('games')
+
+
+def run(scenario, args):
+    seeds = itertools.count(1)
+
+    def engine():
+        return [sys.executable, '-m', 'telego.gtp.fake', '--think', str(args.think), '--seed', str(next(seeds)),
+                '--crash-rate', str(args.crash_rate), '--hang-rate', str(args.hang_rate),
+                '--malformed-rate', str(args.malformed_rate)]
+
+    pool = multiplexer = scheduler = farm = None
+    supervisor_stats = SupervisorStats()
+    supervised = bool(args.command_timeout)
+    if supervised:
+        factory = lambda: SupervisedGTP(engine, timeout=args.command_timeout, genmove_timeout=args.command_timeout,
+                                        stats=supervisor_stats)
+    else:
+        factory = lambda: GTP(engine())
+    servers = []
+    if scenario == 'farm':
+        # engines of one server share its seed
+        servers = [GTPServer(engine(), host='127.0.0.1', port=0, min_engines=0, max_engines=args.chats)
+                   for _ in range(args.hosts)]
+        for server in servers:
+            server.start()
+        farm = EngineFarm(['{}:{}'.format(*server.address) for server in servers], pool_size=args.chats)
+        farm.start()
+        gtp_factory = functools.partial(FarmGTP, farm)
+    elif scenario.startswith('mux'):
+        multiplexer = EngineMultiplexer(None, max_engines=args.engines, factory=factory)
+        gtp_factory = functools.partial(MultiplexedGTP, multiplexer)
+    else:
+        pool = GTPPool(None, min_size=1, max_size=args.chats, refill_interval=0.5, factory=factory)
+        pool.start()
+        gtp_factory = functools.partial(PooledGTP, pool)
+    if scenario.endswith('scheduler'):
+        scheduler = GenmoveScheduler(slots=args.slots or None, max_queue=args.chats * 2)
+        scheduler.start()
+    outbox = None
+    if args.outbox:
+        outbox = Outbox(global_rate=1000, chat_rate=1000, chat_burst=1000)
+        outbox.start()
+    handler = GameHandler(gtp_factory=gtp_factory, scheduler=scheduler, outbox=outbox)
+    bot = FakeBot()
+    results = Results()
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    threads = [threading.Thread(target=play_chat, args=(handler, bot, chat_id, args, results))
+               for chat_id in range(args.chats)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    if farm is not None:
+        spawned = sum(server.stats()['spawned'] for server in servers)
+    else:
+        spawned = multiplexer.stats()['spawned'] if multiplexer else pool.stats()['spawned']
+    if scheduler is not None:
+        scheduler.stop()
+    if outbox is not None:
+        outbox.stop()
+    if multiplexer is not None:
+        multiplexer.close()
+    if pool is not None:
+        pool.close()
+    if farm is not None:
+        farm.close()
+    for server in servers:
+        server.stop()
+
+    print('== {} ({} chats x {} games, think {}s)'.format(scenario, args.chats, args.games, args.think))
+    for command, values in sorted(results.latencies.items()):
+        print('  {:6s} n={:<6d} p50 {:7.1f}ms  p95 {:7.1f}ms  p99 {:7.1f}ms  max {:7.1f}ms'.format(
+            command, len(values), percentile(values, 0.5) * 1000, percentile(values, 0.95) * 1000,
+            percentile(values, 0.99) * 1000, max(values) * 1000))
+    print('  games {}  games/min {:.1f}  errors {}  timeouts {}  engines spawned {}  messages {}'.format(
+        results.games, results.games / elapsed * 60, results.errors, results.timeouts, spawned, bot.messages))
+    print('  memory per game {:.1f} KiB  max rss {} KiB  engines max rss {} KiB'.format(
+        memory / max(len(handler._games), 1) / 1024,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss))
+    if supervised and scenario != 'farm':
+        stats = supervisor_stats.stats()
+        print('  engine restarts {} (crash {}, timeout {})  given up {}  recovery mean {:.1f}ms max {:.1f}ms'.format(
+            stats['restarts'], stats['crash_restarts'], stats['timeout_restarts'], stats['failures'],
+            stats['recovery_seconds_mean'] * 1000, stats['recovery_seconds_max'] * 1000))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test GameHandler with the fake engine')
+    parser.add_argument('--scenario', choices=SCENARIOS, action='append', help='scenario to run, default all')
+    parser.add_argument('--chats', type=int, default=16)
+    parser.add_argument('--games', type=int, default=2, help='games per chat')
+    parser.add_argument('--moves', type=int, default=40, help='player moves per game at most')
+    parser.add_argument('--think', type=float, default=0.01, help='engine think time in seconds')
+    parser.add_argument('--engines', type=int, default=4, help='engines of multiplexer scenarios')
+    parser.add_argument('--hosts', type=int, default=3, help='local engine servers of farm scenario')
+    parser.add_argument('--slots', type=int, default=0, help='scheduler slots, default number of CPUs')
+    parser.add_argument('--crash-rate', type=float, default=0.0)
+    parser.add_argument('--hang-rate', type=float, default=0.0)
+    parser.add_argument('--malformed-rate', type=float, default=0.0)
+    parser.add_argument('--command-timeout', type=float, default=0,
+                        help='supervise engines of pool and multiplexer scenarios with this command deadline')
+    parser.add_argument('--outbox', action='store_true', help='send through an Outbox without rate limits')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds to wait for a computer move')
+    args = parser.parse_args()
+
+    gettext.NullTranslations().install()
+    faults = args.crash_rate or args.hang_rate or args.malformed_rate
+    failed = []
+    for scenario in args.scenario or SCENARIOS:
+        results = run(scenario, args)
+        if not faults and (results.errors or results.timeouts):
+            failed.append(scenario)
+    if failed:
+        sys.exit('errors without injected faults: {}'.format(', '.join(failed)))
+
+
+if __name__ == '__main__':
+    main()
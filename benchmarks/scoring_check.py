@@ -0,0 +1,96 @@
+"""Check local area scoring against engine final_score
+
+Every game of the SGF corpus is replayed on the engine, which is asked for
+final_score and final_status_list dead. The local score of the final position,
+with the engine's dead stones removed, must give the same result. Every
+position of every game is then scored locally, in Python and with NumPy when it
+is installed, to compare results and measure positions per second.
+
+Usage: python benchmarks/scoring_check.py [--command pachi] PATH...
+"""
+import argparse
+import shlex
+import time
+from telego import scoring
+from telego.analyze import iter_sources
+from telego.board import Board
+from telego.gtp.base import GTP, ResponseType
+from telego.gtp.commands import Boardsize, ClearBoard, Komi, Play, Finalscore, FinalStatusList
+from telego.gtp.entities import Move
+from telego.sgf import parse, SGFError
+
+
+def positions(game):
+    """Board after every move of game
+
+    """
+    board = Board(game.size)
+    for color, move in game.setup:
+        board.play(color, move)
+    boards = [board.copy()]
+    for color, move in game.moves:
+        if move == Move.PASS:
+            board.pass_turn()
+        else:
+            board.play(color, move)
+        boards.append(board.copy())
+    return boards
+
+
+def engine_score(gtp, game):
+    commands = [Boardsize(game.size), ClearBoard(), Komi(game.komi)]
+    commands.extend(Play(color, move) for color, move in game.setup + game.moves)
+    responses = gtp.pipeline(commands + [Finalscore(), FinalStatusList('dead')])
+    errors = [response.content for response in responses[:-1] if response.type == ResponseType.ERROR]
+    if errors:
+        raise ValueError(errors[0])
+    dead = responses[-1]
+    return responses[-2].content, scoring.parse_vertices(dead.content) if dead.type == ResponseType.SUCCESS else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare local scoring with engine final_score')
+    parser.add_argument('paths', nargs='+', help='SGF files or directories of finished games')
+    parser.add_argument('--command', default='pachi', help='engine command')
+    args = parser.parse_args()
+
+    games = []
+    for name, text in iter_sources(args.paths):
+        try:
+            games.extend(parse(text))
+        except SGFError as e:
+            print('{}: skipped: {}'.format(name, e))
+    agree = disagree = 0
+    with GTP(shlex.split(args.command)) as gtp:
+        for index, game in enumerate(games):
+            try:
+                expected, dead = engine_score(gtp, game)
+            except ValueError as e:
+                print('game {}: engine failed: {}'.format(index, e))
+                continue
+            local = scoring.area_score(positions(game)[-1], game.komi, dead)
+            if str(local) == expected:
+                agree += 1
+            else:
+                disagree += 1
+                print('game {}: engine {} local {!r}'.format(index, expected, local))
+    print('final positions: {} agree, {} disagree with engine'.format(agree, disagree))
+
+    boards = [board for game in games for board in positions(game)]
+    started = time.perf_counter()
+    python_scores = scoring.score_batch(boards, use_numpy=False)
+    elapsed = time.perf_counter() - started
+    print('python: {} positions in {:.3f}s, {:.0f} positions/s'.format(len(boards), elapsed, len(boards) / elapsed))
+    if scoring.numpy is None:
+        print('numpy: not installed')
+        return
+    started = time.perf_counter()
+    numpy_scores = scoring.score_batch(boards, use_numpy=True)
+    elapsed = time.perf_counter() - started
+    mismatches = sum(1 for a, b in zip(python_scores, numpy_scores) if (a.black, a.white) != (b.black, b.white))
+    print('numpy: {} positions in {:.3f}s, {:.0f} positions/s, {} mismatches with python'.format(
+        len(boards), elapsed, len(boards) / elapsed, mismatches))
+
+
+if __name__ == '__main__':
+    main()
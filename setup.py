@@ -11,7 +11,6 @@ with open('telego/__init__.py', 'r') as f:
         version = '0.0.1'
 
 REQUIRES = [
-    'gomill',
     'python-telegram-bot',
     'Babel',
     'python-dotenv'
@@ -26,6 +25,10 @@ setup(
     maintainer_email='gy.chen@gms.nutc.edu.tw',
     url='https://github.com/gy-chen/telego',
     install_requires=REQUIRES,
+    extras_require={
+        'benchmark': ['gomill'],
+        'scoring': ['numpy'],
+    },
     packages=find_packages(),
     cmdclass={
         'compile_catalog': babel.compile_catalog,
@@ -36,6 +39,9 @@ setup(
     entry_points={
         'console_scripts': [
             'telego=telego.telegram:main',
+            'telego-gtp-server=telego.gtp.server:main',
+            'telego-analyze=telego.analyze:main',
+            'telego-selfplay=telego.selfplay:main',
         ],
     },
     package_data={
@@ -0,0 +1,302 @@
+"""Batch analysis of SGF game records
+
+Games read from SGF files, or from stdin, are replayed on a pool of engine
+processes, one engine per worker process. In score mode every game is scored with
+final_score, and locally by area with the engine's dead stones. Local mode scores
+by area without an engine. In genmove mode the engine's move is asked at every position, games
+are cut into chunks of positions so that a long game is shared by several workers.
+
+Results are appended to the output as JSON lines as soon as they are ready. A
+rerun with the same output skips games already written, so an interrupted run
+can be resumed.
+
+Usage: telego-analyze [--mode score|local|genmove] [--command pachi] [--output results.jsonl] PATH...
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import queue
+import shlex
+import sys
+import time
+from . import scoring, sgf
+from .board import Board
+from .gtp.base import GTP, GTPConnectionBrokenException, ResponseType
+from .gtp.commands import Boardsize, ClearBoard, Komi, Play, Genmove, Finalscore, FinalStatusList, Undo
+from .gtp.entities import Move
+
+__ALL__ = ['iter_tasks', 'analyze', 'main']
+
+logger = logging.getLogger(__name__)
+
+MODES = ('score', 'local', 'genmove')
+
+_engine = None
+_engine_command = None
+
+
+def iter_sources(paths):
+    """Read SGF sources
+
+    :param paths: files, directories searched for *.sgf, or - for stdin
+    :return: generator of (name, text)
+    """
+    for path in paths:
+        if path == '-':
+            yield '<stdin>', sys.stdin.read()
+        elif os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith('.sgf'):
+                        yield from _read(os.path.join(root, name))
+        else:
+            yield from _read(path)
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf8', errors='replace') as f:
+            yield path, f.read()
+    except OSError as e:
+        logger.warning('_read: {}: {}'.format(path, e))
+
+
+def iter_tasks(sources, mode='score', chunk_size=20, max_moves=None):
+    """Cut games into tasks
+
+    :param sources: iterable of (name, text)
+    :param mode: score, local or genmove
+    :param chunk_size: positions per genmove task
+    :param max_moves: analyze positions up to this move number, None for all
+    :return: generator of task dicts, or error records of unreadable sources
+    """
+    for name, text in sources:
+        try:
+            games = sgf.parse(text)
+        except (sgf.SGFError, ValueError) as e:
+            yield {'key': name, 'file': name, 'error': 'Invalid SGF: {}'.format(e)}
+            continue
+        for index, game in enumerate(games):
+            task = {
+                'file': name,
+                'game': index,
+                'size': game.size,
+                'komi': game.komi,
+                'result': game.result,
+                'setup': [(color, move.value) for color, move in game.setup],
+                'moves': [(color, move.value) for color, move in game.moves],
+            }
+            if mode in ('score', 'local'):
+                yield dict(task, key='{}#{}'.format(name, index), mode=mode)
+                continue
+            end = len(game.moves) if max_moves is None else min(len(game.moves), max_moves)
+            for start in range(0, end, chunk_size):
+                yield dict(task, key='{}#{}@{}'.format(name, index, start), mode=mode, start=start,
+                           end=min(start + chunk_size, end))
+
+
+def _init_worker(command):
+    global _engine_command
+    _engine_command = command
+    multiprocessing.util.Finalize(None, _close_engine, exitpriority=10)
+
+
+def _close_engine():
+    if _engine is not None and _engine.is_alive():
+        _engine.close()
+
+
+def _get_engine():
+    global _engine
+    if _engine is None or not _engine.is_alive():
+        _engine = GTP(_engine_command)
+        _engine.open()
+    return _engine
+
+
+def _check(responses):
+    for response in responses:
+        if response.type == ResponseType.ERROR:
+            raise AnalyzeError(response.content)
+
+
+def _final_board(task):
+    board = Board(task['size'])
+    for color, move in task['setup'] + task['moves']:
+        if Move(move) == Move.PASS:
+            board.pass_turn()
+        else:
+            board.play(color, move)
+    return board
+
+
+def run_task(task):
+    """Analyze task in a worker process
+
+    :return: result record
+    """
+    record = {'key': task['key'], 'file': task['file'], 'game': task['game']}
+    started = time.perf_counter()
+    try:
+        if task['mode'] == 'local':
+            score = scoring.area_score(_final_board(task), task['komi'])
+            record.update(moves=len(task['moves']), local_score=str(score), result=task['result'], positions=1)
+            record['seconds'] = round(time.perf_counter() - started, 3)
+            return record
+        gtp = _get_engine()
+        moves = task['moves'] if task['mode'] == 'score' else task['moves'][:task['start']]
+        commands = [Boardsize(task['size']), ClearBoard(), Komi(task['komi'])]
+        commands.extend(Play(color, move) for color, move in task['setup'] + moves)
+        _check(gtp.pipeline(commands))
+        if task['mode'] == 'score':
+            response, dead = gtp.pipeline([Finalscore(), FinalStatusList('dead')])
+            _check([response])
+            dead = scoring.parse_vertices(dead.content) if dead.type == ResponseType.SUCCESS else []
+            local = scoring.area_score(_final_board(task), task['komi'], dead)
+            record.update(moves=len(moves), score=response.content, local_score=str(local), result=task['result'],
+                          positions=1)
+        else:
+            positions = []
+            for number in range(task['start'], task['end']):
+                color, played = task['moves'][number]
+                genmove = gtp.pipeline([Genmove(color)])[0]
+                _check([genmove])
+                # a resigning engine places no stone, so there is nothing to undo
+                commands = [Play(color, played)]
+                if Move(genmove.content) != Move.RESIGN:
+                    commands.insert(0, Undo())
+                _check(gtp.pipeline(commands))
+                positions.append({'move': number + 1, 'color': color, 'played': played, 'engine': genmove.content})
+            record.update(positions=len(positions), analysis=positions)
+    except (AnalyzeError, GTPConnectionBrokenException, OSError, ValueError) as e:
+        record.update(error=str(e) or type(e).__name__)
+    record['seconds'] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def load_done(path):
+    """Keys of successful results in an output file
+
+    """
+    done = set()
+    try:
+        with open(path, encoding='utf8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if 'error' not in record:
+                    done.add(record['key'])
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def analyze(tasks, command, output, processes=None, done=(), report_interval=10, report=None):
+    """Run tasks on a process pool and write results as they finish
+
+    :param tasks: iterable of tasks from iter_tasks()
+    :param command: engine command
+    :param output: writable text file
+    :param processes: worker processes, default number of CPUs
+    :param done: keys to skip
+    :param report_interval: seconds between progress reports
+    :param report: file progress is written to, default stderr
+    :return: dict of totals
+    """
+    processes = processes or os.cpu_count() or 1
+    report = report or sys.stderr
+    results = queue.Queue()
+    totals = {'tasks': 0, 'skipped': 0, 'errors': 0, 'positions': 0}
+    started = last_report = time.perf_counter()
+
+    def write(record):
+        output.write(json.dumps(record, ensure_ascii=False) + '\n')
+        output.flush()
+        totals['tasks'] += 1
+        totals['positions'] += record.get('positions', 0)
+        if 'error' in record:
+            totals['errors'] += 1
+
+    def drain(block):
+        nonlocal last_report
+        record = results.get(block)
+        write(record)
+        now = time.perf_counter()
+        if now - last_report >= report_interval:
+            last_report = now
+            _report(report, totals, now - started)
+
+    pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(command,))
+    try:
+        pending = 0
+        for task in tasks:
+            if task['key'] in done:
+                totals['skipped'] += 1
+                continue
+            if 'error' in task:
+                write(task)
+                continue
+            while pending >= processes * 2:
+                drain(True)
+                pending -= 1
+            pool.apply_async(run_task, (task,), callback=results.put,
+                             error_callback=lambda e, task=task: results.put(
+                                 {'key': task['key'], 'file': task['file'], 'error': str(e)}))
+            pending += 1
+        while pending:
+            drain(True)
+            pending -= 1
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    totals['seconds'] = time.perf_counter() - started
+    _report(report, totals, totals['seconds'])
+    return totals
+
+
+def _report(report, totals, elapsed):
+    report.write('{} tasks ({} errors, {} skipped), {} positions in {:.1f}s: {:.2f} tasks/s, {:.2f} positions/s\n'
+                 .format(totals['tasks'], totals['errors'], totals['skipped'], totals['positions'], elapsed,
+                         totals['tasks'] / elapsed if elapsed else 0.0,
+                         totals['positions'] / elapsed if elapsed else 0.0))
+    report.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score or analyze SGF games with a GTP engine')
+    parser.add_argument('paths', nargs='+', help='SGF files, directories, or - for stdin')
+    parser.add_argument('--mode', choices=MODES, default='score')
+    parser.add_argument('--command', default='pachi', help='engine command')
+    parser.add_argument('--output', default='-', help='JSON lines file, results already in it are skipped')
+    parser.add_argument('--processes', type=int, default=0, help='engine processes, default number of CPUs')
+    parser.add_argument('--chunk-size', type=int, default=20, help='positions per genmove task')
+    parser.add_argument('--max-moves', type=int, default=None, help='analyze positions up to this move')
+    parser.add_argument('--report-interval', type=float, default=10, help='seconds between progress reports')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    tasks = iter_tasks(iter_sources(args.paths), mode=args.mode, chunk_size=args.chunk_size, max_moves=args.max_moves)
+    if args.output == '-':
+        analyze(tasks, shlex.split(args.command), sys.stdout, args.processes, report_interval=args.report_interval)
+        return
+    done = load_done(args.output)
+    with open(args.output, 'a', encoding='utf8') as output:
+        analyze(tasks, shlex.split(args.command), output, args.processes, done=done,
+                report_interval=args.report_interval)
+
+
+class AnalyzeError(Exception):
+    pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,399 @@
-import string
-import gomill.ascii_boards
-import gomill.boards
-from .gtp.entities import Move, StoneColor
+"""Go board
+
+Board keeps stones in flat arrays indexed by row * size + col, with precomputed
+neighbor tables. Groups and their pseudo-liberties are updated incrementally on
+every play, so captures never need a flood fill.
+"""
+import random
+from enum import Enum, auto
+from .gtp.entities import Move, StoneColor, COLUMN_LETTERS, MAX_BOARD_SIZE
+
+__ALL__ = ['Board', 'IllegalMoveReason', 'EMPTY', 'BLACK', 'WHITE']
+
+EMPTY = 0
+BLACK = 1
+WHITE = 2
+
+_color_codes = {StoneColor.BLACK: BLACK, StoneColor.WHITE: WHITE}
+_point_strings = {EMPTY: ' .', BLACK: ' #', WHITE: ' o'}
+_neighbor_tables = {}
+_zobrist_tables = {}
+
+
+def _neighbor_table(size):
+    table = _neighbor_tables.get(size)
+    if table is None:
+        table = []
+        for row in range(size):
+            for col in range(size):
+                neighbors = []
+                if row > 0:
+                    neighbors.append((row - 1) * size + col)
+                if row < size - 1:
+                    neighbors.append((row + 1) * size + col)
+                if col > 0:
+                    neighbors.append(row * size + col - 1)
+                if col < size - 1:
+                    neighbors.append(row * size + col + 1)
+                table.append(tuple(neighbors))
+        table = _neighbor_tables[size] = tuple(table)
+    return table
+
+
+def _zobrist_table(size):
+    table = _zobrist_tables.get(size)
+    if table is None:
+        rng = random.Random(size)
+        table = _zobrist_tables[size] = tuple(
+            (0, rng.getrandbits(64), rng.getrandbits(64)) for _ in range(size * size))
+    return table
+
+
+def render_colors(size, colors):
+    """Render stones of a board in ascii, # is black and o is white
+
+    :param colors: stone of every point in flat order
+    :return: string without final newline
+    """
+    if size > 9:
+        rowstart = '{:2d} '
+        padding = ' '
+    else:
+        rowstart = '{:d} '
+        padding = ''
+    lines = [rowstart.format(row + 1) + ' '.join(_point_strings[colors[row * size + col]] for col in range(size))
+             for row in range(size - 1, -1, -1)]
+    lines.append(padding + '   ' + '  '.join(COLUMN_LETTERS[:size]))
+    return '\n'.join(lines)
 
 
 class Board:
-    """Display board using ascii letters
+    """Go board with incremental group tracking
 
+    Stones are grouped by a union-find whose roots are stored directly for every
+    stone; merging relabels the smaller group. Each group root holds the number of
+    pseudo-liberties of the group, which is zero exactly when the group has no
+    liberty. Positions are hashed with Zobrist hashing for superko detection.
     """
 
+    __slots__ = ('_size', '_neighbors', '_zobrist', '_colors', '_group', '_next', '_group_size', '_liberties', '_hash',
+                 '_ko', '_ko_color', '_seen')
+
     def __init__(self, size):
-        self._board = gomill.boards.Board(size)
+        size = int(size)
+        if not 1 <= size <= MAX_BOARD_SIZE:
+            raise ValueError('Board size must be between 1 and {}'.format(MAX_BOARD_SIZE))
+        points = size * size
+        self._size = size
+        self._neighbors = _neighbor_table(size)
+        self._zobrist = _zobrist_table(size)
+        self._colors = [EMPTY] * points
+        self._group = list(range(points))
+        self._next = list(range(points))
+        self._group_size = [0] * points
+        self._liberties = [0] * points
+        self._hash = 0
+        self._ko = None
+        self._ko_color = EMPTY
+        self._seen = {0}
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def hash(self):
+        """Zobrist hash of stones on board
+
+        """
+        return self._hash
+
+    @property
+    def ko(self):
+        """Point forbidden by simple ko
+
+        :return: (row, col) or None
+        """
+        if self._ko is None:
+            return None
+        return divmod(self._ko, self._size)
+
+    @property
+    def ko_color(self):
+        """Color that may not play at ko point, BLACK or WHITE
+
+        """
+        return self._ko_color
+
+    @classmethod
+    def from_position(cls, size, colors, ko=None, ko_color=EMPTY, seen=()):
+        """Build board holding a position
+
+        Groups are found by flood fill, stones are not played, so nothing is captured.
+
+        :param colors: stone of every point in flat order, e.g. colors of another board
+        :param ko: point forbidden by simple ko as (row, col), or None
+        :param ko_color: color that may not play at ko point
+        :param seen: hashes of earlier positions, for superko
+        :return: Board
+        """
+        board = cls(size)
+        neighbors = board._neighbors
+        board._colors = list(colors)
+        for point, color in enumerate(board._colors):
+            if color != EMPTY:
+                board._hash ^= board._zobrist[point][color]
+        seen_points = bytearray(size * size)
+        for root, color in enumerate(board._colors):
+            if color == EMPTY or seen_points[root]:
+                continue
+            stones = [root]
+            seen_points[root] = 1
+            for stone in stones:
+                for neighbor in neighbors[stone]:
+                    neighbor_color = board._colors[neighbor]
+                    if neighbor_color == EMPTY:
+                        board._liberties[root] += 1
+                    elif neighbor_color == color and not seen_points[neighbor]:
+                        seen_points[neighbor] = 1
+                        stones.append(neighbor)
+            for index, stone in enumerate(stones):
+                board._group[stone] = root
+                board._next[stone] = stones[(index + 1) % len(stones)]
+            board._group_size[root] = len(stones)
+        if ko is not None:
+            board._ko = ko[0] * size + ko[1]
+            board._ko_color = ko_color
+        board._seen = set(seen) | {board._hash}
+        return board
+
+    @property
+    def colors(self):
+        """Stone of every point in flat order, EMPTY, BLACK or WHITE
+
+        :return: tuple indexed by row * size + col
+        """
+        return tuple(self._colors)
+
+    def get(self, row, col):
+        """Get stone color at point
+
+        :return: 'b', 'w' or None if point is empty
+        """
+        color = self._colors[row * self._size + col]
+        if color == EMPTY:
+            return None
+        return 'b' if color == BLACK else 'w'
+
+    def is_empty(self):
+        return not any(self._colors)
 
     def play(self, color, move):
-        color = StoneColor(color)
-        move = Move(move)
-        self._board.play(move.row_index, move.col_index, color.value)
+        """Place stone and perform captures
+
+        Self-captures are allowed and no ko rule is enforced, use check() for
+        legality.
+
+        :param color: StoneColor
+        :param move: Move
+        :return: point forbidden by simple ko as (row, col), or None
+        """
+        self.play_point(_color_codes[StoneColor(color)], self._point(move))
+        return self.ko
+
+    def pass_turn(self):
+        """Pass, which lifts the simple ko ban
+
+        """
+        self._ko = None
+
+    def check(self, color, move, superko=False):
+        """Check whether move is legal
+
+        :param color: StoneColor
+        :param move: Move
+        :param superko: also forbid repeating any earlier position
+        :return: IllegalMoveReason, or None if move is legal
+        """
+        return self.check_point(_color_codes[StoneColor(color)], self._point(move), superko=superko)
+
+    def play_point(self, color, point):
+        """Place stone at flat index
+
+        :param color: BLACK or WHITE
+        :param point: row * size + col
+        :return: number of captured opponent stones
+        """
+        colors = self._colors
+        if colors[point] != EMPTY:
+            raise ValueError('Point is not empty')
+        neighbors = self._neighbors
+        group = self._group
+        liberties = self._liberties
+        opponent = BLACK + WHITE - color
+
+        colors[point] = color
+        group[point] = point
+        self._next[point] = point
+        self._group_size[point] = 1
+        liberties[point] = 0
+        self._hash ^= self._zobrist[point][color]
+        for neighbor in neighbors[point]:
+            if colors[neighbor] == EMPTY:
+                liberties[point] += 1
+            else:
+                liberties[group[neighbor]] -= 1
+
+        captured = 0
+        captured_point = None
+        for neighbor in neighbors[point]:
+            neighbor_color = colors[neighbor]
+            if neighbor_color == color:
+                self._merge(group[point], group[neighbor])
+            elif neighbor_color == opponent and liberties[group[neighbor]] == 0:
+                captured_point = neighbor
+                captured += self._remove(group[neighbor])
+
+        root = group[point]
+        if liberties[root] == 0:
+            self._remove(root)
+            self._ko = None
+        elif captured == 1 and self._group_size[root] == 1 and liberties[root] == 1:
+            self._ko = captured_point
+            self._ko_color = opponent
+        else:
+            self._ko = None
+        self._seen.add(self._hash)
+        return captured
+
+    def check_point(self, color, point, superko=False):
+        """Check whether playing at flat index is legal
+
+        :return: IllegalMoveReason, or None if move is legal
+        """
+        colors = self._colors
+        if colors[point] != EMPTY:
+            return IllegalMoveReason.OCCUPIED
+        if point == self._ko and color == self._ko_color:
+            return IllegalMoveReason.KO
+        group = self._group
+        opponent = BLACK + WHITE - color
+        has_liberty = False
+        captured = set()
+        for neighbor in self._neighbors[point]:
+            neighbor_color = colors[neighbor]
+            if neighbor_color == EMPTY:
+                has_liberty = True
+            elif neighbor_color == color:
+                if self._liberties[group[neighbor]] > self._adjacency(group[neighbor], point):
+                    has_liberty = True
+            elif neighbor_color == opponent:
+                root = group[neighbor]
+                if root not in captured and self._liberties[root] == self._adjacency(root, point):
+                    captured.add(root)
+        if not has_liberty and not captured:
+            return IllegalMoveReason.SUICIDE
+        if superko and self._hash_after(color, point, captured) in self._seen:
+            return IllegalMoveReason.SUPERKO
+        return None
+
+    def copy(self):
+        """Copy board
+
+        :return: independent Board in the same position
+        """
+        board = Board.__new__(Board)
+        board._size = self._size
+        board._neighbors = self._neighbors
+        board._zobrist = self._zobrist
+        board._colors = self._colors[:]
+        board._group = self._group[:]
+        board._next = self._next[:]
+        board._group_size = self._group_size[:]
+        board._liberties = self._liberties[:]
+        board._hash = self._hash
+        board._ko = self._ko
+        board._ko_color = self._ko_color
+        board._seen = set(self._seen)
+        return board
+
+    def liberties(self, row, col):
+        """Count liberties of group at point
+
+        :return: number of distinct empty points next to the group, 0 if point is empty
+        """
+        point = row * self._size + col
+        if self._colors[point] == EMPTY:
+            return 0
+        return len({neighbor for stone in self._stones(self._group[point])
+                    for neighbor in self._neighbors[stone] if self._colors[neighbor] == EMPTY})
 
     def render(self):
-        return gomill.ascii_boards.render_board(self._board)
+        """Render board in ascii, # is black and o is white
+
+        :return: string without final newline
+        """
+        return render_colors(self._size, self._colors)
+
+    def _point(self, move):
+        move = Move(move)
+        if move == Move.PASS or move == Move.RESIGN or not move.is_valid(self._size):
+            raise ValueError('Move is not a point on board: {}'.format(move))
+        return move.index(self._size)
+
+    def _stones(self, root):
+        point = root
+        while True:
+            yield point
+            point = self._next[point]
+            if point == root:
+                return
+
+    def _adjacency(self, root, point):
+        group = self._group
+        return sum(1 for neighbor in self._neighbors[point]
+                   if self._colors[neighbor] != EMPTY and group[neighbor] == root)
+
+    def _merge(self, root, other):
+        if root == other:
+            return
+        if self._group_size[root] < self._group_size[other]:
+            root, other = other, root
+        group = self._group
+        for stone in self._stones(other):
+            group[stone] = root
+        self._next[root], self._next[other] = self._next[other], self._next[root]
+        self._group_size[root] += self._group_size[other]
+        self._liberties[root] += self._liberties[other]
+
+    def _remove(self, root):
+        colors = self._colors
+        group = self._group
+        zobrist = self._zobrist
+        stones = list(self._stones(root))
+        for stone in stones:
+            self._hash ^= zobrist[stone][colors[stone]]
+            colors[stone] = EMPTY
+        for stone in stones:
+            group[stone] = stone
+            self._next[stone] = stone
+            for neighbor in self._neighbors[stone]:
+                if colors[neighbor] != EMPTY:
+                    self._liberties[group[neighbor]] += 1
+        return len(stones)
+
+    def _hash_after(self, color, point, captured):
+        zobrist = self._zobrist
+        value = self._hash ^ zobrist[point][color]
+        opponent = BLACK + WHITE - color
+        for root in captured:
+            for stone in self._stones(root):
+                value ^= zobrist[stone][opponent]
+        return value
+
+
+class IllegalMoveReason(Enum):
+    OCCUPIED = auto()
+    SUICIDE = auto()
+    KO = auto()
+    SUPERKO = auto()
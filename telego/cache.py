@@ -0,0 +1,55 @@
+"""Least recently used cache
+
+"""
+import collections
+import threading
+
+__ALL__ = ['LRUCache']
+
+
+class LRUCache:
+    """Thread-safe mapping that keeps the most recently used items
+
+    """
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('Capacity must be positive')
+        self._capacity = capacity
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self._capacity:
+                self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
@@ -0,0 +1,133 @@
+"""Compact state of dormant games
+
+A live Game holds a Board of several lists per point, a PositionHistory and a
+context dict. An idle game needs none of them until it is played again.
+CompactGame keeps the stones packed at 2 bits per point, the moves as flat point
+indexes in a byte string, and the other fields of the game in slots. The board,
+the history and the superko hashes are rebuilt from it when the game resumes.
+"""
+from .board import EMPTY
+from .gtp.entities import Move
+
+__ALL__ = ['CompactGame', 'pack_colors', 'unpack_colors', 'pack_moves', 'unpack_moves']
+
+
+def pack_colors(colors):
+    """Pack stones at 2 bits per point, four points per byte
+
+    :param colors: EMPTY, BLACK or WHITE of every point in flat order
+    :return: bytes
+    """
+    packed = bytearray((len(colors) + 3) // 4)
+    for point, color in enumerate(colors):
+        if color != EMPTY:
+            packed[point >> 2] |= color << ((point & 3) << 1)
+    return bytes(packed)
+
+
+def unpack_colors(packed, points):
+    """Unpack stones packed by pack_colors()
+
+    :param points: number of points on board
+    :return: tuple of EMPTY, BLACK or WHITE
+    """
+    return tuple((packed[point >> 2] >> ((point & 3) << 1)) & 3 for point in range(points))
+
+
+def _move_width(size):
+    # point indexes plus a code for pass and one for resign
+    return 1 if size * size + 2 <= 256 else 2
+
+
+def pack_moves(moves, size):
+    """Pack moves as flat point indexes, one byte per move up to 15x15, two bytes above
+
+    Pass is packed as size * size and resign as size * size + 1.
+
+    :param moves: Move list
+    :param size: board size
+    :return: bytes
+    """
+    points = size * size
+    codes = []
+    for move in moves:
+        move = Move(move)
+        if move == Move.PASS:
+            codes.append(points)
+        elif move == Move.RESIGN:
+            codes.append(points + 1)
+        else:
+            codes.append(move.index(size))
+    if _move_width(size) == 1:
+        return bytes(codes)
+    return b''.join(code.to_bytes(2, 'little') for code in codes)
+
+
+def unpack_moves(packed, size):
+    """Unpack moves packed by pack_moves()
+
+    :return: list of Move
+    """
+    points = size * size
+    width = _move_width(size)
+    moves = []
+    for offset in range(0, len(packed), width):
+        code = int.from_bytes(packed[offset:offset + width], 'little')
+        if code == points:
+            moves.append(Move.PASS)
+        elif code == points + 1:
+            moves.append(Move.RESIGN)
+        else:
+            moves.append(Move.from_point(*divmod(code, size)))
+    return moves
+
+
+class CompactGame:
+    """State of a game that is not being played
+
+    Made by Game.compact() and turned back into a game by Game.from_compact().
+    """
+
+    __slots__ = ('player_color', 'board_size', 'komi', 'superko', 'state', 'turn', 'passes', 'final_score', 'ko',
+                 'ko_color', 'stones', 'packed_moves')
+
+    def __init__(self, player_color, board_size, komi, superko, state, turn, passes, final_score, ko, ko_color,
+                 stones, packed_moves):
+        """
+        :param player_color: player's StoneColor
+        :param state: GameState
+        :param turn: GameTurn
+        :param passes: pass flags, bit 0 for black and bit 1 for white
+        :param ko: flat index of simple ko point, -1 if there is none
+        :param stones: board packed by pack_colors()
+        :param packed_moves: moves packed by pack_moves()
+        """
+        self.player_color = player_color
+        self.board_size = board_size
+        self.komi = komi
+        self.superko = superko
+        self.state = state
+        self.turn = turn
+        self.passes = passes
+        self.final_score = final_score
+        self.ko = ko
+        self.ko_color = ko_color
+        self.stones = stones
+        self.packed_moves = packed_moves
+
+    @property
+    def colors(self):
+        """Stone of every point in flat order
+
+        """
+        return unpack_colors(self.stones, self.board_size * self.board_size)
+
+    @property
+    def moves(self):
+        return unpack_moves(self.packed_moves, self.board_size)
+
+    def __len__(self):
+        """Number of moves played
+
+        """
+        return len(self.packed_moves) // _move_width(self.board_size)
@@ -1,41 +1,145 @@
-import contextlib
 import logging
 from enum import Enum, auto
 from .gtp.base import ResponseType
-from .gtp.commands import Genmove, Play, Finalscore, Komi
+from .gtp.commands import Boardsize, ClearBoard, Genmove, Play, Finalscore, Komi, TimeSettings, Undo
 from .gtp.entities import Move, StoneColor
-from .board import Board
+from .board import Board, IllegalMoveReason
+from .compact import CompactGame, pack_colors, pack_moves
+from .history import PositionHistory
+from .scoring import area_score
+from . import metrics
 
-__ALL__ = ['Game', 'GameState', 'GameTurn', 'GameTurnError', 'GameEngineError', 'GameMoveInvalidError']
+__ALL__ = ['Game', 'AsyncGame', 'GameState', 'GameTurn', 'GameTurnError', 'GameEngineError', 'GameMoveInvalidError',
+           'GameMoveIllegalError', 'GameUndoError', 'IllegalMoveReason']
 
 logger = logging.getLogger(__name__)
 
+PLAY_SECONDS = metrics.histogram('telego_game_play_seconds', 'Time of player and computer plays', ('side',))
+_player_play_seconds = PLAY_SECONDS.labels('player')
+_computer_play_seconds = PLAY_SECONDS.labels('computer')
 
-class Game(contextlib.AbstractContextManager):
+
+class Game:
     """Manage state of go game that play with computer
 
     """
 
-    def __init__(self, player_color, gtp, board_size=9, komi=5.5):
+    __slots__ = ('_player_color', '_gtp', '_board_size', '_komi', '_superko', '_time_control', '_move_cache',
+                 '_cache_hit', '_move_time', '_context', '_state')
+
+    def __init__(self, player_color, gtp, board_size=9, komi=5.5, superko=False, time_control=None,
+                 move_cache=None):
+        """
+        :param player_color: player's stone color
+        :param gtp: GTP connection of computer
+        :param board_size: board size
+        :param komi: komi
+        :param superko: reject player moves that repeat an earlier position
+        :param time_control: AdaptiveTimeControl that sets engine time per move, None to keep engine default
+        :param move_cache: MoveCache that answers computer moves in known positions
+        """
         self._player_color = StoneColor(player_color)
         self._gtp = gtp
         self._board_size = board_size
         self._komi = komi
+        self._superko = superko
+        self._time_control = time_control
+        self._move_cache = move_cache
+        self._cache_hit = False
+        self._move_time = None
         self._context = None
         self._state = None
 
     def setup(self):
         self._gtp.open()
-        self._gtp.send_command(Komi(self._komi))
-        response = self._gtp.recv_response()
-        if response.type == ResponseType.ERROR:
-            raise GameEngineError(response.content)
-        self._context = self._startup_context()
-        self._state = GameState.ACTIVE
+        self._run(self._setup())
+
+    def resume(self):
+        """Open engine of a game made by from_compact() and send it the position
+
+        Play commands of every move are pipelined, so the position costs one round trip.
+        """
+        self._gtp.open()
+        self._run(self._resume())
 
     def close(self):
         self._gtp.close()
 
+    def compact(self):
+        """Pack state of game, e.g. to keep an idle game after its engine is closed
+
+        :return: CompactGame
+        """
+        board = self.board
+        ko = board.ko
+        passes = self._context['pass']
+        return CompactGame(self._player_color, self._board_size, self._komi, self._superko, self._state,
+                           self._context['turn'],
+                           int(passes[StoneColor.BLACK]) | int(passes[StoneColor.WHITE]) << 1,
+                           self._context['final_score'],
+                           -1 if ko is None else ko[0] * self._board_size + ko[1], board.ko_color,
+                           pack_colors(board.colors), pack_moves(self.moves, self._board_size))
+
+    @classmethod
+    def from_compact(cls, compact, gtp, time_control=None, move_cache=None):
+        """Rebuild game from CompactGame
+
+        The board is unpacked, position history is replayed when it is first needed.
+        Engine does not hold the position until resume() is called.
+
+        :param compact: CompactGame
+        :param gtp: GTP connection of computer, not opened yet
+        :return: game
+        """
+        game = cls(compact.player_color, gtp, board_size=compact.board_size, komi=compact.komi,
+                   superko=compact.superko, time_control=time_control, move_cache=move_cache)
+        game._state = compact.state
+        game._context = {
+            'turn': compact.turn,
+            'board': None,
+            'final_score': compact.final_score,
+            'moves': compact.moves,
+            'history': None,
+            'pass': {
+                StoneColor.BLACK: bool(compact.passes & 1),
+                StoneColor.WHITE: bool(compact.passes & 2)
+            }
+        }
+        ko = None if compact.ko < 0 else divmod(compact.ko, compact.board_size)
+        seen = game.history.hashes() if compact.superko else ()
+        game._context['board'] = Board.from_position(compact.board_size, compact.colors, ko, compact.ko_color, seen)
+        return game
+
+    def _run(self, steps):
+        """Drive game steps with GTP connection
+
+        Steps are generators that yield GTP commands and receive their responses, so
+        the game rules are shared by blocking and asyncio connections. A list of
+        commands is pipelined and answered with a list of responses.
+
+        :param steps: generator of game steps
+        :return: return value of steps
+        """
+        try:
+            command = next(steps)
+            while True:
+                if isinstance(command, list):
+                    response = self._gtp.pipeline(command)
+                else:
+                    self._gtp.send_command(command)
+                    response = self._gtp.recv_response()
+                command = steps.send(response)
+        except StopIteration as e:
+            return e.value
+
+    def _setup(self):
+        responses = yield [Boardsize(self._board_size), ClearBoard(), Komi(self._komi)]
+        for response in responses:
+            if response.type == ResponseType.ERROR:
+                raise GameEngineError(response.content)
+        self._context = self._startup_context()
+        self._state = GameState.ACTIVE
+
     def _startup_context(self):
         if self.player_color == StoneColor.BLACK:
             turn = GameTurn.PLAYER
@@ -46,6 +150,8 @@ class Game(contextlib.AbstractContextManager):
             'turn': turn,
             'board': board,
             'final_score': 0,
+            'moves': [],
+            'history': PositionHistory(self._board_size),
             'pass': {
                 StoneColor.BLACK: False,
                 StoneColor.WHITE: False
@@ -67,6 +173,60 @@ class Game(contextlib.AbstractContextManager):
     def board(self):
         return self._context['board']
 
+    @property
+    def moves(self):
+        """Moves played so far, black plays first
+
+        """
+        return self._context['moves']
+
+    @property
+    def history(self):
+        """PositionHistory of game, position n is the board after n moves
+
+        """
+        history = self._context['history']
+        if history is None:
+            history = self._context['history'] = self._replay_history()
+        return history
+
+    def _replay_history(self):
+        """Rebuild position history of a game made by from_compact()
+
+        """
+        history = PositionHistory(self._board_size)
+        board = Board(self._board_size)
+        for number, move in enumerate(self.moves):
+            color = self._color_of(number)
+            if move == Move.PASS:
+                board.pass_turn()
+            elif move != Move.RESIGN:
+                board.play(color, move)
+            history.push(board, move, color)
+        return history
+
+    @property
+    def board_size(self):
+        return self._board_size
+
+    @property
+    def komi(self):
+        return self._komi
+
+    @property
+    def move_time(self):
+        """Seconds per move engine was last told to use, None if engine default
+
+        """
+        return self._move_time
+
+    @property
+    def cache_hit(self):
+        """Whether the last computer move came from the move cache
+
+        """
+        return self._cache_hit
+
     @property
     def player_color(self):
         return self._player_color
@@ -81,47 +241,210 @@ class Game(contextlib.AbstractContextManager):
     def final_score(self):
         return self._context['final_score']
 
+    def estimate_score(self, dead=()):
+        """Score current position locally by area, without asking engine
+
+        :param dead: dead stones as moves
+        :return: Score
+        """
+        return area_score(self.board, self._komi, dead)
+
     def player_play(self, move):
+        with _player_play_seconds.time():
+            return self._run(self._player_play(move))
+
+    def replay(self, moves):
+        """Replay moves of a game from the empty board
+
+        Play commands of every move are pipelined, so rebuilding the position costs one
+        round trip.
+
+        :param moves: moves in play order, black plays first
+        :return:
+        """
+        return self._run(self._replay(moves))
+
+    def computer_play(self):
+        """Make computer play
+
+        :return: computer move
+        """
+        with _computer_play_seconds.time():
+            return self._run(self._computer_play())
+
+    def undo(self):
+        """Take back player's last move, and computer's moves after it
+
+        :return: number of moves taken back
+        """
+        return self._run(self._undo())
+
+    def check_player_move(self, move):
+        """Check player's move on local board without playing it
+
+        :raise GameEndOfGameError: game is end
+        :raise GameTurnError: it is not player's turn
+        :raise GameMoveInvalidError: move is not on board, or illegal
+        """
         if self.state == GameState.END:
             raise GameEndOfGameError()
         if not self.is_player_turn():
             raise GameTurnError()
         self._check_move(move)
-        self._gtp.send_command(Play(self._player_color, move))
-        response = self._gtp.recv_response()
+
+    def ends_game(self, move):
+        """Check whether player's move ends the game, so computer does not reply
+
+        """
+        move = Move(move)
+        if move == Move.RESIGN:
+            return True
+        if move != Move.PASS or self._player_color == StoneColor.BLACK:
+            # black's move resets pass flags
+            return False
+        return self._context['pass'][StoneColor.BLACK]
+
+    def _player_play(self, move):
+        self.check_player_move(move)
+        response = yield Play(self._player_color, move)
         logger.info('player play response: {}'.format(response.content))
         if response.type == ResponseType.ERROR:
             raise GameEngineError(response.content)
         self._place(self._player_color, move)
         if self.player_color == StoneColor.BLACK:
             self._reset_pass()
-        self._try_to_end_game(move)
+        yield from self._try_to_end_game(move)
         if self.state == GameState.ACTIVE:
             self._end_turn()
 
-    def computer_play(self):
-        """Make computer play
-
-        :return: computer move
-        """
+    def _replay(self, moves):
+        moves = [Move(move) for move in moves]
+        colors = [StoneColor.BLACK if i % 2 == 0 else StoneColor.WHITE for i in range(len(moves))]
+        responses = yield [Play(color, move) for color, move in zip(colors, moves)]
+        for color, move, response in zip(colors, moves, responses):
+            if response.type == ResponseType.ERROR:
+                raise GameEngineError(response.content)
+            if self.state == GameState.END:
+                raise GameEndOfGameError()
+            self._place(color, move)
+            if color == StoneColor.BLACK:
+                self._reset_pass()
+            yield from self._try_to_end_game(move)
+            if self.state == GameState.ACTIVE:
+                self._end_turn()
+
+    def _resume(self):
+        commands = [Boardsize(self._board_size), ClearBoard(), Komi(self._komi)]
+        commands.extend(Play(self._color_of(number), move) for number, move in enumerate(self.moves)
+                        if move != Move.RESIGN)
+        responses = yield commands
+        for response in responses:
+            if response.type == ResponseType.ERROR:
+                raise GameEngineError(response.content)
+
+    def _computer_play(self):
         if self.state == GameState.END:
             raise GameEndOfGameError()
         if not self.is_computer_turn():
             raise GameTurnError()
-        self._gtp.send_command(Genmove(self.computer_color))
-        response = self._gtp.recv_response()
-        logger.info('computer play response: {}'.format(response.content))
-        if response.type == ResponseType.ERROR:
-            raise GameEngineError(response.content)
-        move = Move(response.content)
+        cached = self._cached_move()
+        self._cache_hit = cached is not None
+        if cached is not None:
+            response = yield Play(self.computer_color, cached)
+            logger.info('computer play cached move: {}'.format(cached))
+            if response.type == ResponseType.ERROR:
+                raise GameEngineError(response.content)
+            move = cached
+        else:
+            move = yield from self._genmove()
         self._place(self.computer_color, move)
         if self.computer_color == StoneColor.BLACK:
             self._reset_pass()
-        self._try_to_end_game(move)
+        yield from self._try_to_end_game(move)
         if self.state == GameState.ACTIVE:
             self._end_turn()
         return move
 
+    def _undo(self):
+        if self.state == GameState.END:
+            raise GameEndOfGameError()
+        colors = [self._color_of(number) for number in range(len(self.moves))]
+        if self._player_color not in colors:
+            raise GameUndoError()
+        count = colors[::-1].index(self._player_color) + 1
+        responses = yield [Undo() for _ in range(count)]
+        undone = 0
+        for response in responses:
+            if response.type == ResponseType.ERROR:
+                break
+            undone += 1
+        self._truncate(len(self.moves) - undone)
+        if undone < count:
+            raise GameEngineError(responses[undone].content)
+        return undone
+
+    def _truncate(self, moves):
+        """Go back to position after number of moves
+
+        """
+        history = self.history
+        del self._context['moves'][moves:]
+        history.truncate(moves)
+        self._context['board'] = history[moves].to_board(history.hashes(moves))
+        self._reset_pass()
+        for number, move in enumerate(self.moves):
+            color = self._color_of(number)
+            if color == StoneColor.BLACK:
+                self._reset_pass()
+            if move == Move.PASS:
+                self._context['pass'][color] = True
+        if self._color_of(moves) == self._player_color:
+            self._context['turn'] = GameTurn.PLAYER
+        else:
+            self._context['turn'] = GameTurn.COMPUTER
+
+    @staticmethod
+    def _color_of(number):
+        """Color of zero-based move number, black plays first
+
+        """
+        return StoneColor.BLACK if number % 2 == 0 else StoneColor.WHITE
+
+    def _cached_move(self):
+        """Look up computer move in move cache
+
+        Cached moves that are illegal here, e.g. because of a ko, count as misses.
+
+        :return: Move, or None
+        """
+        if self._move_cache is None:
+            return None
+        move = self._move_cache.lookup(self.board, self.computer_color, self._komi, len(self.moves))
+        if move is None or not move.is_valid(self._board_size):
+            return None
+        if self.board.check(self.computer_color, move, superko=self._superko) is not None:
+            return None
+        return move
+
+    def _genmove(self):
+        genmove = Genmove(self.computer_color)
+        budget = self._time_control.budget() if self._time_control is not None else None
+        if budget is None or budget == self._move_time:
+            response = yield genmove
+        else:
+            time_settings_response, response = yield [TimeSettings(0, budget, 1), genmove]
+            if time_settings_response.type == ResponseType.ERROR:
+                logger.warning('engine rejected time settings: {}'.format(time_settings_response.content))
+            else:
+                self._move_time = budget
+        logger.info('computer play response: {}'.format(response.content))
+        if response.type == ResponseType.ERROR:
+            raise GameEngineError(response.content)
+        move = Move(response.content)
+        if self._move_cache is not None:
+            self._move_cache.record(self.board, self.computer_color, self._komi, len(self.moves), move)
+        return move
+
     def _end_turn(self):
         if self.is_computer_turn():
             self._context['turn'] = GameTurn.PLAYER
@@ -130,23 +453,34 @@ class Game(contextlib.AbstractContextManager):
 
     def _place(self, color, move):
         move = Move(move)
-        if move == Move.RESIGN or move == Move.PASS:
-            return
+        history = self.history
+        self._context['moves'].append(move)
         board = self._context['board']
-        board.play(color, move)
+        if move == Move.PASS:
+            board.pass_turn()
+        elif move != Move.RESIGN:
+            board.play(color, move)
+        history.push(board, move, StoneColor(color))
 
     def _check_move(self, move):
+        """Check player move on local board, so illegal moves never reach engine
+
+        """
         move = Move(move)
         if not move.is_valid(self._board_size):
             raise GameMoveInvalidError()
+        if move == Move.PASS or move == Move.RESIGN:
+            return
+        reason = self.board.check(self._player_color, move, superko=self._superko)
+        if reason is not None:
+            raise GameMoveIllegalError(reason)
 
     def _try_to_end_game(self, move):
         move = Move(move)
         if move == Move.PASS:
             self._set_pass(move)
             if self._is_both_pass():
-                self._gtp.send_command(Finalscore())
-                response = self._gtp.recv_response()
+                response = yield Finalscore()
                 logging.info('_try_to_end_game: game end: final_score: {}'.format(response.content))
                 if response.type == ResponseType.ERROR:
                     raise GameEngineError(response.content)
@@ -186,6 +520,68 @@ class Game(contextlib.AbstractContextManager):
         self.close()
 
 
+class AsyncGame(Game):
+    """Game that drives an asyncio GTP connection
+
+    Same as Game, but setup, close and plays are coroutines, so many games can share
+    one event loop.
+    """
+
+    __slots__ = ()
+
+    async def setup(self):
+        await self._gtp.open()
+        await self._run(self._setup())
+
+    async def resume(self):
+        await self._gtp.open()
+        await self._run(self._resume())
+
+    async def close(self):
+        await self._gtp.close()
+
+    async def player_play(self, move):
+        with _player_play_seconds.time():
+            return await self._run(self._player_play(move))
+
+    async def replay(self, moves):
+        return await self._run(self._replay(moves))
+
+    async def computer_play(self):
+        """Make computer play
+
+        :return: computer move
+        """
+        with _computer_play_seconds.time():
+            return await self._run(self._computer_play())
+
+    async def undo(self):
+        return await self._run(self._undo())
+
+    async def _run(self, steps):
+        try:
+            command = next(steps)
+            while True:
+                if isinstance(command, list):
+                    response = await self._gtp.pipeline(command)
+                else:
+                    await self._gtp.send_command(command)
+                    response = await self._gtp.recv_response()
+                command = steps.send(response)
+        except StopIteration as e:
+            return e.value
+
+    def __enter__(self):
+        raise TypeError('Use "async with" for AsyncGame')
+
+    async def __aenter__(self):
+        await self.setup()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+
 class GameState(Enum):
     ACTIVE = auto()
     END = auto()
@@ -208,10 +604,27 @@ class GameMoveInvalidError(Exception):
     pass
 
 
+class GameMoveIllegalError(GameMoveInvalidError):
+    """Move is forbidden by rules of go
+
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
 class GameEndOfGameError(Exception):
     pass
 
 
+class GameUndoError(Exception):
+    """No player move to take back
+
+    """
+    pass
+
+
 if __name__ == '__main__':
     from .gtp.base import GTP
 
@@ -0,0 +1,104 @@
+"""Go Text Protocol connection for asyncio
+
+AsyncGTP has the same interface as GTP, but every blocking call is a coroutine,
+so a single event loop can talk to many engines.
+"""
+import asyncio
+import subprocess
+from .base import Command, CommandTimer, Response, GTPConnectionBrokenException, ENGINE_SPAWNS, match_responses
+from .framing import ResponseFramer, DEFAULT_MAX_RESPONSE_SIZE, READ_SIZE, GTPResponseTooLargeException
+
+__ALL__ = ['AsyncGTP']
+
+
+class AsyncGTP:
+    """ Go Text Protocol connection driven by asyncio
+
+    """
+
+    def __init__(self, cmd, max_response_size=DEFAULT_MAX_RESPONSE_SIZE):
+        self._cmd = cmd
+        self._p = None
+        self._last_id = 0
+        self._max_response_size = max_response_size
+        self._timer = CommandTimer()
+
+    async def open(self):
+        cmd = [self._cmd] if isinstance(self._cmd, str) else list(self._cmd)
+        self._p = await asyncio.create_subprocess_exec(*cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                                       stderr=subprocess.DEVNULL)
+        self._framer = ResponseFramer(self._max_response_size)
+        ENGINE_SPAWNS.inc()
+
+    async def close(self):
+        if not self.is_alive():
+            return
+        self._p.terminate()
+        await self._p.wait()
+
+    def is_alive(self):
+        return self._p is not None and self._p.returncode is None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def recv_response(self):
+        frame = self._framer.next_frame()
+        while frame is None:
+            data = await self._p.stdout.read(READ_SIZE)
+            if not data:
+                self._timer.broken()
+                raise GTPConnectionBrokenException()
+            self._framer.feed(data)
+            frame = self._framer.next_frame()
+        self._timer.received()
+        return Response(frame)
+
+    async def send_command(self, command):
+        if not self.is_alive():
+            self._timer.broken()
+            raise GTPConnectionBrokenException()
+        if not isinstance(command, Command):
+            command = Command(command)
+        self._timer.sent((command,))
+        await self._write(bytes(command))
+
+    async def pipeline(self, commands):
+        """Send commands in one write and receive all responses
+
+        :param commands: commands to send
+        :return: list of responses, in the same order as commands
+        """
+        commands = [command if isinstance(command, Command) else Command(command) for command in commands]
+        if not commands:
+            return []
+        if not self.is_alive():
+            self._timer.broken()
+            raise GTPConnectionBrokenException()
+        ids = list(range(self._last_id + 1, self._last_id + 1 + len(commands)))
+        self._last_id = ids[-1]
+        self._timer.sent(commands)
+        await self._write(b''.join(command.to_bytes(id) for id, command in zip(ids, commands)))
+        responses = []
+        too_large = None
+        for _ in commands:
+            # read every response even after one too large, so the connection stays in step
+            try:
+                responses.append(await self.recv_response())
+            except GTPResponseTooLargeException as e:
+                too_large = e
+        if too_large is not None:
+            raise too_large
+        return match_responses(ids, responses)
+
+    async def _write(self, data):
+        self._p.stdin.write(data)
+        try:
+            await self._p.stdin.drain()
+        except ConnectionError as e:
+            self._timer.broken()
+            raise GTPConnectionBrokenException() from e
@@ -1,6 +1,16 @@
+import collections
 import contextlib
+import os
 import subprocess
+import time
 from enum import Enum, auto
+from .framing import ResponseFramer, DEFAULT_MAX_RESPONSE_SIZE, READ_SIZE, GTPResponseTooLargeException
+from .. import metrics
+
+COMMAND_SECONDS = metrics.histogram('telego_gtp_command_seconds',
+                                    'Time from sending a GTP command to receiving its response', ('command',))
+ENGINE_SPAWNS = metrics.counter('telego_gtp_engine_spawns_total', 'Engine processes started')
+ENGINE_CRASHES = metrics.counter('telego_gtp_engine_crashes_total', 'Engine connections found broken')
 
 
 class GTP(contextlib.AbstractContextManager):
@@ -8,11 +18,16 @@ class GTP(contextlib.AbstractContextManager):
 
     """
 
-    def __init__(self, cmd):
+    def __init__(self, cmd, max_response_size=DEFAULT_MAX_RESPONSE_SIZE):
         self._cmd = cmd
+        self._last_id = 0
+        self._max_response_size = max_response_size
+        self._timer = CommandTimer()
 
     def open(self):
         self._p = subprocess.Popen(self._cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self._framer = ResponseFramer(self._max_response_size)
+        ENGINE_SPAWNS.inc()
 
     def close(self):
         self._p.terminate()
@@ -27,26 +42,133 @@ class GTP(contextlib.AbstractContextManager):
     def __exit__(self, exc_type, exc_value, traceback):
         self.close()
 
-    def recv_response(self, ignore_empty=True):
-        response = Response(self._p.stdout.readline())
-        if ignore_empty and response.type == ResponseType.EMPTY:
-            return self.recv_response(ignore_empty=ignore_empty)
-        return response
+    def recv_response(self):
+        frame = self._framer.next_frame()
+        while frame is None:
+            data = self._read()
+            if not data:
+                self._timer.broken()
+                raise GTPConnectionBrokenException()
+            self._framer.feed(data)
+            frame = self._framer.next_frame()
+        self._timer.received()
+        return Response(frame)
 
     def send_command(self, command):
         if not self.is_alive():
+            self._timer.broken()
             raise GTPConnectionBrokenException()
         if not isinstance(command, Command):
             command = Command(command)
         cmd = bytes(command)
-        self._p.stdin.write(cmd)
+        self._timer.sent((command,))
+        self._write(cmd)
+
+    def pipeline(self, commands):
+        """Send commands in one write and receive all responses
+
+        Every command is tagged with a numeric id, responses are matched back to
+        commands by the id echoed by the engine.
+
+        :param commands: commands to send
+        :return: list of responses, in the same order as commands
+        """
+        commands = [command if isinstance(command, Command) else Command(command) for command in commands]
+        if not commands:
+            return []
+        if not self.is_alive():
+            self._timer.broken()
+            raise GTPConnectionBrokenException()
+        ids = self._next_ids(len(commands))
+        self._timer.sent(commands)
+        self._write(b''.join(command.to_bytes(id) for id, command in zip(ids, commands)))
+        return match_responses(ids, self._recv_responses(len(commands)))
+
+    def _recv_responses(self, count):
+        """Receive responses of pipelined commands
+
+        Responses after one that is too large are still read, so the connection stays
+        in step with the commands sent after the pipeline.
+        """
+        responses = []
+        too_large = None
+        for _ in range(count):
+            try:
+                responses.append(self.recv_response())
+            except GTPResponseTooLargeException as e:
+                too_large = e
+        if too_large is not None:
+            raise too_large
+        return responses
+
+    def _write(self, data):
+        self._p.stdin.write(data)
         self._p.stdin.flush()
 
+    def _read(self):
+        """Read available engine output
+
+        :return: bytes, empty when the engine has gone away
+        """
+        return os.read(self._p.stdout.fileno(), READ_SIZE)
+
+    def _next_ids(self, count):
+        start = self._last_id + 1
+        self._last_id = start + count - 1
+        return list(range(start, start + count))
+
+
+def match_responses(ids, responses):
+    """Order pipelined responses by command ids
+
+    Responses without id are assumed to be in command order.
+
+    :param ids: ids of sent commands
+    :param responses: received responses
+    :return: list of responses in the order of ids
+    """
+    by_id = {response.id: response for response in responses if response.id is not None}
+    if len(by_id) != len(responses):
+        return list(responses)
+    try:
+        return [by_id[id] for id in ids]
+    except KeyError as e:
+        raise GTPProtocolException('Unexpected response id: {}'.format(e))
+
+
+class CommandTimer:
+    """Measure latency of GTP commands by command name
+
+    Engines answer commands in order, so each response belongs to the oldest
+    command still waiting.
+    """
+
+    def __init__(self):
+        self._waiting = collections.deque()
+
+    def sent(self, commands):
+        if metrics.is_enabled():
+            now = time.perf_counter()
+            self._waiting.extend((command.name, now) for command in commands)
+
+    def received(self):
+        if self._waiting:
+            name, sent_at = self._waiting.popleft()
+            COMMAND_SECONDS.labels(name).observe(time.perf_counter() - sent_at)
+
+    def broken(self):
+        self._waiting.clear()
+        ENGINE_CRASHES.inc()
+
 
 class GTPConnectionBrokenException(Exception):
     pass
 
 
+class GTPProtocolException(Exception):
+    pass
+
+
 class Command:
     """GTP command
 
@@ -64,50 +186,84 @@ class Command:
     def __bytes__(self):
         return str(self).encode('utf8')
 
+    def to_bytes(self, id=None):
+        """Format command with optional numeric id
+
+        :param id: GTP command id, engine echoes it in the response
+        :return: command bytes
+        """
+        if id is None:
+            return bytes(self)
+        return "{} {}\n".format(int(id), self._command).encode('utf8')
+
+    @property
+    def name(self):
+        parts = self._command.split(maxsplit=2)
+        if len(parts) > 1 and parts[0].isdigit():
+            return parts[1]
+        return parts[0]
+
 
 class Response:
     """GTP command response
 
+    Response keeps the raw bytes of the response, content is decoded on first access.
     """
 
     def __init__(self, response):
-        response = response.decode('utf8')
-        self._response = response
+        self._response = bytes(response)
         self._type = None
+        self._id = None
+        self._body_start = 0
         self._content = None
-        self._parse(response)
+        self._parse(self._response)
 
     def _parse(self, response):
-        if '\n' in response.strip():
-            raise ValueError("Response is empty or contain mutiple responses")
-
-        if response.startswith('?'):
+        if response.startswith(b'?'):
             self._type = ResponseType.ERROR
-        elif response.startswith('='):
+        elif response.startswith(b'='):
             self._type = ResponseType.SUCCESS
         elif response.isspace():
             self._type = ResponseType.EMPTY
-            self._content = None
             return
         else:
             raise ValueError('Unknown response type')
 
-        try:
-            self._content = response.strip().split(maxsplit=1)[1]
-        except IndexError:
-            self._content = ''
+        end = 1
+        while end < len(response) and 0x30 <= response[end] <= 0x39:
+            end += 1
+        if end > 1:
+            self._id = int(response[1:end])
+        self._body_start = end
 
     @property
     def type(self):
         return self._type
 
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def body(self):
+        """Raw response body without status and id
+
+        :return: memoryview of undecoded body
+        """
+        return memoryview(self._response)[self._body_start:]
+
     @property
     def content(self):
+        if self._content is None and self._type != ResponseType.EMPTY:
+            self._content = self.body.tobytes().decode('utf8').strip()
         return self._content
 
-    def __repr__(self):
+    def __bytes__(self):
         return self._response
 
+    def __repr__(self):
+        return self._response.decode('utf8', errors='replace')
+
 
 class ResponseType(Enum):
     SUCCESS = auto()
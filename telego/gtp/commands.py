@@ -54,3 +54,65 @@ class Finalscore(Command):
 
     def __init__(self):
         self._command = "final_score"
+
+
+class Undo(Command):
+    """Command to take back the last move
+
+    """
+
+    def __init__(self):
+        self._command = "undo"
+
+
+class ClearBoard(Command):
+    """Command to clear the board
+
+    """
+
+    def __init__(self):
+        self._command = "clear_board"
+
+
+class Showboard(Command):
+    """Command to get engine's board as text
+
+    """
+
+    def __init__(self):
+        self._command = "showboard"
+
+
+class ListCommands(Command):
+    """Command to list commands known by engine
+
+    """
+
+    def __init__(self):
+        self._command = "list_commands"
+
+
+class FinalStatusList(Command):
+    """Command to list stones of given status, e.g. dead
+
+    """
+
+    def __init__(self, status):
+        status = str(status)
+        if status not in ('alive', 'dead', 'seki'):
+            raise ValueError('Unknown status: {}'.format(status))
+        self._command = "final_status_list {}".format(status)
+
+
+class TimeSettings(Command):
+    """Command to setup time control
+
+    Main time and byo yomi time are in seconds. Byo yomi of one stone with no main
+    time gives engine a fixed time for every move.
+    """
+
+    def __init__(self, main_time, byo_yomi_time, byo_yomi_stones):
+        main_time = int(main_time)
+        byo_yomi_time = int(byo_yomi_time)
+        byo_yomi_stones = int(byo_yomi_stones)
+        self._command = "time_settings {} {} {}".format(main_time, byo_yomi_time, byo_yomi_stones)
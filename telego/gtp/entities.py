@@ -1,40 +1,90 @@
-import string
 from enum import Enum
-from itertools import product
 
-__ALL__ = ['StoneColor', 'Move']
+__ALL__ = ['StoneColor', 'Move', 'COLUMN_LETTERS']
 
-board_columns = string.ascii_letters.replace('i', '')
-moves = [(''.join(move), ''.join(move)) for move in
-         product(board_columns, map(str, range(1, 20)))]
-moves.extend([('resign', 'resign'), ('RESIGN', 'resign'), ('PASS', 'pass'), ('pass', 'pass')])
-Move = Enum('Move', moves)
+COLUMN_LETTERS = 'ABCDEFGHJKLMNOPQRSTUVWXYZ'
+MAX_BOARD_SIZE = len(COLUMN_LETTERS)
 
 
-def is_valid(self, board_size):
-    if self.value == 'resign' or self.value == 'pass':
-        return True
-    move_x = board_columns.index(self.value[0].lower()) + 1
-    move_y = int(self.value[1:])
-    if move_x > board_size or move_y > board_size:
-        return False
-    return True
+class Move:
+    """Board coordinate, pass or resign
 
+    Moves are interned, so Move('c3') is Move('C3') and parsing a text seen before
+    is a dictionary lookup. Row and column are parsed once, boards up to 25x25 are
+    supported.
+    """
 
-@property
-def row_index(self):
-    return int(self.value[1]) - 1
+    __slots__ = ('value', 'row_index', 'col_index')
 
+    _canonical = {}
+    _interned = {}
 
-@property
-def col_index(self):
-    return board_columns.index(self.value[0].lower())
+    def __new__(cls, move):
+        if isinstance(move, Move):
+            return move
+        try:
+            return cls._interned[move]
+        except KeyError:
+            pass
+        except TypeError:
+            raise ValueError('Invalid move: {!r}'.format(move))
+        instance = cls._parse(move)
+        instance = cls._canonical.setdefault(instance.value, instance)
+        if move.upper() == instance.value.upper():
+            cls._interned[move] = instance
+        return instance
 
+    @classmethod
+    def _parse(cls, move):
+        if not isinstance(move, str):
+            raise ValueError('Invalid move: {!r}'.format(move))
+        lower = move.lower()
+        instance = object.__new__(cls)
+        if lower == 'pass' or lower == 'resign':
+            instance.value = lower
+            instance.row_index = None
+            instance.col_index = None
+            return instance
+        col = COLUMN_LETTERS.find(move[:1].upper())
+        row = move[1:]
+        if not move or col < 0 or not row.isdigit() or not 1 <= int(row) <= MAX_BOARD_SIZE:
+            raise ValueError('Invalid move: {!r}'.format(move))
+        row = int(row)
+        instance.value = '{}{}'.format(COLUMN_LETTERS[col], row)
+        instance.row_index = row - 1
+        instance.col_index = col
+        return instance
 
-Move.is_valid = is_valid
-Move.row_index = row_index
-Move.col_index = col_index
-Move.__str__ = lambda self: self.value
+    @classmethod
+    def from_point(cls, row, col):
+        """Get move at zero-based row and column
+
+        """
+        return cls('{}{}'.format(COLUMN_LETTERS[col], row + 1))
+
+    def is_valid(self, board_size):
+        if self.row_index is None:
+            return True
+        return self.row_index < board_size and self.col_index < board_size
+
+    def index(self, board_size):
+        """Flat index of point, row * board_size + col
+
+        """
+        return self.row_index * board_size + self.col_index
+
+    def __str__(self):
+        return self.value
+
+    def __repr__(self):
+        return '<Move {}>'.format(self.value)
+
+    def __reduce__(self):
+        return Move, (self.value,)
+
+
+Move.PASS = Move('pass')
+Move.RESIGN = Move('resign')
 
 
 class StoneColor(Enum):
@@ -0,0 +1,224 @@
+"""Stand-in GTP engine for load tests
+
+Plays random legal moves that do not fill its own eyes, after a configurable think
+time. It can also crash, hang or print malformed responses at configurable rates,
+so failure handling can be exercised without a real engine.
+
+Usage: python -m telego.gtp.fake [--think SECONDS] [--crash-rate P] [--hang-rate P] [--malformed-rate P] [--seed N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from ..board import Board, BLACK, WHITE, EMPTY
+from .entities import Move, StoneColor, COLUMN_LETTERS
+
+__ALL__ = ['FakeEngine']
+
+_COMMANDS = ('protocol_version', 'name', 'version', 'known_command', 'list_commands', 'quit', 'boardsize',
+             'clear_board', 'komi', 'play', 'genmove', 'undo', 'showboard', 'final_score', 'final_status_list',
+             'time_settings', 'kgs-time_settings')
+
+
+class FakeEngine:
+    """GTP engine that plays random legal moves
+
+    """
+
+    def __init__(self, think_time=0.0, crash_rate=0.0, malformed_rate=0.0, seed=None, hang_rate=0.0):
+        """
+        :param think_time: seconds to sleep on genmove
+        :param crash_rate: probability to exit on every command
+        :param hang_rate: probability to stop answering on every command
+        :param malformed_rate: probability to answer a command with a malformed response
+        :param seed: seed of random moves and failures
+        """
+        self._think_time = think_time
+        self._crash_rate = crash_rate
+        self._malformed_rate = malformed_rate
+        self._hang_rate = hang_rate
+        self._random = random.Random(seed)
+        self._size = 19
+        self._komi = 0.0
+        self._board = Board(self._size)
+        self._moves = []
+        self.finished = False
+
+    def handle(self, line):
+        """Answer one command line
+
+        :return: response text including the final blank line
+        """
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            return ''
+        parts = line.split()
+        id = ''
+        if parts[0].isdigit():
+            id = parts.pop(0)
+        if not parts:
+            return ''
+        if self._random.random() < self._crash_rate:
+            os._exit(1)
+        if self._hang_rate and self._random.random() < self._hang_rate:
+            while True:
+                time.sleep(60)
+        if self._random.random() < self._malformed_rate:
+            return 'garbled {}\n\n'.format(parts[0])
+        name, args = parts[0], parts[1:]
+        try:
+            result = self._run(name, args)
+        except ValueError as e:
+            return '?{} {}\n\n'.format(id, e)
+        return '={} {}\n\n'.format(id, result)
+
+    def _run(self, name, args):
+        if name == 'quit':
+            self.finished = True
+            return ''
+        if name == 'protocol_version':
+            return '2'
+        if name == 'name':
+            return 'telego-fake'
+        if name == 'version':
+            return '1'
+        if name == 'known_command':
+            return 'true' if args and args[0] in _COMMANDS else 'false'
+        if name == 'list_commands':
+            return '\n'.join(_COMMANDS)
+        if name == 'boardsize':
+            size = int(args[0])
+            self._size = size
+            self._reset()
+            return ''
+        if name == 'clear_board':
+            self._reset()
+            return ''
+        if name == 'komi':
+            self._komi = float(args[0])
+            return ''
+        if name in ('time_settings', 'kgs-time_settings'):
+            return ''
+        if name == 'play':
+            self._play(StoneColor(args[0].lower()), Move(args[1]))
+            return ''
+        if name == 'genmove':
+            time.sleep(self._think_time)
+            color = StoneColor(args[0].lower())
+            move = self._genmove(color)
+            self._play(color, move)
+            return str(move)
+        if name == 'undo':
+            if not self._moves:
+                raise ValueError('cannot undo')
+            moves = self._moves[:-1]
+            self._reset()
+            for color, move in moves:
+                self._play(color, move)
+            return ''
+        if name == 'showboard':
+            return '\n' + self._board.render()
+        if name == 'final_score':
+            return self._final_score()
+        if name == 'final_status_list':
+            return ''
+        raise ValueError('unknown command')
+
+    def _reset(self):
+        self._board = Board(self._size)
+        self._moves = []
+
+    def _play(self, color, move):
+        if move != Move.PASS and move != Move.RESIGN:
+            if not move.is_valid(self._size) or self._board.check(color, move) is not None:
+                raise ValueError('illegal move')
+            self._board.play(color, move)
+        else:
+            self._board.pass_turn()
+        self._moves.append((color, move))
+
+    def _genmove(self, color):
+        code = BLACK if color == StoneColor.BLACK else WHITE
+        size = self._size
+        candidates = [point for point in range(size * size)
+                      if self._board.check_point(code, point) is None and not self._is_eye(code, point)]
+        if not candidates:
+            return Move.PASS
+        row, col = divmod(self._random.choice(candidates), size)
+        return Move('{}{}'.format(COLUMN_LETTERS[col], row + 1))
+
+    def _is_eye(self, code, point):
+        row, col = divmod(point, self._size)
+        for r, c in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)):
+            if 0 <= r < self._size and 0 <= c < self._size and self._code(r, c) != code:
+                return False
+        return True
+
+    def _code(self, row, col):
+        color = self._board.get(row, col)
+        if color is None:
+            return EMPTY
+        return BLACK if color == 'b' else WHITE
+
+    def _final_score(self):
+        """Area score, empty regions count for a color when only that color borders them
+
+        """
+        size = self._size
+        score = {BLACK: 0, WHITE: 0}
+        seen = set()
+        for row in range(size):
+            for col in range(size):
+                code = self._code(row, col)
+                if code != EMPTY:
+                    score[code] += 1
+                    continue
+                if (row, col) in seen:
+                    continue
+                region = []
+                borders = set()
+                stack = [(row, col)]
+                seen.add((row, col))
+                while stack:
+                    r, c = stack.pop()
+                    region.append((r, c))
+                    for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                        if not (0 <= nr < size and 0 <= nc < size):
+                            continue
+                        neighbor = self._code(nr, nc)
+                        if neighbor != EMPTY:
+                            borders.add(neighbor)
+                        elif (nr, nc) not in seen:
+                            seen.add((nr, nc))
+                            stack.append((nr, nc))
+                if len(borders) == 1:
+                    score[borders.pop()] += len(region)
+        difference = score[BLACK] - score[WHITE] - self._komi
+        if difference > 0:
+            return 'B+{:g}'.format(difference)
+        if difference < 0:
+            return 'W+{:g}'.format(-difference)
+        return '0'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='GTP engine that plays random legal moves')
+    parser.add_argument('--think', type=float, default=0.0, help='seconds to think on genmove')
+    parser.add_argument('--crash-rate', type=float, default=0.0, help='probability to exit on a command')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='probability to hang on a command')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='probability of a malformed response')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    engine = FakeEngine(think_time=args.think, crash_rate=args.crash_rate, malformed_rate=args.malformed_rate,
+                        seed=args.seed, hang_rate=args.hang_rate)
+    for line in sys.stdin:
+        sys.stdout.write(engine.handle(line))
+        sys.stdout.flush()
+        if engine.finished:
+            return
+
+
+if __name__ == '__main__':
+    main()
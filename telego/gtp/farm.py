@@ -0,0 +1,278 @@
+"""Games on engines spread across hosts
+
+EngineFarm keeps a pool of RemoteGTP connections per engine server. A game is
+placed on a host by consistent hashing of its key, so adding or removing a host
+only moves the games of that host. When a host goes away, FarmGTP moves its game
+to the next host on the ring by replaying the game's PositionLog there.
+"""
+import bisect
+import contextlib
+import functools
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from .base import GTPConnectionBrokenException, ResponseType
+from .pool import GTPPool, GTPPoolExhaustedException, GTPPoolClosedException, GTPPoolResetException
+from .remote import RemoteGTP
+from .replay import PositionLog
+
+__ALL__ = ['HashRing', 'EngineFarm', 'FarmGTP', 'EngineFarmUnavailableException']
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode('utf8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring
+
+    Every node is placed on the ring replicas times, a key belongs to the first node
+    after the key's hash.
+    """
+
+    def __init__(self, nodes, replicas=64):
+        points = sorted((_hash('{}#{}'.format(node, index)), node) for node in nodes for index in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def nodes(self, key):
+        """Nodes in order of preference for key
+
+        :return: generator of distinct nodes, the owner of key first
+        """
+        if not self._nodes:
+            return
+        start = bisect.bisect(self._hashes, _hash(str(key)))
+        seen = set()
+        for index in range(len(self._nodes)):
+            node = self._nodes[(start + index) % len(self._nodes)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+
+    def __len__(self):
+        return len(set(self._nodes))
+
+
+class EngineFarm:
+    """Pools of connections to engine servers
+
+    A host whose connection fails is skipped for retry_interval seconds. A host that
+    has no free engine passes the game on to the next host.
+    """
+
+    def __init__(self, hosts, pool_size=4, min_size=0, connect_timeout=5, timeout=None, retry_interval=30,
+                 replicas=64, board_size=9, komi=5.5, refill_interval=5.0):
+        """
+        :param hosts: host:port of engine servers
+        :param pool_size: connections per host at most
+        :param min_size: idle connections kept open per host
+        :param timeout: seconds to wait for a response, None to wait forever
+        :param retry_interval: seconds a failed host is skipped
+        """
+        if not hosts:
+            raise ValueError('No engine hosts')
+        self._ring = HashRing(hosts, replicas)
+        self._pools = {
+            host: GTPPool(None, min_size=min_size, max_size=pool_size, board_size=board_size, komi=komi,
+                          refill_interval=refill_interval, acquire_timeout=0,
+                          factory=functools.partial(RemoteGTP, host, connect_timeout=connect_timeout,
+                                                    timeout=timeout))
+            for host in hosts
+        }
+        self._retry_interval = retry_interval
+        self._down = {}
+        self._lock = threading.Lock()
+        self._placed = 0
+        self._spilled = 0
+        self._failovers = 0
+        self._replayed = 0
+
+    def start(self):
+        for pool in self._pools.values():
+            pool.start()
+
+    def close(self):
+        for pool in self._pools.values():
+            pool.close()
+
+    def acquire(self, key, exclude=()):
+        """Get a connection for game key
+
+        :param key: game key that picks the host
+        :param exclude: hosts not to use
+        :return: (host, opened RemoteGTP)
+        :raise EngineFarmUnavailableException: no host has a free engine
+        """
+        now = time.monotonic()
+        candidates = [host for host in self._ring.nodes(key) if host not in exclude]
+        with self._lock:
+            up = [host for host in candidates if self._down.get(host, 0) <= now]
+        for index, host in enumerate(up or candidates):
+            try:
+                gtp = self._pools[host].acquire(timeout=0)
+            except GTPPoolExhaustedException:
+                continue
+            except (GTPConnectionBrokenException, GTPPoolResetException, OSError, ValueError) as e:
+                logger.warning('acquire: host {} failed: {}'.format(host, e))
+                self.mark_down(host)
+                continue
+            with self._lock:
+                self._down.pop(host, None)
+                self._placed += 1
+                if index:
+                    self._spilled += 1
+            return host, gtp
+        raise EngineFarmUnavailableException()
+
+    def release(self, host, gtp):
+        try:
+            self._pools[host].release(gtp)
+        except GTPPoolClosedException:
+            gtp.close()
+
+    def mark_down(self, host):
+        """Skip host for retry_interval seconds
+
+        """
+        with self._lock:
+            self._down[host] = time.monotonic() + self._retry_interval
+
+    def failover(self, key, host, gtp, position):
+        """Move game from failed host to another one
+
+        :param key: game key
+        :param host: failed host
+        :param gtp: connection of failed host
+        :param position: PositionLog of game
+        :return: (host, opened RemoteGTP) holding position
+        """
+        logger.warning('failover: host {} failed'.format(host))
+        self.mark_down(host)
+        self.release(host, gtp)
+        exclude = {host}
+        while True:
+            host, gtp = self.acquire(key, exclude)
+            commands = position.commands()
+            try:
+                responses = gtp.pipeline(commands)
+            except (GTPConnectionBrokenException, OSError, ValueError) as e:
+                logger.warning('failover: host {} failed: {}'.format(host, e))
+                self.mark_down(host)
+                self.release(host, gtp)
+                exclude.add(host)
+                continue
+            errors = [response.content for response in responses if response.type == ResponseType.ERROR]
+            if errors:
+                self.release(host, gtp)
+                raise GTPConnectionBrokenException('Failed to replay position: {}'.format(errors[0]))
+            with self._lock:
+                self._failovers += 1
+                self._replayed += len(commands)
+            return host, gtp
+
+    def stats(self):
+        now = time.monotonic()
+        pools = [pool.stats() for pool in self._pools.values()]
+        with self._lock:
+            return {
+                'hosts': len(self._pools),
+                'hosts_down': sum(1 for until in self._down.values() if until > now),
+                'connections': sum(stats['size'] for stats in pools),
+                'lent': sum(stats['lent'] for stats in pools),
+                'placed': self._placed,
+                'spilled': self._spilled,
+                'failovers': self._failovers,
+                'replayed_commands': self._replayed,
+            }
+
+
+class FarmGTP(contextlib.AbstractContextManager):
+    """GTP connection of one game running on an engine farm
+
+    Commands that fail because the host went away are sent again on another host
+    after the game's position is replayed there.
+    """
+
+    def __init__(self, farm, key=None):
+        """
+        :param farm: EngineFarm
+        :param key: stable key of the game, e.g. chat id, that places it on the same host every time,
+                    random if None
+        """
+        self._farm = farm
+        self._key = key if key is not None else uuid.uuid4().hex
+        self._host = None
+        self._gtp = None
+        self._pending = None
+        self.position = PositionLog()
+
+    def open(self):
+        self._host, self._gtp = self._farm.acquire(self._key)
+
+    def close(self):
+        if self._gtp is None:
+            return
+        gtp, self._gtp = self._gtp, None
+        self._farm.release(self._host, gtp)
+
+    def is_alive(self):
+        return self._gtp is not None
+
+    @property
+    def host(self):
+        return self._host
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def send_command(self, command):
+        self._check_open()
+        try:
+            self._gtp.send_command(command)
+        except (GTPConnectionBrokenException, OSError):
+            self._failover()
+            self._gtp.send_command(command)
+        self._pending = command
+
+    def recv_response(self):
+        command, self._pending = self._pending, None
+        try:
+            response = self._gtp.recv_response()
+        except (GTPConnectionBrokenException, OSError):
+            self._failover()
+            self._gtp.send_command(command)
+            response = self._gtp.recv_response()
+        self.position.record(command, response)
+        return response
+
+    def pipeline(self, commands):
+        self._check_open()
+        try:
+            responses = self._gtp.pipeline(commands)
+        except (GTPConnectionBrokenException, OSError):
+            self._failover()
+            responses = self._gtp.pipeline(commands)
+        for command, response in zip(commands, responses):
+            self.position.record(command, response)
+        return responses
+
+    def _check_open(self):
+        if self._gtp is None:
+            raise GTPConnectionBrokenException()
+
+    def _failover(self):
+        gtp, self._gtp = self._gtp, None
+        self._host, self._gtp = self._farm.failover(self._key, self._host, gtp, self.position)
+
+
+class EngineFarmUnavailableException(GTPPoolExhaustedException):
+    pass
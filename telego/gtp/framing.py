@@ -0,0 +1,88 @@
+"""Framing of GTP responses
+
+A GTP response ends with an empty line. ResponseFramer collects engine output
+read in bulk and cuts it into whole responses, so multi-line responses do not
+need per-line reads. A response that grows past the size limit is dropped up to
+its terminating empty line, so the next frame is the next response.
+"""
+
+__ALL__ = ['ResponseFramer', 'GTPResponseTooLargeException']
+
+DEFAULT_MAX_RESPONSE_SIZE = 1 << 20
+READ_SIZE = 1 << 16
+
+
+class ResponseFramer:
+    """Cut engine output into GTP responses
+
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_RESPONSE_SIZE):
+        self._buffer = bytearray()
+        self._max_size = max_size
+        self._scanned = 0
+        self._skipping = False
+
+    def feed(self, data):
+        """Append engine output
+
+        :param data: bytes read from engine
+        :return:
+        """
+        if b'\r' in data:
+            data = data.replace(b'\r', b'')
+        self._buffer += data
+
+    def next_frame(self):
+        """Pop next complete response
+
+        :return: response bytes without the terminating empty line, None if no complete response is buffered
+        :raise GTPResponseTooLargeException: when the end of a response over the size limit has been skipped
+        """
+        if self._skipping:
+            self._skip()
+            if self._skipping:
+                return None
+        start = 0
+        while start < len(self._buffer) and self._buffer[start] == 0x0a:
+            start += 1
+        if start:
+            del self._buffer[:start]
+            self._scanned = max(self._scanned - start, 0)
+        end = self._buffer.find(b'\n\n', self._scanned)
+        if end < 0:
+            self._scanned = max(len(self._buffer) - 1, 0)
+            if len(self._buffer) > self._max_size:
+                self._skipping = True
+                self._skip()
+            return None
+        if end > self._max_size:
+            del self._buffer[:end + 2]
+            self._scanned = 0
+            raise GTPResponseTooLargeException()
+        frame = bytes(self._buffer[:end + 1])
+        del self._buffer[:end + 2]
+        self._scanned = 0
+        return frame
+
+    def _skip(self):
+        """Drop output of an oversized response up to its terminating empty line
+
+        """
+        end = self._buffer.find(b'\n\n')
+        if end < 0:
+            # keep the last byte, it may be the first half of the terminator
+            del self._buffer[:-1]
+            self._scanned = 0
+            return
+        del self._buffer[:end + 2]
+        self._scanned = 0
+        self._skipping = False
+        raise GTPResponseTooLargeException()
+
+    def __len__(self):
+        return len(self._buffer)
+
+
+class GTPResponseTooLargeException(Exception):
+    pass
@@ -0,0 +1,253 @@
+"""Share a bounded set of engines between many games
+
+Each game talks to a MultiplexedGTP. When the game sends a command, the
+multiplexer picks an engine, and if that engine holds another game's position it
+swaps in this game's position by replaying its PositionLog.
+"""
+import contextlib
+import functools
+import logging
+import threading
+import time
+from .base import GTP, GTPConnectionBrokenException, ResponseType
+from .pool import GTPPoolExhaustedException
+from .replay import PositionLog
+
+__ALL__ = ['EngineMultiplexer', 'MultiplexedGTP']
+
+logger = logging.getLogger(__name__)
+
+
+class _Engine:
+
+    def __init__(self, gtp):
+        self.gtp = gtp
+        self.holder = None
+        self.busy = True
+        self.last_used = time.monotonic()
+
+
+class EngineMultiplexer:
+    """Run games on at most max_engines engine processes
+
+    An engine that already holds a game's position is reused for that game. Otherwise
+    an engine without position, or the least recently used idle engine, is taken over.
+    """
+
+    def __init__(self, cmd, max_engines, factory=None, acquire_timeout=None):
+        """
+        :param cmd: engine command
+        :param factory: callable that returns an unopened GTP-like connection, used instead of cmd
+        :param acquire_timeout: seconds to wait for an idle engine, None to wait forever
+        """
+        if max_engines < 1:
+            raise ValueError('max_engines must be positive')
+        self._factory = factory or functools.partial(GTP, cmd)
+        self._max_engines = max_engines
+        self._acquire_timeout = acquire_timeout
+        self._engines = []
+        self._cond = threading.Condition()
+        self._requests = 0
+        self._hits = 0
+        self._swaps = 0
+        self._replayed = 0
+        self._max_replay = 0
+        self._spawned = 0
+
+    def close(self):
+        with self._cond:
+            engines = list(self._engines)
+            self._engines.clear()
+        for engine in engines:
+            # engine that is still being spawned has no connection yet
+            if engine.gtp is not None:
+                engine.gtp.close()
+
+    def acquire(self, client):
+        """Get an engine that holds client's position
+
+        Blocks until an engine is idle, at most acquire_timeout seconds.
+
+        :param client: MultiplexedGTP
+        :return: engine, must be given back with release()
+        :raise GTPPoolExhaustedException: when no engine became idle in time
+        """
+        deadline = None if self._acquire_timeout is None else time.monotonic() + self._acquire_timeout
+        with self._cond:
+            self._requests += 1
+            while True:
+                engine = client.engine
+                if engine is not None and engine.holder is client and not engine.busy and engine in self._engines:
+                    engine.busy = True
+                    self._hits += 1
+                    return engine
+                idle = [engine for engine in self._engines if not engine.busy]
+                if len(self._engines) < self._max_engines and not any(engine.holder is None for engine in idle):
+                    engine = None
+                    break
+                if idle:
+                    engine = min(idle, key=lambda engine: (engine.holder is not None, engine.last_used))
+                    engine.busy = True
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise GTPPoolExhaustedException()
+                self._cond.wait(remaining)
+            if engine is None:
+                engine = _Engine(None)
+                self._engines.append(engine)
+        if engine.gtp is None:
+            try:
+                engine.gtp = self._spawn()
+            except Exception:
+                self._discard(engine)
+                raise
+        self._swap_in(engine, client)
+        return engine
+
+    def release(self, engine):
+        with self._cond:
+            engine.busy = False
+            engine.last_used = time.monotonic()
+            self._cond.notify_all()
+
+    def discard(self, engine):
+        """Drop engine that failed
+
+        """
+        self._discard(engine)
+        try:
+            engine.gtp.close()
+        except OSError as e:
+            logger.warning('discard: {}'.format(e))
+
+    def forget(self, client):
+        """Mark engines that hold client's position as free
+
+        """
+        with self._cond:
+            for engine in self._engines:
+                if engine.holder is client:
+                    engine.holder = None
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'engines': len(self._engines),
+                'busy': sum(1 for engine in self._engines if engine.busy),
+                'spawned': self._spawned,
+                'requests': self._requests,
+                'hits': self._hits,
+                'hit_rate': self._hits / self._requests if self._requests else 0.0,
+                'swaps': self._swaps,
+                'replayed_commands': self._replayed,
+                'mean_replay_length': self._replayed / self._swaps if self._swaps else 0.0,
+                'max_replay_length': self._max_replay,
+            }
+
+    def _swap_in(self, engine, client):
+        commands = client.position.commands()
+        try:
+            responses = engine.gtp.pipeline(commands)
+        except (GTPConnectionBrokenException, OSError, ValueError) as e:
+            self.discard(engine)
+            raise GTPConnectionBrokenException() from e
+        errors = [response.content for response in responses if response.type == ResponseType.ERROR]
+        if errors:
+            self.discard(engine)
+            raise GTPConnectionBrokenException('Failed to replay position: {}'.format(errors[0]))
+        with self._cond:
+            engine.holder = client
+            self._swaps += 1
+            self._replayed += len(commands)
+            self._max_replay = max(self._max_replay, len(commands))
+        client.engine = engine
+        logger.debug('_swap_in: replayed {} commands'.format(len(commands)))
+
+    def _spawn(self):
+        gtp = self._factory()
+        gtp.open()
+        with self._cond:
+            self._spawned += 1
+        logger.info('_spawn: engine started')
+        return gtp
+
+    def _discard(self, engine):
+        with self._cond:
+            if engine in self._engines:
+                self._engines.remove(engine)
+            engine.holder = None
+            self._cond.notify_all()
+
+
+class MultiplexedGTP(contextlib.AbstractContextManager):
+    """GTP connection of one game running on a shared engine
+
+    """
+
+    def __init__(self, multiplexer, key=None):
+        """
+        :param multiplexer: EngineMultiplexer
+        :param key: key of the game, unused as every engine serves any game
+        """
+        self._multiplexer = multiplexer
+        self._opened = False
+        self._pending = None
+        self.engine = None
+        self.position = PositionLog()
+
+    def open(self):
+        self._opened = True
+
+    def close(self):
+        self._opened = False
+        self._multiplexer.forget(self)
+        self.engine = None
+
+    def is_alive(self):
+        return self._opened
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def send_command(self, command):
+        if not self._opened:
+            raise GTPConnectionBrokenException()
+        engine = self._multiplexer.acquire(self)
+        try:
+            engine.gtp.send_command(command)
+        except Exception:
+            self._multiplexer.discard(engine)
+            raise
+        self._pending = (engine, command)
+
+    def recv_response(self):
+        engine, command = self._pending
+        self._pending = None
+        try:
+            response = engine.gtp.recv_response()
+        except Exception:
+            self._multiplexer.discard(engine)
+            raise
+        self.position.record(command, response)
+        self._multiplexer.release(engine)
+        return response
+
+    def pipeline(self, commands):
+        if not self._opened:
+            raise GTPConnectionBrokenException()
+        engine = self._multiplexer.acquire(self)
+        try:
+            responses = engine.gtp.pipeline(commands)
+        except Exception:
+            self._multiplexer.discard(engine)
+            raise
+        for command, response in zip(commands, responses):
+            self.position.record(command, response)
+        self._multiplexer.release(engine)
+        return responses
@@ -0,0 +1,284 @@
+"""Pool of warm GTP engines
+
+Starting a go engine (and loading its models) is slow, so the pool keeps a few
+engines running and lends them to games. Returned engines are reset and reused
+instead of being terminated.
+"""
+import collections
+import contextlib
+import functools
+import logging
+import threading
+from .base import GTP, GTPConnectionBrokenException, ResponseType
+from .commands import Boardsize, ClearBoard, Komi
+
+__ALL__ = ['GTPPool', 'PooledGTP', 'GTPPoolExhaustedException', 'GTPPoolClosedException']
+
+logger = logging.getLogger(__name__)
+
+
+class GTPPool:
+    """Keep between min_size and max_size engines alive
+
+    A background thread resets returned engines, drops dead ones and spawns new
+    engines until at least min_size of them are idle.
+    """
+
+    def __init__(self, cmd, min_size=1, max_size=4, board_size=9, komi=5.5, refill_interval=5.0,
+                 acquire_timeout=None, factory=None):
+        """
+        :param cmd: engine command
+        :param factory: callable that returns an unopened GTP-like connection, used instead of cmd, e.g. RemoteGTP
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError('Invalid pool size: min_size={} max_size={}'.format(min_size, max_size))
+        self._factory = factory or functools.partial(GTP, cmd)
+        self._min_size = min_size
+        self._max_size = max_size
+        self._board_size = board_size
+        self._komi = komi
+        self._refill_interval = refill_interval
+        self._acquire_timeout = acquire_timeout
+        self._idle = collections.deque()
+        self._dirty = collections.deque()
+        self._size = 0
+        self._spawned = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._refill_thread = None
+
+    def start(self):
+        """Start background refill thread
+
+        """
+        self._refill_thread = threading.Thread(target=self._refill_loop, name='gtp-pool-refill', daemon=True)
+        self._refill_thread.start()
+
+    def close(self):
+        """Terminate every engine in the pool
+
+        Engines that are still lent to games are terminated when they are released.
+        """
+        with self._cond:
+            self._closed = True
+            engines = list(self._idle) + list(self._dirty)
+            self._idle.clear()
+            self._dirty.clear()
+            self._size -= len(engines)
+            self._cond.notify_all()
+        for gtp in engines:
+            self._terminate(gtp)
+        if self._refill_thread is not None:
+            self._refill_thread.join()
+
+    def acquire(self, timeout=None):
+        """Get a ready engine
+
+        Spawn a new engine if no engine is idle and the pool is not full, otherwise wait
+        for an engine to be released.
+
+        :param timeout: seconds to wait for an engine, None to use pool default.
+        :return: opened GTP instance
+        """
+        if timeout is None:
+            timeout = self._acquire_timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise GTPPoolClosedException()
+                while self._idle:
+                    gtp = self._idle.popleft()
+                    if gtp.is_alive():
+                        self._cond.notify_all()
+                        return gtp
+                    logger.warning('acquire: drop dead engine')
+                    self._size -= 1
+                if self._size < self._max_size:
+                    self._size += 1
+                    break
+                if not self._cond.wait(timeout):
+                    raise GTPPoolExhaustedException()
+        try:
+            gtp = self._spawn()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self._cond.notify_all()
+        return gtp
+
+    def release(self, gtp):
+        """Give engine back to the pool
+
+        The engine is reset by refill thread before it is lent again.
+
+        :param gtp: GTP instance acquired from this pool
+        :return:
+        """
+        with self._cond:
+            if not self._closed:
+                self._dirty.append(gtp)
+                self._cond.notify_all()
+                return
+            self._size -= 1
+        self._terminate(gtp)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'dirty': len(self._dirty),
+                'lent': self._size - len(self._idle) - len(self._dirty),
+                'spawned': self._spawned,
+            }
+
+    def _refill_loop(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                dirty = list(self._dirty)
+                self._dirty.clear()
+            for gtp in dirty:
+                self._return(gtp)
+            self._check_idle()
+            while self._need_refill():
+                try:
+                    gtp = self._spawn()
+                except Exception as e:
+                    logger.error('_refill_loop: failed to spawn engine: {}'.format(e))
+                    with self._cond:
+                        self._size -= 1
+                    break
+                with self._cond:
+                    self._idle.append(gtp)
+                    self._cond.notify_all()
+            with self._cond:
+                if not self._closed and not self._dirty:
+                    self._cond.wait(self._refill_interval)
+
+    def _need_refill(self):
+        with self._cond:
+            if self._closed or len(self._idle) >= self._min_size or self._size >= self._max_size:
+                return False
+            self._size += 1
+            return True
+
+    def _check_idle(self):
+        with self._cond:
+            alive = collections.deque(gtp for gtp in self._idle if gtp.is_alive())
+            dead = len(self._idle) - len(alive)
+            self._idle = alive
+            self._size -= dead
+        if dead:
+            logger.warning('_check_idle: drop {} dead engines'.format(dead))
+
+    def _return(self, gtp):
+        try:
+            self._reset(gtp)
+        except Exception as e:
+            logger.warning('_return: failed to reset engine: {}'.format(e))
+            with self._cond:
+                self._size -= 1
+                self._cond.notify_all()
+            self._terminate(gtp)
+            return
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+            else:
+                self._idle.append(gtp)
+                self._cond.notify_all()
+                return
+        self._terminate(gtp)
+
+    def _reset(self, gtp):
+        responses = gtp.pipeline([ClearBoard(), Boardsize(self._board_size), Komi(self._komi)])
+        for response in responses:
+            if response.type == ResponseType.ERROR:
+                raise GTPPoolResetException(response.content)
+
+    def _spawn(self):
+        gtp = self._factory()
+        gtp.open()
+        try:
+            self._reset(gtp)
+        except Exception:
+            self._terminate(gtp)
+            raise
+        with self._cond:
+            self._spawned += 1
+        logger.info('_spawn: engine started')
+        return gtp
+
+    @staticmethod
+    def _terminate(gtp):
+        try:
+            gtp.close()
+        except Exception as e:
+            logger.warning('_terminate: {}'.format(e))
+
+
+class PooledGTP(contextlib.AbstractContextManager):
+    """GTP connection lent from a pool
+
+    Opening acquires an engine from the pool and closing gives it back, so it can
+    be used in place of GTP.
+    """
+
+    def __init__(self, pool, key=None):
+        """
+        :param pool: GTPPool
+        :param key: key of the game, unused as every engine of the pool serves any game
+        """
+        self._pool = pool
+        self._gtp = None
+
+    def open(self):
+        self._gtp = self._pool.acquire()
+
+    def close(self):
+        if self._gtp is None:
+            return
+        gtp, self._gtp = self._gtp, None
+        self._pool.release(gtp)
+
+    def is_alive(self):
+        return self._gtp is not None and self._gtp.is_alive()
+
+    def send_command(self, command):
+        if self._gtp is None:
+            raise GTPConnectionBrokenException()
+        self._gtp.send_command(command)
+
+    def recv_response(self):
+        if self._gtp is None:
+            raise GTPConnectionBrokenException()
+        return self._gtp.recv_response()
+
+    def pipeline(self, commands):
+        if self._gtp is None:
+            raise GTPConnectionBrokenException()
+        return self._gtp.pipeline(commands)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class GTPPoolExhaustedException(Exception):
+    pass
+
+
+class GTPPoolClosedException(Exception):
+    pass
+
+
+class GTPPoolResetException(Exception):
+    pass
@@ -0,0 +1,100 @@
+"""Go Text Protocol over TCP
+
+RemoteGTP talks to an engine exposed by telego.gtp.server on another host. It has
+the same interface as GTP, so it can be used by games and pools in place of a
+local engine process.
+"""
+import select
+import socket
+from .base import GTP, GTPConnectionBrokenException
+from .framing import ResponseFramer, DEFAULT_MAX_RESPONSE_SIZE, READ_SIZE
+
+__ALL__ = ['RemoteGTP', 'parse_address', 'DEFAULT_PORT']
+
+DEFAULT_PORT = 5100
+
+
+def parse_address(address):
+    """Parse host:port
+
+    :param address: address string, port defaults to DEFAULT_PORT
+    :return: (host, port)
+    """
+    host, _, port = address.strip().rpartition(':')
+    if not host:
+        return port, DEFAULT_PORT
+    return host.strip('[]'), int(port)
+
+
+class RemoteGTP(GTP):
+    """Go Text Protocol connection to an engine server
+
+    """
+
+    def __init__(self, address, connect_timeout=5, timeout=None, max_response_size=DEFAULT_MAX_RESPONSE_SIZE):
+        """
+        :param address: host:port of server
+        :param connect_timeout: seconds to wait for connection
+        :param timeout: seconds to wait for a response, None to wait forever
+        """
+        super().__init__(None, max_response_size)
+        self._address = parse_address(address) if isinstance(address, str) else tuple(address)
+        self._connect_timeout = connect_timeout
+        self._timeout = timeout
+        self._sock = None
+
+    def open(self):
+        self._sock = socket.create_connection(self._address, self._connect_timeout)
+        self._sock.settimeout(self._timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._framer = ResponseFramer(self._max_response_size)
+
+    def close(self):
+        if self._sock is None:
+            return
+        sock, self._sock = self._sock, None
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
+    def is_alive(self):
+        """Check that server has not closed the connection
+
+        Buffered output is left in place, a connection with pending data is alive.
+        """
+        if self._sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([self._sock], [], [], 0)
+            if readable and not self._sock.recv(1, socket.MSG_PEEK):
+                return False
+        except OSError:
+            return False
+        return True
+
+    @property
+    def address(self):
+        return '{}:{}'.format(*self._address)
+
+    def _write(self, data):
+        try:
+            self._sock.sendall(data)
+        except OSError as e:
+            self.close()
+            raise GTPConnectionBrokenException() from e
+
+    def _read(self):
+        if self._sock is None:
+            return b''
+        try:
+            data = self._sock.recv(READ_SIZE)
+        except socket.timeout as e:
+            self.close()
+            raise GTPConnectionBrokenException('No response from {}'.format(self.address)) from e
+        except OSError:
+            data = b''
+        if not data:
+            self.close()
+        return data
@@ -0,0 +1,64 @@
+"""Position log of a GTP session
+
+Engines are stateful: the position they hold is built by the commands sent so far.
+PositionLog keeps the commands that matter, so the same position can be rebuilt on
+another engine process.
+"""
+from .base import ResponseType
+from .commands import ClearBoard, Play
+
+__ALL__ = ['PositionLog']
+
+_SETTINGS = ('boardsize', 'komi', 'time_settings', 'kgs-time_settings')
+
+
+class PositionLog:
+    """Commands needed to rebuild position of a GTP session
+
+    """
+
+    def __init__(self):
+        self._settings = {}
+        self._moves = []
+
+    def record(self, command, response):
+        """Record command after engine answered it
+
+        :param command: sent Command
+        :param response: Response of command
+        :return:
+        """
+        if response.type != ResponseType.SUCCESS:
+            return
+        name, *args = str(command).split()
+        if name in _SETTINGS:
+            self._settings[name] = command
+            if name == 'boardsize':
+                self._moves.clear()
+        elif name == 'clear_board':
+            self._moves.clear()
+        elif name == 'play':
+            self._moves.append(command)
+        elif name == 'genmove':
+            if response.content.lower() != 'resign':
+                self._moves.append(Play(args[0], response.content))
+        elif name == 'undo':
+            if self._moves:
+                self._moves.pop()
+
+    def commands(self):
+        """Commands that rebuild the position on a fresh engine
+
+        """
+        commands = [self._settings['boardsize']] if 'boardsize' in self._settings else []
+        commands.append(ClearBoard())
+        commands.extend(command for name, command in self._settings.items() if name != 'boardsize')
+        commands.extend(self._moves)
+        return commands
+
+    @property
+    def moves(self):
+        return list(self._moves)
+
+    def __len__(self):
+        return len(self._moves)
@@ -0,0 +1,219 @@
+"""Serve local engines over TCP
+
+Each client connection gets an engine from a GTPPool for as long as it stays
+connected. Commands read from the connection are passed to the engine and its
+responses are written back unchanged, so RemoteGTP on another host can drive the
+engine. A quit command ends the connection, the engine itself is reset and kept
+for the next client.
+
+There is no authentication, so the server listens on localhost unless told
+otherwise, and only the commands that telego sends are passed to the engine. Other
+commands, e.g. loadsgf that reads files on the host, are answered with an error.
+
+Usage: python -m telego.gtp.server [--host 127.0.0.1] [--port 5100] [--engines 4] [--allow-all-commands] -- pachi
+"""
+import argparse
+import logging
+import socket
+import socketserver
+import threading
+from .base import Command, GTPConnectionBrokenException
+from .framing import READ_SIZE
+from .pool import GTPPool, GTPPoolExhaustedException
+from .remote import DEFAULT_PORT
+
+__ALL__ = ['GTPServer', 'ALLOWED_COMMANDS']
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_COMMANDS = frozenset((
+    'protocol_version', 'name', 'version', 'known_command', 'list_commands', 'quit',
+    'boardsize', 'clear_board', 'komi', 'play', 'genmove', 'undo', 'final_score', 'final_status_list',
+    'showboard', 'time_settings',
+))
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class GTPServer:
+    """Expose pooled engine processes on a port
+
+    """
+
+    def __init__(self, cmd, host='127.0.0.1', port=DEFAULT_PORT, min_engines=1, max_engines=4, acquire_timeout=30,
+                 board_size=9, komi=5.5, allowed_commands=ALLOWED_COMMANDS):
+        """
+        :param cmd: engine command
+        :param host: address to listen on, e.g. 0.0.0.0 for every interface
+        :param max_engines: engines, and so connections served at once
+        :param acquire_timeout: seconds a connection waits for an engine before it is refused
+        :param allowed_commands: names of commands passed to the engine, None to pass every command
+        """
+        self._allowed_commands = allowed_commands
+        self._pool = GTPPool(cmd, min_size=min_engines, max_size=max_engines, board_size=board_size, komi=komi,
+                             acquire_timeout=acquire_timeout)
+        self._address = (host, port)
+        self._server = None
+        self._thread = None
+        self._sockets = set()
+        self._refused = 0
+        self._commands = 0
+        self._denied = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start engines and serve in a background thread
+
+        """
+        self._pool.start()
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+
+            def handle(self):
+                server._serve(self.request)
+
+        self._server = _TCPServer(self._address, Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='gtp-server', daemon=True)
+        self._thread.start()
+        logger.info('start: serving on {}:{}'.format(*self.address))
+
+    def join(self):
+        """Wait until server is stopped
+
+        """
+        self._thread.join()
+
+    def stop(self):
+        """Stop serving, close connections and terminate engines
+
+        """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        with self._lock:
+            sockets = list(self._sockets)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._pool.close()
+
+    @property
+    def address(self):
+        """Bound (host, port), useful with port 0
+
+        """
+        return self._server.server_address[:2]
+
+    def stats(self):
+        stats = self._pool.stats()
+        with self._lock:
+            stats.update(connections=len(self._sockets), refused=self._refused, commands=self._commands,
+                         denied=self._denied)
+        return stats
+
+    def _serve(self, sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            gtp = self._pool.acquire()
+        except GTPPoolExhaustedException:
+            self._count('_refused')
+            logger.warning('_serve: no engine for {}'.format(sock.getpeername()))
+            sock.sendall(b'? no engine available\n\n')
+            return
+        except Exception as e:
+            self._count('_refused')
+            logger.error('_serve: failed to get engine: {}'.format(e))
+            sock.sendall(b'? engine failed to start\n\n')
+            return
+        with self._lock:
+            self._sockets.add(sock)
+        try:
+            self._proxy(sock, gtp)
+        except (GTPConnectionBrokenException, OSError, ValueError) as e:
+            logger.warning('_serve: connection ended: {}'.format(e))
+        finally:
+            with self._lock:
+                self._sockets.discard(sock)
+            self._pool.release(gtp)
+
+    def _proxy(self, sock, gtp):
+        buffer = b''
+        while True:
+            data = sock.recv(READ_SIZE)
+            if not data:
+                return
+            buffer += data.replace(b'\r', b'')
+            *lines, buffer = buffer.split(b'\n')
+            commands = []
+            for line in lines:
+                line = line.split(b'#', 1)[0].decode('utf8').strip()
+                if line:
+                    commands.append(Command(line))
+            for command in commands:
+                if command.name == 'quit':
+                    break
+                if self._is_allowed(command):
+                    gtp.send_command(command)
+            responses = []
+            for command in commands:
+                if command.name == 'quit':
+                    responses.append('={}\n\n'.format(self._id_of(command)).encode('utf8'))
+                    sock.sendall(b''.join(responses))
+                    return
+                if not self._is_allowed(command):
+                    logger.warning('_proxy: deny command {} of {}'.format(command.name, sock.getpeername()))
+                    self._count('_denied')
+                    responses.append('?{} unknown command\n\n'.format(self._id_of(command)).encode('utf8'))
+                    continue
+                responses.append(bytes(gtp.recv_response()) + b'\n')
+            with self._lock:
+                self._commands += len(responses)
+            if responses:
+                sock.sendall(b''.join(responses))
+
+    def _is_allowed(self, command):
+        return self._allowed_commands is None or command.name in self._allowed_commands
+
+    @staticmethod
+    def _id_of(command):
+        id = str(command).split()[0]
+        return id if id.isdigit() else ''
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve go engines over TCP')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on, 0.0.0.0 for every interface')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--engines', type=int, default=4, help='engine processes at most')
+    parser.add_argument('--min-engines', type=int, default=1, help='idle engines kept ready')
+    parser.add_argument('--allow-all-commands', action='store_true',
+                        help='pass every command to engines, not only the commands telego sends')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='engine command, default pachi')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    command = [arg for arg in args.command if arg != '--'] or ['pachi']
+    server = GTPServer(command, host=args.host, port=args.port, min_engines=args.min_engines,
+                       max_engines=args.engines,
+                       allowed_commands=None if args.allow_all_commands else ALLOWED_COMMANDS)
+    server.start()
+    try:
+        server.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
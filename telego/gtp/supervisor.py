@@ -0,0 +1,280 @@
+"""Engine supervision
+
+GTP waits on the engine's output without limit, so a hung engine blocks its game
+forever, and a crashed engine is only noticed when the next command is sent.
+SupervisedGTP reads and writes the engine pipes without blocking, and every
+command has a deadline. When the engine exits, answers garbage or misses a
+deadline, it is killed and a new process is started, the PositionLog of the game
+is replayed into it and the command in progress is sent again, so the game goes
+on without noticing.
+"""
+import functools
+import logging
+import os
+import selectors
+import subprocess
+import threading
+import time
+from .base import GTP, Command, CommandTimer, GTPConnectionBrokenException, GTPProtocolException, ResponseType, \
+    match_responses
+from .framing import DEFAULT_MAX_RESPONSE_SIZE, READ_SIZE, GTPResponseTooLargeException
+from .replay import PositionLog
+from .. import metrics
+
+__ALL__ = ['SupervisedGTP', 'SupervisorStats', 'GTPTimeoutException', 'GTPReplayException']
+
+logger = logging.getLogger(__name__)
+
+ENGINE_RESTARTS = metrics.counter('telego_gtp_engine_restarts_total', 'Engines restarted by supervisor', ('reason',))
+RECOVERY_SECONDS = metrics.histogram('telego_gtp_engine_recovery_seconds',
+                                     'Time from detecting a failed engine to replaying its position on a new one')
+
+_FAILURES = (GTPConnectionBrokenException, GTPProtocolException, GTPResponseTooLargeException, OSError, ValueError)
+
+
+class SupervisorStats:
+    """Restarts and recovery time of supervised engines
+
+    One instance is shared by every engine of a pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._restarts = {'crash': 0, 'timeout': 0}
+        self._failures = 0
+        self._recovery_seconds = 0.0
+        self._max_recovery_seconds = 0.0
+
+    def restarted(self, reason, seconds):
+        """Record a recovered engine
+
+        :param reason: crash or timeout
+        :param seconds: time from detecting the failure to replaying the position
+        """
+        ENGINE_RESTARTS.labels(reason).inc()
+        RECOVERY_SECONDS.observe(seconds)
+        with self._lock:
+            self._restarts[reason] += 1
+            self._recovery_seconds += seconds
+            self._max_recovery_seconds = max(self._max_recovery_seconds, seconds)
+
+    def failed(self):
+        """Record an engine given up after too many restarts
+
+        """
+        with self._lock:
+            self._failures += 1
+
+    def stats(self):
+        with self._lock:
+            restarts = sum(self._restarts.values())
+            return {
+                'restarts': restarts,
+                'crash_restarts': self._restarts['crash'],
+                'timeout_restarts': self._restarts['timeout'],
+                'failures': self._failures,
+                'recovery_seconds_mean': self._recovery_seconds / restarts if restarts else 0.0,
+                'recovery_seconds_max': self._max_recovery_seconds,
+            }
+
+
+class SupervisedGTP(GTP):
+    """GTP connection that restarts hung and crashed engines
+
+    """
+
+    def __init__(self, cmd, timeout=30.0, genmove_timeout=120.0, max_restarts=2, stats=None,
+                 max_response_size=DEFAULT_MAX_RESPONSE_SIZE):
+        """
+        :param cmd: engine command, or callable that returns the command of every started engine, e.g. to vary a seed
+        :param timeout: seconds the engine has to answer a command, None for no limit
+        :param genmove_timeout: seconds the engine has to answer genmove, None for no limit
+        :param max_restarts: restarts for one command before giving up
+        :param stats: SupervisorStats to record restarts to
+        """
+        super().__init__(None if callable(cmd) else cmd, max_response_size)
+        self._spawn_command = cmd if callable(cmd) else None
+        self._timeout = timeout
+        self._genmove_timeout = genmove_timeout
+        self._max_restarts = max_restarts
+        self._stats = stats if stats is not None else SupervisorStats()
+        self._deadline = None
+        self._pending = None
+        self._readable = None
+        self._writable = None
+        self.position = PositionLog()
+        self.restarts = 0
+
+    def open(self):
+        if self._spawn_command is not None:
+            self._cmd = self._spawn_command()
+        super().open()
+        os.set_blocking(self._p.stdin.fileno(), False)
+        os.set_blocking(self._p.stdout.fileno(), False)
+        self._readable = selectors.DefaultSelector()
+        self._readable.register(self._p.stdout, selectors.EVENT_READ)
+        self._writable = selectors.DefaultSelector()
+        self._writable.register(self._p.stdin, selectors.EVENT_WRITE)
+
+    def close(self):
+        self._stop(grace=1.0)
+
+    def send_command(self, command):
+        if not isinstance(command, Command):
+            command = Command(command)
+        self._pending = command
+        self._supervise(lambda: self._send(command))
+
+    def recv_response(self):
+        command, self._pending = self._pending, None
+        if command is None:
+            return super().recv_response()
+
+        def resend():
+            self._send(command)
+            return self._recv(command)
+
+        return self._supervise(lambda: self._recv(command), retry=resend)
+
+    def pipeline(self, commands):
+        commands = [command if isinstance(command, Command) else Command(command) for command in commands]
+        if not commands:
+            return []
+        return self._supervise(lambda: self._pipeline(commands))
+
+    def _send(self, command):
+        if not self.is_alive():
+            raise GTPConnectionBrokenException()
+        self._deadline = self._deadline_of(command)
+        self._timer.sent((command,))
+        self._write(bytes(command))
+
+    def _recv(self, command):
+        self._deadline = self._deadline_of(command)
+        response = super().recv_response()
+        self._deadline = None
+        self.position.record(command, response)
+        return response
+
+    def _pipeline(self, commands):
+        if not self.is_alive():
+            raise GTPConnectionBrokenException()
+        ids = self._next_ids(len(commands))
+        self._deadline = self._deadline_of(commands[0])
+        self._timer.sent(commands)
+        self._write(b''.join(command.to_bytes(id) for id, command in zip(ids, commands)))
+        responses = []
+        for command in commands:
+            self._deadline = self._deadline_of(command)
+            responses.append(super().recv_response())
+        self._deadline = None
+        responses = match_responses(ids, responses)
+        for command, response in zip(commands, responses):
+            self.position.record(command, response)
+        return responses
+
+    def _supervise(self, attempt, retry=None):
+        """Run attempt, restart engine and run retry (or attempt again) when the engine fails
+
+        A failure while the new engine replays the position counts as another failure.
+        """
+        run = attempt
+        failures = 0
+        while True:
+            try:
+                return run()
+            except GTPReplayException:
+                self._stats.failed()
+                self._stop(grace=0)
+                raise
+            except _FAILURES as e:
+                failures += 1
+                if failures > self._max_restarts:
+                    logger.error('_supervise: engine failed {} times, giving up: {}'.format(failures, e))
+                    self._stats.failed()
+                    self._stop(grace=0)
+                    raise GTPConnectionBrokenException('Engine failed {} times: {}'.format(failures, e)) from e
+                reason = 'timeout' if isinstance(e, GTPTimeoutException) else 'crash'
+                logger.warning('_supervise: engine {}: {}'.format(reason, str(e) or type(e).__name__))
+                run = functools.partial(self._restart_and_run, reason, time.monotonic(), retry or attempt)
+
+    def _restart_and_run(self, reason, detected, func):
+        self._restart(reason, detected)
+        return func()
+
+    def _restart(self, reason, detected):
+        self._stop(grace=0)
+        self._timer = CommandTimer()
+        self.open()
+        commands = self.position.commands()
+        responses = self._pipeline(commands)
+        errors = [response.content for response in responses if response.type == ResponseType.ERROR]
+        if errors:
+            raise GTPReplayException('Failed to replay position: {}'.format(errors[0]))
+        seconds = time.monotonic() - detected
+        self.restarts += 1
+        self._stats.restarted(reason, seconds)
+        logger.info('_restart: replayed {} commands in {:.3f}s'.format(len(commands), seconds))
+
+    def _stop(self, grace):
+        """Stop engine process, killing it if it does not exit within grace seconds
+
+        """
+        for selector in (self._readable, self._writable):
+            if selector is not None:
+                selector.close()
+        self._readable = self._writable = None
+        if self._p.poll() is None:
+            if grace:
+                self._p.terminate()
+                try:
+                    self._p.wait(grace)
+                except subprocess.TimeoutExpired:
+                    self._p.kill()
+            else:
+                self._p.kill()
+        self._p.wait()
+        for pipe in (self._p.stdin, self._p.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    def _deadline_of(self, command):
+        timeout = self._genmove_timeout if command.name == 'genmove' else self._timeout
+        return None if timeout is None else time.monotonic() + timeout
+
+    def _remaining(self):
+        if self._deadline is None:
+            return None
+        return max(self._deadline - time.monotonic(), 0)
+
+    def _write(self, data):
+        data = memoryview(data)
+        fd = self._p.stdin.fileno()
+        while data:
+            if not self._writable.select(self._remaining()):
+                raise GTPTimeoutException('Engine did not read command in time')
+            try:
+                written = os.write(fd, data)
+            except BlockingIOError:
+                continue
+            data = data[written:]
+
+    def _read(self):
+        fd = self._p.stdout.fileno()
+        while True:
+            if not self._readable.select(self._remaining()):
+                raise GTPTimeoutException('Engine did not answer in time')
+            try:
+                return os.read(fd, READ_SIZE)
+            except BlockingIOError:
+                continue
+
+
+class GTPTimeoutException(GTPConnectionBrokenException):
+    pass
+
+
+class GTPReplayException(GTPConnectionBrokenException):
+    pass
@@ -0,0 +1,198 @@
+"""Position history of a game
+
+Every position of a game is kept as a persistent tree. The points of the board are
+cut into leaves of LEAF_SIZE points, and the leaves are the bottom of a tree of
+FANOUT children per node. A move copies only the path from the root to the leaves
+whose stones changed, and shares the rest of the tree with the previous position.
+Leaves are stored in one bytearray and nodes in one array of child indexes, so a
+position costs no Python objects: a move that changes one leaf adds LEAF_SIZE
+bytes and FANOUT indexes per tree level, which grows with the logarithm of the
+board size instead of with the number of points. Reading any earlier position
+walks one path per leaf.
+"""
+from array import array
+from .board import Board, EMPTY, BLACK, WHITE, render_colors
+from .gtp.entities import StoneColor
+
+__ALL__ = ['Position', 'PositionHistory', 'LEAF_SIZE', 'FANOUT']
+
+LEAF_SIZE = 8
+FANOUT = 4
+
+_color_codes = {StoneColor.BLACK: BLACK, StoneColor.WHITE: WHITE}
+_stone_colors = {BLACK: StoneColor.BLACK, WHITE: StoneColor.WHITE}
+
+
+class Position:
+    """Read-only board of one position in history
+
+    Position has the board interface used by renderers, size, hash, get() and
+    render(), so it can be shown without building a Board.
+    """
+
+    __slots__ = ('size', 'hash', 'ko', 'ko_color', 'move', 'color', '_colors')
+
+    def __init__(self, size, colors, hash, ko, ko_color, move, color):
+        """
+        :param colors: bytes of EMPTY, BLACK or WHITE of every point in flat order
+        :param move: move that led to position, None for the first position
+        :param color: StoneColor that played move
+        """
+        self.size = size
+        self.hash = hash
+        self.ko = ko
+        self.ko_color = ko_color
+        self.move = move
+        self.color = color
+        self._colors = colors
+
+    def get(self, row, col):
+        """Get stone color at point
+
+        :return: 'b', 'w' or None if point is empty
+        """
+        color = self._colors[row * self.size + col]
+        if color == EMPTY:
+            return None
+        return 'b' if color == BLACK else 'w'
+
+    @property
+    def colors(self):
+        """Stone of every point in flat order
+
+        """
+        return tuple(self._colors)
+
+    def render(self):
+        return render_colors(self.size, self.colors)
+
+    def to_board(self, seen=()):
+        """Build a Board that continues from this position
+
+        :param seen: hashes of earlier positions, for superko
+        :return: Board
+        """
+        return Board.from_position(self.size, self.colors, self.ko, self.ko_color, seen)
+
+
+class PositionHistory:
+    """Positions of a game, from the empty board to the current position
+
+    """
+
+    def __init__(self, size):
+        points = size * size
+        self._size = size
+        self._leaf_count = -(-points // LEAF_SIZE)
+        self._depth = 1
+        while FANOUT ** self._depth < self._leaf_count:
+            self._depth += 1
+        # leaf 0 is empty, and node n is the empty node of tree level n
+        self._leaves = bytearray(LEAF_SIZE)
+        self._nodes = array('I', [0] * FANOUT)
+        for level in range(1, self._depth):
+            self._nodes.extend([level - 1] * FANOUT)
+        self._roots = array('I', [self._depth - 1])
+        self._hashes = array('Q', [0])
+        self._kos = array('i', [-1])
+        self._ko_colors = bytearray([EMPTY])
+        self._colors = bytearray([EMPTY])
+        self._moves = [None]
+        self._leaf_ends = array('I', [len(self._leaves)])
+        self._node_ends = array('I', [len(self._nodes)])
+
+    def push(self, board, move, color):
+        """Append position of board after move
+
+        :param board: Board after move
+        :param move: Move played
+        :param color: StoneColor of move
+        """
+        colors = bytes(board.colors).ljust(self._leaf_count * LEAF_SIZE, b'\0')
+        root = self._copy(self._roots[-1], self._depth - 1, 0, colors)
+        self._roots.append(root)
+        self._hashes.append(board.hash)
+        ko = board.ko
+        self._kos.append(-1 if ko is None else ko[0] * self._size + ko[1])
+        self._ko_colors.append(board.ko_color)
+        self._colors.append(_color_codes[StoneColor(color)])
+        self._moves.append(move)
+        self._leaf_ends.append(len(self._leaves))
+        self._node_ends.append(len(self._nodes))
+
+    def truncate(self, moves):
+        """Drop positions after move number
+
+        :param moves: number of moves to keep
+        """
+        if moves < 0:
+            raise ValueError('Cannot keep {} moves'.format(moves))
+        if moves + 1 >= len(self._roots):
+            return
+        for items in (self._roots, self._hashes, self._kos, self._ko_colors, self._colors, self._moves,
+                      self._leaf_ends, self._node_ends):
+            del items[moves + 1:]
+        # leaves and nodes are only appended, so the ones after the kept positions belong to dropped positions
+        del self._leaves[self._leaf_ends[-1]:]
+        del self._nodes[self._node_ends[-1]:]
+
+    def hashes(self, moves=None):
+        """Hashes of positions up to move number, for superko
+
+        """
+        end = len(self._hashes) if moves is None else moves + 1
+        return list(self._hashes[:end])
+
+    def __getitem__(self, moves):
+        """Position after number of moves, 0 is the empty board
+
+        """
+        if moves < 0:
+            moves += len(self._roots)
+        if not 0 <= moves < len(self._roots):
+            raise IndexError('No position after {} moves'.format(moves))
+        colors = bytearray()
+        self._read(self._roots[moves], self._depth - 1, 0, colors)
+        ko = self._kos[moves]
+        return Position(self._size, bytes(colors[:self._size * self._size]), self._hashes[moves],
+                        None if ko < 0 else divmod(ko, self._size), self._ko_colors[moves], self._moves[moves],
+                        _stone_colors.get(self._colors[moves]))
+
+    def __len__(self):
+        return len(self._roots)
+
+    def _copy(self, node, level, first, colors):
+        """Copy path to changed leaves under node
+
+        :param node: node index at level, or leaf index at level -1
+        :param first: first leaf under node
+        :return: index of node holding colors, node itself if nothing changed
+        """
+        if first >= self._leaf_count:
+            return node
+        if level < 0:
+            start = first * LEAF_SIZE
+            leaf = colors[start:start + LEAF_SIZE]
+            if self._leaves[node * LEAF_SIZE:(node + 1) * LEAF_SIZE] == leaf:
+                return node
+            self._leaves.extend(leaf)
+            return len(self._leaves) // LEAF_SIZE - 1
+        offset = node * FANOUT
+        span = FANOUT ** level
+        children = [self._copy(self._nodes[offset + index], level - 1, first + index * span, colors)
+                    for index in range(FANOUT)]
+        if children == list(self._nodes[offset:offset + FANOUT]):
+            return node
+        self._nodes.extend(children)
+        return len(self._nodes) // FANOUT - 1
+
+    def _read(self, node, level, first, colors):
+        if first >= self._leaf_count:
+            return
+        if level < 0:
+            colors.extend(self._leaves[node * LEAF_SIZE:(node + 1) * LEAF_SIZE])
+            return
+        offset = node * FANOUT
+        span = FANOUT ** level
+        for index in range(FANOUT):
+            self._read(self._nodes[offset + index], level - 1, first + index * span, colors)
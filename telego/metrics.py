@@ -0,0 +1,331 @@
+"""Counters, gauges and latency histograms
+
+Metrics are registered once at import time of the module they measure, and are
+exported in the Prometheus text exposition format. Recording does nothing until
+the registry is enabled, so instrumented code costs one attribute check when
+metrics are turned off.
+"""
+import abc
+import bisect
+import http.server
+import logging
+import threading
+import time
+
+__ALL__ = ['Registry', 'REGISTRY', 'counter', 'gauge', 'histogram', 'add_collector', 'enable', 'is_enabled',
+           'MetricsServer']
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(abc.ABC):
+    type = None
+
+    def __init__(self, registry, name, help, labels):
+        self._registry = registry
+        self.name = name
+        self.help = help
+        self._label_names = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self._label_names:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """Get metric of label values
+
+        """
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self._label_names):
+                raise ValueError('Expected labels {}'.format(self._label_names))
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    @abc.abstractmethod
+    def _child(self):
+        """Create metric of one set of label values
+
+        """
+
+    def expose(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.type)]
+        for values, child in sorted(self._children.items()):
+            lines.extend(child.expose(self.name, self._label_names, values))
+        return lines
+
+
+class _CounterChild:
+
+    def __init__(self, registry):
+        self._registry = registry
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._value += amount
+
+    def expose(self, name, label_names, values):
+        return ['{}{} {}'.format(name, _format_labels(label_names, values), _format_value(self._value))]
+
+
+class _GaugeChild(_CounterChild):
+
+    def set(self, value):
+        if not self._registry.enabled:
+            return
+        self._value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class _HistogramChild:
+
+    def __init__(self, registry, buckets):
+        self._registry = registry
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        if not self._registry.enabled:
+            return
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self):
+        """Context manager that observes its duration
+
+        """
+        if not self._registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self)
+
+    def expose(self, name, label_names, values):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self._buckets + (float('inf'),), counts):
+            cumulative += count
+            lines.append('{}_bucket{} {}'.format(
+                name, _format_labels(label_names, values, ('le', _format_value(bound))), cumulative))
+        lines.append('{}_sum{} {}'.format(name, _format_labels(label_names, values), repr(total)))
+        lines.append('{}_count{} {}'.format(name, _format_labels(label_names, values), cumulative))
+        return lines
+
+
+class _Timer:
+
+    def __init__(self, histogram):
+        self._histogram = histogram
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+class _NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _child(self):
+        return _CounterChild(self._registry)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def _child(self):
+        return _GaugeChild(self._registry)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, help, labels, buckets=DEFAULT_BUCKETS):
+        self._buckets = tuple(sorted(buckets))
+        super().__init__(registry, name, help, labels)
+
+    def _child(self):
+        return _HistogramChild(self._registry, self._buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+class Registry:
+    """Set of metrics and collectors
+
+    Collectors are functions returning a dict of numbers, e.g. stats() of a pool,
+    that are exported as gauges named prefix_key when metrics are scraped.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(self, name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._register(Gauge(self, name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, help, labels, buckets))
+
+    def add_collector(self, prefix, func, help=''):
+        """Export numbers returned by func as gauges
+
+        :param prefix: metric name prefix
+        :param func: callable returning dict of name to number
+        """
+        with self._lock:
+            self._collectors.append((prefix, func, help))
+
+    def expose(self):
+        """Render metrics in text exposition format
+
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        for prefix, func, help in collectors:
+            try:
+                values = func()
+            except Exception as e:
+                logger.warning('expose: collector {} failed: {}'.format(prefix, e))
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = '{}_{}'.format(prefix, key)
+                lines.append('# HELP {} {}'.format(name, help or key))
+                lines.append('# TYPE {} gauge'.format(name))
+                lines.append('{} {}'.format(name, _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError('Metric already registered: {}'.format(metric.name))
+            self._metrics[metric.name] = metric
+        return metric
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+add_collector = REGISTRY.add_collector
+
+
+def enable(enabled=True):
+    REGISTRY.enabled = enabled
+
+
+def is_enabled():
+    return REGISTRY.enabled
+
+
+class MetricsServer:
+    """Serve metrics over HTTP in a background thread
+
+    """
+
+    def __init__(self, port, host='0.0.0.0', registry=REGISTRY):
+        self._address = (host, port)
+        self._registry = registry
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        registry = self._registry
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.expose().encode('utf8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug('metrics: ' + format % args)
+
+        self._server = http.server.ThreadingHTTPServer(self._address, Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
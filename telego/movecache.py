@@ -0,0 +1,286 @@
+"""Cache of engine moves by position
+
+Games often pass through the same positions, especially in the opening.
+MoveCache remembers which moves the engine chose in a position, so the computer can
+answer from the cache instead of thinking again. Moves are counted, and a hit picks
+one of the remembered moves weighted by how often the engine chose it.
+
+An opening book is a cache file filled by engine self-play:
+
+    python -m telego.movecache book.db --command pachi --games 100 --depth 10
+"""
+import argparse
+import logging
+import random
+import shlex
+import sqlite3
+import threading
+from .board import Board
+from .cache import LRUCache
+from .gtp.base import GTP, ResponseType
+from .gtp.commands import Boardsize, ClearBoard, Genmove, Komi
+from .gtp.entities import Move, StoneColor
+
+__ALL__ = ['MoveCache', 'generate_book']
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS moves (
+    board_size INTEGER NOT NULL,
+    hash INTEGER NOT NULL,
+    color TEXT NOT NULL,
+    komi REAL NOT NULL,
+    engine TEXT NOT NULL,
+    move TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (board_size, hash, color, komi, engine, move)
+);
+'''
+
+
+def _signed(value):
+    """Map 64-bit unsigned hash to SQLite's signed integer range
+
+    """
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class MoveCache:
+    """In-memory LRU of engine moves, backed by an optional SQLite file
+
+    Positions deeper than max_depth moves are not cached, since they rarely repeat.
+    randomness is the probability that a lookup is skipped so the engine thinks
+    anyway, which keeps games from becoming fully deterministic and lets the cache
+    learn more moves.
+    """
+
+    def __init__(self, capacity=4096, path=None, engine_id='', max_depth=20, randomness=0.0, batch_size=64):
+        """
+        :param capacity: positions kept in memory
+        :param path: SQLite file of the cache, None to keep cache in memory only
+        :param engine_id: name of engine and its settings, moves of other engines are not shared
+        :param max_depth: number of moves from the empty board up to which positions are cached
+        :param randomness: probability to skip the cache on lookup
+        :param batch_size: number of writes committed at once
+        """
+        if not 0 <= randomness <= 1:
+            raise ValueError('Randomness must be between 0 and 1')
+        self._memory = LRUCache(capacity)
+        self._path = path
+        self._engine_id = engine_id
+        self._max_depth = max_depth
+        self._randomness = randomness
+        self._batch_size = batch_size
+        self._random = random.Random()
+        self._connection = None
+        self._pending = 0
+        self._lock = threading.RLock()
+        self._lookups = 0
+        self._hits = 0
+        self._skipped = 0
+        self._records = 0
+
+    @property
+    def max_depth(self):
+        return self._max_depth
+
+    def open(self):
+        if self._path is None:
+            return
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.executescript(_SCHEMA)
+        self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.commit()
+                self._connection.close()
+                self._connection = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def key(self, board, color, komi):
+        return board.size, board.hash, StoneColor(color).value, float(komi), self._engine_id
+
+    def lookup(self, board, color, komi, depth):
+        """Find a move engine chose before in this position
+
+        :param board: Board before the move
+        :param color: color to move
+        :param komi: komi of the game
+        :param depth: number of moves played so far
+        :return: Move, or None on miss
+        """
+        with self._lock:
+            self._lookups += 1
+            if depth >= self._max_depth:
+                return None
+            if self._randomness and self._random.random() < self._randomness:
+                self._skipped += 1
+                return None
+            counts = self._counts(self.key(board, color, komi))
+            if not counts:
+                return None
+            self._hits += 1
+            moves = list(counts)
+            return Move(self._random.choices(moves, weights=[counts[move] for move in moves])[0])
+
+    def record(self, board, color, komi, depth, move):
+        """Remember move engine chose
+
+        Passes and resignations are not cached, since they depend on the game rather
+        than the position.
+
+        :param board: Board before the move
+        """
+        move = Move(move)
+        if depth >= self._max_depth or move == Move.PASS or move == Move.RESIGN:
+            return
+        key = self.key(board, color, komi)
+        with self._lock:
+            counts = dict(self._counts(key))
+            counts[move.value] = counts.get(move.value, 0) + 1
+            self._memory.put(key, counts)
+            self._records += 1
+            if self._connection is not None:
+                board_size, position_hash, color_value, komi_value, engine_id = key
+                self._connection.execute(
+                    'INSERT INTO moves VALUES (?, ?, ?, ?, ?, ?, 1) '
+                    'ON CONFLICT (board_size, hash, color, komi, engine, move) DO UPDATE SET count = count + 1',
+                    (board_size, _signed(position_hash), color_value, komi_value, engine_id, move.value))
+                self._pending += 1
+                if self._pending >= self._batch_size:
+                    self.flush()
+
+    def load_book(self, path):
+        """Merge opening book file into cache file
+
+        Only moves of this cache's engine_id are merged. Without a cache file the book
+        is loaded into memory, as far as capacity allows.
+
+        :return: number of book entries
+        """
+        book = sqlite3.connect(path)
+        try:
+            rows = book.execute('SELECT board_size, hash, color, komi, move, count FROM moves WHERE engine = ?',
+                                (self._engine_id,)).fetchall()
+        finally:
+            book.close()
+        with self._lock:
+            self._memory.clear()
+            if self._connection is not None:
+                self._connection.executemany(
+                    'INSERT INTO moves VALUES (?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (board_size, hash, color, komi, engine, move) '
+                    'DO UPDATE SET count = count + excluded.count',
+                    [(board_size, position_hash, color, komi, self._engine_id, move, count)
+                     for board_size, position_hash, color, komi, move, count in rows])
+                self._connection.commit()
+            else:
+                positions = {}
+                for board_size, position_hash, color, komi, move, count in rows:
+                    key = board_size, position_hash % (1 << 64), color, komi, self._engine_id
+                    positions.setdefault(key, {})[move] = count
+                for key, counts in positions.items():
+                    self._memory.put(key, counts)
+        logger.info('load_book: loaded {} moves from {}'.format(len(rows), path))
+        return len(rows)
+
+    def flush(self):
+        with self._lock:
+            if self._connection is not None and self._pending:
+                self._connection.commit()
+                self._pending = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'positions': len(self._memory),
+                'lookups': self._lookups,
+                'hits': self._hits,
+                'hit_rate': self._hits / self._lookups if self._lookups else 0.0,
+                'skipped': self._skipped,
+                'records': self._records,
+            }
+
+    def _counts(self, key):
+        counts = self._memory.get(key)
+        if counts is None and self._connection is not None:
+            board_size, position_hash, color, komi, engine_id = key
+            counts = dict(self._connection.execute(
+                'SELECT move, count FROM moves '
+                'WHERE board_size = ? AND hash = ? AND color = ? AND komi = ? AND engine = ?',
+                (board_size, _signed(position_hash), color, komi, engine_id)))
+            self._memory.put(key, counts)
+        return counts
+
+
+def generate_book(gtp, cache, board_size=9, komi=5.5, games=100, depth=10):
+    """Fill cache with opening moves of engine self-play
+
+    Engines choose among good moves at random, so repeated games from the empty board
+    explore several opening lines.
+
+    :param gtp: opened GTP connection
+    :param cache: MoveCache whose max_depth is at least depth
+    :return: number of recorded moves
+    """
+    recorded = 0
+    for number in range(games):
+        for response in gtp.pipeline([Boardsize(board_size), ClearBoard(), Komi(komi)]):
+            if response.type == ResponseType.ERROR:
+                raise ValueError('Engine rejected game settings: {}'.format(response.content))
+        board = Board(board_size)
+        color = StoneColor.BLACK
+        for ply in range(depth):
+            gtp.send_command(Genmove(color))
+            response = gtp.recv_response()
+            if response.type == ResponseType.ERROR:
+                raise ValueError('Engine failed to play: {}'.format(response.content))
+            move = Move(response.content)
+            if move == Move.PASS or move == Move.RESIGN:
+                break
+            cache.record(board, color, komi, ply, move)
+            board.play(color, move)
+            recorded += 1
+            color = StoneColor.WHITE if color == StoneColor.BLACK else StoneColor.BLACK
+        logger.info('generate_book: game {} done'.format(number + 1))
+    cache.flush()
+    return recorded
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate opening book by engine self-play')
+    parser.add_argument('path', help='book file, moves are added to an existing book')
+    parser.add_argument('--command', required=True, help='engine command line')
+    parser.add_argument('--engine-id', help='engine id used by the bot, default is the command')
+    parser.add_argument('--size', type=int, default=9)
+    parser.add_argument('--komi', type=float, default=5.5)
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    gtp = GTP(shlex.split(args.command))
+    gtp.open()
+    cache = MoveCache(path=args.path, engine_id=args.engine_id or args.command, max_depth=args.depth)
+    cache.open()
+    try:
+        recorded = generate_book(gtp, cache, board_size=args.size, komi=args.komi, games=args.games,
+                                 depth=args.depth)
+    finally:
+        cache.close()
+        gtp.close()
+    print('recorded {} moves'.format(recorded))
+
+
+if __name__ == '__main__':
+    main()
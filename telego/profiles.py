@@ -0,0 +1,156 @@
+"""Engine profiles of difficulty tiers
+
+A profile names an engine command line, its time per move and the capacity of its
+tier: engines in its pool, thinking slots and queue length of its scheduler. Every
+tier gets its own engines and scheduler, so games of a cheap tier never wait
+behind games of an expensive one. Latency of computer moves and time engines
+spent thinking are accounted per tier.
+
+Profiles are written as NAME [KEY=VALUE ...] -- COMMAND and separated by ';', e.g.
+
+    easy max_engines=8 move_time=1 -- gnugo --mode gtp --level 1; hard max_engines=2 move_time=10 -- pachi
+"""
+import re
+import shlex
+import threading
+from . import metrics
+
+__ALL__ = ['EngineProfile', 'parse_profiles', 'Tier']
+
+TIER_MOVE_SECONDS = metrics.histogram('telego_tier_move_seconds',
+                                      'Time from the command of a chat to the computer move by tier', ('tier',))
+TIER_ENGINE_SECONDS = metrics.counter('telego_tier_engine_seconds_total',
+                                      'Seconds engines spent on computer moves by tier', ('tier',))
+
+_NAME = re.compile(r'^[a-z][a-z0-9_]*$')
+_OPTIONS = {
+    'min_engines': int,
+    'max_engines': int,
+    'slots': int,
+    'max_queue': int,
+    'move_time': int,
+}
+
+
+class EngineProfile:
+    """Engine command and capacity of a tier
+
+    """
+
+    def __init__(self, name, command, min_engines=0, max_engines=4, slots=None, max_queue=64, move_time=None):
+        """
+        :param name: tier name, players choose it by name or by 1-based position
+        :param command: engine command
+        :param min_engines: engines kept warm
+        :param max_engines: engines at most
+        :param slots: computer moves thought at once, None for number of CPUs
+        :param max_queue: computer moves waiting for a slot before players are told the server is busy
+        :param move_time: seconds engine thinks per move, None for engine default
+        """
+        if not _NAME.match(name):
+            raise ValueError('Invalid profile name: {!r}'.format(name))
+        if min_engines < 0 or max_engines < 1 or min_engines > max_engines:
+            raise ValueError('Invalid engines of profile {}: min_engines={} max_engines={}'.format(
+                name, min_engines, max_engines))
+        self.name = name
+        self.command = command
+        self.min_engines = min_engines
+        self.max_engines = max_engines
+        self.slots = slots or None
+        self.max_queue = max_queue
+        self.move_time = move_time or None
+
+    @classmethod
+    def parse(cls, text):
+        """Parse NAME [KEY=VALUE ...] -- COMMAND
+
+        """
+        tokens = shlex.split(text)
+        if '--' not in tokens:
+            raise ValueError('Expected NAME [KEY=VALUE ...] -- COMMAND: {!r}'.format(text))
+        split = tokens.index('--')
+        head, command = tokens[:split], tokens[split + 1:]
+        if len(head) < 1 or not command:
+            raise ValueError('Expected NAME [KEY=VALUE ...] -- COMMAND: {!r}'.format(text))
+        options = {}
+        for option in head[1:]:
+            key, sep, value = option.partition('=')
+            if not sep or key not in _OPTIONS:
+                raise ValueError('Unknown profile option: {!r}'.format(option))
+            options[key] = _OPTIONS[key](value)
+        return cls(head[0].lower(), command, **options)
+
+
+def parse_profiles(text):
+    """Parse profiles separated by ';'
+
+    :return: list of EngineProfile in the given order
+    """
+    profiles = [EngineProfile.parse(entry) for entry in text.split(';') if entry.strip()]
+    names = [profile.name for profile in profiles]
+    if len(set(names)) != len(names):
+        raise ValueError('Duplicate profile names: {}'.format(', '.join(names)))
+    return profiles
+
+
+class Tier:
+    """Engines, scheduler and accounting of one difficulty tier
+
+    """
+
+    def __init__(self, name, gtp_factory=None, gtp_command=None, scheduler=None, time_control=None, move_cache=None):
+        """
+        :param gtp_factory: callable that takes the key of a game, its chat id, and returns GTP connection of a new
+                            blocking game
+        :param gtp_command: engine command of asyncio games
+        :param scheduler: started GenmoveScheduler of tier, None to play computer moves right away
+        :param time_control: time control of tier, None to keep engine default
+        :param move_cache: MoveCache of tier's engine, None to always ask engine
+        """
+        self.name = name
+        self.gtp_factory = gtp_factory
+        self.gtp_command = gtp_command
+        self.scheduler = scheduler
+        self.time_control = time_control
+        self.move_cache = move_cache
+        self._lock = threading.Lock()
+        self._move_seconds = TIER_MOVE_SECONDS.labels(name)
+        self._engine_seconds = TIER_ENGINE_SECONDS.labels(name)
+        self._games = 0
+        self._moves = 0
+        self._latency = 0.0
+        self._max_latency = 0.0
+        self._engine_time = 0.0
+
+    def game_started(self):
+        with self._lock:
+            self._games += 1
+
+    def engine_used(self, seconds):
+        """Record time an engine spent on a computer move
+
+        """
+        self._engine_seconds.inc(seconds)
+        with self._lock:
+            self._engine_time += seconds
+
+    def move_played(self, latency):
+        """Record latency of a computer move shown to the player
+
+        """
+        self._move_seconds.observe(latency)
+        with self._lock:
+            self._moves += 1
+            self._latency += latency
+            self._max_latency = max(self._max_latency, latency)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'games': self._games,
+                'moves': self._moves,
+                'latency_mean': self._latency / self._moves if self._moves else 0.0,
+                'latency_max': self._max_latency,
+                'engine_seconds': self._engine_time,
+                'engine_seconds_per_move': self._engine_time / self._moves if self._moves else 0.0,
+            }
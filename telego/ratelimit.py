@@ -0,0 +1,60 @@
+"""Token bucket rate limiting
+
+"""
+import threading
+import time
+
+__ALL__ = ['TokenBucket']
+
+
+class TokenBucket:
+    """Allow rate events per second with bursts up to capacity
+
+    """
+
+    def __init__(self, rate, capacity):
+        if rate <= 0 or capacity <= 0:
+            raise ValueError('Rate and capacity must be positive')
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, tokens=1):
+        """Take tokens if available
+
+        :return: True if tokens were taken
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def refund(self, tokens=1):
+        """Give back tokens taken for an event that did not happen
+
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._capacity, self._tokens + tokens)
+
+    def delay(self, tokens=1):
+        """Seconds until tokens are available
+
+        """
+        with self._lock:
+            self._refill()
+            return max(tokens - self._tokens, 0) / self._rate
+
+    def is_full(self):
+        with self._lock:
+            self._refill()
+            return self._tokens >= self._capacity
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
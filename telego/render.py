@@ -0,0 +1,232 @@
+"""Board renderers
+
+Renderers cache their output by board size and position hash, so rendering the
+same position again is a dictionary lookup.
+"""
+import struct
+import zlib
+from .board import COLUMN_LETTERS
+from .cache import LRUCache
+from . import metrics
+
+__ALL__ = ['AsciiRenderer', 'ImageRenderer']
+
+RENDER_SECONDS = metrics.histogram('telego_render_seconds', 'Time to render a board, including cache hits',
+                                   ('renderer',))
+_text_render_seconds = RENDER_SECONDS.labels('text')
+_image_render_seconds = RENDER_SECONDS.labels('image')
+
+
+class AsciiRenderer:
+    """Render board as ascii text
+
+    """
+
+    def __init__(self, cache_size=256):
+        self._cache = LRUCache(cache_size)
+
+    @staticmethod
+    def key(board):
+        return board.size, board.hash
+
+    def render(self, board):
+        with _text_render_seconds.time():
+            key = self.key(board)
+            text = self._cache.get(key)
+            if text is None:
+                text = board.render()
+                self._cache.put(key, text)
+            return text
+
+
+_WOOD = 0
+_INK = 1
+_STONE_WHITE = 2
+_PALETTE = bytes((219, 176, 94, 20, 20, 20, 245, 245, 245))
+
+_FONT = {
+    '0': ('###', '#.#', '#.#', '#.#', '###'), '1': ('.#.', '##.', '.#.', '.#.', '###'),
+    '2': ('###', '..#', '###', '#..', '###'), '3': ('###', '..#', '###', '..#', '###'),
+    '4': ('#.#', '#.#', '###', '..#', '..#'), '5': ('###', '#..', '###', '..#', '###'),
+    '6': ('###', '#..', '###', '#.#', '###'), '7': ('###', '..#', '..#', '.#.', '.#.'),
+    '8': ('###', '#.#', '###', '#.#', '###'), '9': ('###', '#.#', '###', '..#', '###'),
+    'A': ('.#.', '#.#', '###', '#.#', '#.#'), 'B': ('##.', '#.#', '##.', '#.#', '##.'),
+    'C': ('.##', '#..', '#..', '#..', '.##'), 'D': ('##.', '#.#', '#.#', '#.#', '##.'),
+    'E': ('###', '#..', '##.', '#..', '###'), 'F': ('###', '#..', '##.', '#..', '#..'),
+    'G': ('.##', '#..', '#.#', '#.#', '.##'), 'H': ('#.#', '#.#', '###', '#.#', '#.#'),
+    'J': ('..#', '..#', '..#', '#.#', '.#.'), 'K': ('#.#', '#.#', '##.', '#.#', '#.#'),
+    'L': ('#..', '#..', '#..', '#..', '###'), 'M': ('#.#', '###', '###', '#.#', '#.#'),
+    'N': ('##.', '#.#', '#.#', '#.#', '#.#'), 'O': ('.#.', '#.#', '#.#', '#.#', '.#.'),
+    'P': ('##.', '#.#', '##.', '#..', '#..'), 'Q': ('.#.', '#.#', '#.#', '##.', '.##'),
+    'R': ('##.', '#.#', '##.', '#.#', '#.#'), 'S': ('.##', '#..', '.#.', '..#', '##.'),
+    'T': ('###', '.#.', '.#.', '.#.', '.#.'), 'U': ('#.#', '#.#', '#.#', '#.#', '###'),
+    'V': ('#.#', '#.#', '#.#', '#.#', '.#.'), 'W': ('#.#', '#.#', '###', '###', '#.#'),
+    'X': ('#.#', '#.#', '.#.', '#.#', '#.#'), 'Y': ('#.#', '#.#', '.#.', '.#.', '.#.'),
+    'Z': ('###', '..#', '.#.', '#..', '###'),
+}
+
+
+def _star_points(size):
+    if size < 7:
+        return set()
+    edge = 3 if size >= 13 else 2
+    lines = [edge, size - 1 - edge]
+    if size % 2 == 1:
+        lines.append(size // 2)
+    return {(row, col) for row in lines for col in lines}
+
+
+def _png(width, height, rows):
+    """Encode palette image as PNG
+
+    :param rows: rows of palette indices, one byte per pixel
+    :return: PNG bytes
+    """
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    raw = b''.join(b'\x00' + row for row in rows)
+    return b''.join((
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)),
+        chunk(b'PLTE', _PALETTE),
+        chunk(b'IDAT', zlib.compress(raw, 6)),
+        chunk(b'IEND', b''),
+    ))
+
+
+class ImageRenderer:
+    """Render board as PNG image
+
+    The image is assembled row by row from tiles that are drawn once per point
+    kind, and encoded without any imaging library.
+    """
+
+    def __init__(self, cache_size=256, point_size=24):
+        if point_size < 12:
+            raise ValueError('Point size must be at least 12')
+        self._cache = LRUCache(cache_size)
+        self._point_size = point_size
+        self._tiles = {}
+
+    @staticmethod
+    def key(board):
+        return board.size, board.hash
+
+    def render(self, board):
+        """Render board
+
+        :return: PNG bytes
+        """
+        with _image_render_seconds.time():
+            key = self.key(board)
+            image = self._cache.get(key)
+            if image is None:
+                image = self._render(board)
+                self._cache.put(key, image)
+            return image
+
+    def _render(self, board):
+        size = board.size
+        point_size = self._point_size
+        stars = _star_points(size)
+        blank = self._tile(('label', ''))
+        header = [blank] + [self._tile(('label', COLUMN_LETTERS[col])) for col in range(size)] + [blank]
+        grid_rows = []
+        for row in range(size - 1, -1, -1):
+            label = self._tile(('label', str(row + 1)))
+            tiles = [label]
+            for col in range(size):
+                color = board.get(row, col)
+                edges = (self._edge(row, size), self._edge(col, size))
+                if color is not None:
+                    tiles.append(self._tile(('stone', color, edges)))
+                else:
+                    tiles.append(self._tile(('point', (row, col) in stars, edges)))
+            tiles.append(label)
+            grid_rows.append(tiles)
+        rows = []
+        for tiles in [header] + grid_rows + [header]:
+            for y in range(point_size):
+                rows.append(b''.join(tile[y] for tile in tiles))
+        width = point_size * (size + 2)
+        return _png(width, width, rows)
+
+    @staticmethod
+    def _edge(index, size):
+        if index == 0:
+            return -1
+        if index == size - 1:
+            return 1
+        return 0
+
+    def _tile(self, kind):
+        tile = self._tiles.get(kind)
+        if tile is None:
+            if kind[0] == 'label':
+                pixels = self._draw_label(kind[1])
+            elif kind[0] == 'point':
+                pixels = self._draw_point(kind[1], kind[2])
+            else:
+                pixels = self._draw_stone(kind[1], kind[2])
+            tile = self._tiles[kind] = [bytes(row) for row in pixels]
+        return tile
+
+    def _blank(self):
+        return [bytearray([_WOOD]) * self._point_size for _ in range(self._point_size)]
+
+    def _draw_point(self, star, edges):
+        point_size = self._point_size
+        pixels = self._blank()
+        center = point_size // 2
+        row_edge, col_edge = edges
+        top = center if row_edge == 1 else 0
+        bottom = center if row_edge == -1 else point_size - 1
+        left = center if col_edge == -1 else 0
+        right = center if col_edge == 1 else point_size - 1
+        for y in range(top, bottom + 1):
+            pixels[y][center] = _INK
+        for x in range(left, right + 1):
+            pixels[center][x] = _INK
+        if star:
+            radius = max(point_size // 10, 2)
+            for y in range(center - radius, center + radius + 1):
+                for x in range(center - radius, center + radius + 1):
+                    if (y - center) ** 2 + (x - center) ** 2 <= radius * radius:
+                        pixels[y][x] = _INK
+        return pixels
+
+    def _draw_stone(self, color, edges):
+        point_size = self._point_size
+        pixels = self._draw_point(False, edges)
+        center = point_size // 2
+        radius = point_size / 2 - 1
+        fill = _INK if color == 'b' else _STONE_WHITE
+        for y in range(point_size):
+            for x in range(point_size):
+                distance = ((y - center) ** 2 + (x - center) ** 2) ** 0.5
+                if distance <= radius - 1.2:
+                    pixels[y][x] = fill
+                elif distance <= radius:
+                    pixels[y][x] = _INK
+        return pixels
+
+    def _draw_label(self, text):
+        point_size = self._point_size
+        pixels = self._blank()
+        if not text:
+            return pixels
+        scale = max(point_size // 12, 1)
+        width = (len(text) * 4 - 1) * scale
+        left = (point_size - width) // 2
+        top = (point_size - 5 * scale) // 2
+        for index, char in enumerate(text):
+            for glyph_y, line in enumerate(_FONT[char]):
+                for glyph_x, bit in enumerate(line):
+                    if bit != '#':
+                        continue
+                    for dy in range(scale):
+                        for dx in range(scale):
+                            pixels[top + glyph_y * scale + dy][left + (index * 4 + glyph_x) * scale + dx] = _INK
+        return pixels
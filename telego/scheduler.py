@@ -0,0 +1,222 @@
+"""Scheduling of computer moves
+
+Engines thinking at the same time compete for CPU, so GenmoveScheduler runs at
+most a fixed number of computer moves at once. Waiting moves are served round
+robin by chat, chats are rate limited, and new moves are refused when the queue
+is full.
+"""
+import collections
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from .ratelimit import TokenBucket
+
+__ALL__ = ['GenmoveScheduler', 'Ticket', 'SchedulerQueueFullError', 'SchedulerRateLimitedError']
+
+logger = logging.getLogger(__name__)
+
+
+class Ticket:
+    """Queued computer move
+
+    position is the place in line when the move was queued, 1 means next. queued and
+    started are the monotonic times when the move was queued and when it got a
+    thinking slot.
+    """
+
+    def __init__(self, chat_id, func, position):
+        self.chat_id = chat_id
+        self.func = func
+        self.position = position
+        self.queued = time.monotonic()
+        self.started = None
+        self.future = concurrent.futures.Future()
+
+    def add_done_callback(self, callback):
+        self.future.add_done_callback(callback)
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class GenmoveScheduler:
+    """Run queued jobs on a bounded number of thinking slots
+
+    """
+
+    def __init__(self, slots=None, max_queue=64, chat_rate=None, chat_burst=3):
+        """
+        :param slots: number of jobs that run at once, default is number of CPUs
+        :param max_queue: number of waiting jobs before admission is refused
+        :param chat_rate: admitted moves per second of each chat, None for no limit
+        :param chat_burst: moves a chat may make in a burst
+        """
+        self._slots = slots or os.cpu_count() or 1
+        self._max_queue = max_queue
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._queues = {}
+        self._order = collections.deque()
+        self._buckets = {}
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._rate_limited = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._workers = []
+
+    @property
+    def slots(self):
+        return self._slots
+
+    def start(self):
+        for index in range(self._slots):
+            worker = threading.Thread(target=self._work, name='genmove-slot-{}'.format(index), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def admit(self, chat_id):
+        """Check whether chat may queue another move
+
+        Call after the player's move is checked and before it is played, so invalid
+        moves cost nothing and a refused move leaves the game unchanged.
+
+        :raise SchedulerQueueFullError: too many moves are waiting
+        :raise SchedulerRateLimitedError: chat plays too fast
+        """
+        with self._cond:
+            if self._queued >= self._max_queue:
+                self._rejected += 1
+                raise SchedulerQueueFullError()
+            if self._chat_rate:
+                bucket = self._buckets.get(chat_id)
+                if bucket is None:
+                    bucket = self._buckets[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+                if not bucket.consume():
+                    self._rate_limited += 1
+                    raise SchedulerRateLimitedError(bucket.delay())
+                self._forget_full_buckets()
+
+    def submit(self, chat_id, func):
+        """Queue job of chat
+
+        :param chat_id: chat that owns the job
+        :param func: callable that makes computer play
+        :return: Ticket
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('Scheduler is stopped')
+            queue = self._queues.get(chat_id)
+            if queue is None:
+                queue = self._queues[chat_id] = collections.deque()
+                self._order.append(chat_id)
+            ticket = Ticket(chat_id, func, self._position(chat_id, len(queue)))
+            queue.append(ticket)
+            self._queued += 1
+            self._cond.notify()
+            return ticket
+
+    def position(self, chat_id):
+        """Place in line that the next job of chat would get
+
+        """
+        with self._cond:
+            return self._position(chat_id, len(self._queues.get(chat_id, ())))
+
+    def queue_depth(self):
+        with self._cond:
+            return self._queued
+
+    def stats(self):
+        with self._cond:
+            return {
+                'slots': self._slots,
+                'running': self._running,
+                'queued': self._queued,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'rate_limited': self._rate_limited,
+            }
+
+    def _position(self, chat_id, index):
+        """Place in line of the index-th job of chat, served round robin
+
+        """
+        ahead = self._running
+        passed = False
+        for other in self._order:
+            if other == chat_id:
+                passed = True
+                continue
+            ahead += min(len(self._queues[other]), index if passed else index + 1)
+        return max(ahead + index - self._slots, 0) + 1
+
+    def _forget_full_buckets(self):
+        if len(self._buckets) > 4 * self._max_queue:
+            self._buckets = {chat_id: bucket for chat_id, bucket in self._buckets.items() if not bucket.is_full()}
+
+    def _next(self):
+        with self._cond:
+            while not self._order and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return None
+            chat_id = self._order.popleft()
+            queue = self._queues[chat_id]
+            ticket = queue.popleft()
+            if queue:
+                self._order.append(chat_id)
+            else:
+                del self._queues[chat_id]
+            self._queued -= 1
+            self._running += 1
+            ticket.started = time.monotonic()
+            return ticket
+
+    def _work(self):
+        while True:
+            ticket = self._next()
+            if ticket is None:
+                return
+            if ticket.future.set_running_or_notify_cancel():
+                try:
+                    result = ticket.func()
+                except BaseException as e:
+                    logger.warning('_work: job of chat {} failed: {}'.format(ticket.chat_id, e))
+                    with self._cond:
+                        self._running -= 1
+                    ticket.future.set_exception(e)
+                    continue
+                with self._cond:
+                    self._running -= 1
+                    self._completed += 1
+                ticket.future.set_result(result)
+            else:
+                with self._cond:
+                    self._running -= 1
+
+
+class SchedulerQueueFullError(Exception):
+    pass
+
+
+class SchedulerRateLimitedError(Exception):
+    """Chat plays too fast
+
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
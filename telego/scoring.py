@@ -0,0 +1,195 @@
+"""Local area scoring
+
+Tromp-Taylor area scoring without an engine: a player's score is the number of
+their stones plus the empty points that reach only their stones. Stones listed as
+dead, e.g. by the engine's final_status_list dead, are removed first.
+
+Many positions of the same board size are scored at once with NumPy when it is
+installed, by growing the area reached by each color over empty points for all
+positions together. Without NumPy every position is flood filled in Python.
+"""
+from .board import EMPTY, BLACK, WHITE, _neighbor_table
+from .gtp.base import ResponseType
+from .gtp.commands import FinalStatusList
+from .gtp.entities import Move
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__ALL__ = ['Score', 'area_score', 'score_batch', 'parse_vertices', 'dead_stones']
+
+
+class Score:
+    """Area of each color and komi
+
+    """
+
+    __slots__ = ('black', 'white', 'komi')
+
+    def __init__(self, black, white, komi=0.0):
+        self.black = int(black)
+        self.white = int(white)
+        self.komi = float(komi)
+
+    @property
+    def margin(self):
+        """Black area minus white area and komi
+
+        """
+        return self.black - self.white - self.komi
+
+    @property
+    def winner(self):
+        """'b', 'w', or None for a draw
+
+        """
+        if self.margin > 0:
+            return 'b'
+        if self.margin < 0:
+            return 'w'
+        return None
+
+    def __str__(self):
+        """Result in GTP final_score format, e.g. B+3.5, W+0.5 or 0
+
+        """
+        margin = self.margin
+        if margin > 0:
+            return 'B+{:g}'.format(margin)
+        if margin < 0:
+            return 'W+{:g}'.format(-margin)
+        return '0'
+
+    def __repr__(self):
+        return '<Score {} black={} white={} komi={}>'.format(self, self.black, self.white, self.komi)
+
+
+def parse_vertices(text):
+    """Parse vertex list of final_status_list
+
+    :param text: response content, vertices separated by spaces or lines
+    :return: list of Move
+    """
+    return [Move(vertex) for vertex in (text or '').split()]
+
+
+def dead_stones(gtp):
+    """Ask engine for dead stones
+
+    :param gtp: opened GTP connection holding the position
+    :return: list of Move, empty if engine does not answer
+    """
+    response, = gtp.pipeline([FinalStatusList('dead')])
+    if response.type != ResponseType.SUCCESS:
+        return []
+    return parse_vertices(response.content)
+
+
+def _colors(board, dead):
+    colors = list(board.colors)
+    for move in dead:
+        colors[Move(move).index(board.size)] = EMPTY
+    return colors
+
+
+def area_score(board, komi=0.0, dead=()):
+    """Score position by Tromp-Taylor rules
+
+    :param board: Board
+    :param komi: komi
+    :param dead: dead stones as moves, removed before scoring
+    :return: Score
+    """
+    black, white = _area(_colors(board, dead), board.size)
+    return Score(black, white, komi)
+
+
+def _area(colors, size):
+    neighbors = _neighbor_table(size)
+    area = {EMPTY: 0, BLACK: 0, WHITE: 0}
+    for color in colors:
+        area[color] += 1
+    seen = bytearray(len(colors))
+    for start, color in enumerate(colors):
+        if color != EMPTY or seen[start]:
+            continue
+        seen[start] = 1
+        stack = [start]
+        region = 0
+        borders = 0
+        while stack:
+            point = stack.pop()
+            region += 1
+            for neighbor in neighbors[point]:
+                neighbor_color = colors[neighbor]
+                if neighbor_color != EMPTY:
+                    borders |= neighbor_color
+                elif not seen[neighbor]:
+                    seen[neighbor] = 1
+                    stack.append(neighbor)
+        if borders == BLACK or borders == WHITE:
+            area[borders] += region
+    return area[BLACK], area[WHITE]
+
+
+def score_batch(boards, komi=0.0, dead=None, use_numpy=None):
+    """Score many positions
+
+    :param boards: Boards
+    :param komi: komi of every position
+    :param dead: dead stones of every position, list of move lists, None if no stone is dead
+    :param use_numpy: score with NumPy, default when NumPy is installed
+    :return: list of Score in the order of boards
+    """
+    boards = list(boards)
+    dead = dead or [()] * len(boards)
+    colors = [_colors(board, stones) for board, stones in zip(boards, dead)]
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    if not use_numpy:
+        return [Score(*_area(position, board.size), komi=komi) for board, position in zip(boards, colors)]
+    if numpy is None:
+        raise RuntimeError('NumPy is not installed')
+    scores = [None] * len(boards)
+    by_size = {}
+    for index, board in enumerate(boards):
+        by_size.setdefault(board.size, []).append(index)
+    for size, indexes in by_size.items():
+        array = numpy.array([colors[index] for index in indexes], dtype=numpy.int8).reshape(-1, size, size)
+        for index, black, white in zip(indexes, *_area_numpy(array)):
+            scores[index] = Score(black, white, komi)
+    return scores
+
+
+def _area_numpy(colors):
+    """Area of each color of positions stacked in an array of shape (positions, size, size)
+
+    """
+    empty = colors == EMPTY
+    reach = []
+    for code in (BLACK, WHITE):
+        stones = colors == code
+        reached = stones.copy()
+        active = numpy.arange(len(colors))
+        passable = empty | stones
+        current = reached
+        # positions whose area stopped growing leave the loop
+        while len(active):
+            grown = current.copy()
+            grown[:, 1:, :] |= current[:, :-1, :]
+            grown[:, :-1, :] |= current[:, 1:, :]
+            grown[:, :, 1:] |= current[:, :, :-1]
+            grown[:, :, :-1] |= current[:, :, 1:]
+            grown &= passable
+            changed = (grown != current).any(axis=(1, 2))
+            reached[active] = grown
+            active = active[changed]
+            current = grown[changed]
+            passable = passable[changed]
+        reach.append(reached & empty)
+    black_reach, white_reach = reach
+    black = (colors == BLACK).sum(axis=(1, 2)) + (black_reach & ~white_reach).sum(axis=(1, 2))
+    white = (colors == WHITE).sum(axis=(1, 2)) + (white_reach & ~black_reach).sum(axis=(1, 2))
+    return black.tolist(), white.tolist()
@@ -0,0 +1,316 @@
+"""Engine against engine matches
+
+Every match is played by two Game instances, one per engine, each one playing its
+engine against the other engine's moves. Engines of each config are lent by a
+GTPPool, and matches run on a pool of worker threads, so many games are played at
+once. Colors alternate between games.
+
+Every finished game is written as SGF and appended to results.jsonl. The summary
+gives win rates with Wilson confidence intervals and the distribution of move
+times of each engine config.
+
+Usage: telego-selfplay --engine fast="pachi -t =2000" --engine strong="pachi -t =8000" [--games 100] [--workers 4]
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import math
+import os
+import shlex
+import sys
+import threading
+import time
+from . import sgf
+from .game import Game, GameState, GameEngineError, GameMoveInvalidError
+from .gtp.base import GTPConnectionBrokenException
+from .gtp.entities import Move, StoneColor
+from .gtp.pool import GTPPool, PooledGTP
+
+__ALL__ = ['EngineConfig', 'Match', 'SelfPlay', 'wilson_interval', 'main']
+
+logger = logging.getLogger(__name__)
+
+
+def wilson_interval(wins, games, z=1.96):
+    """Wilson score interval of a win rate
+
+    :param wins: games won, draws count as half
+    :param games: games played
+    :param z: normal quantile, 1.96 for 95%
+    :return: (low, high)
+    """
+    if not games:
+        return 0.0, 1.0
+    rate = wins / games
+    denominator = 1 + z * z / games
+    center = (rate + z * z / (2 * games)) / denominator
+    half = z * math.sqrt(rate * (1 - rate) / games + z * z / (4 * games * games)) / denominator
+    return max(center - half, 0.0), min(center + half, 1.0)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+class EngineConfig:
+    """Named engine command
+
+    """
+
+    def __init__(self, name, command):
+        self.name = name
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+
+    @classmethod
+    def parse(cls, text):
+        """Parse NAME=COMMAND
+
+        """
+        name, sep, command = text.partition('=')
+        if not sep or not name or not command:
+            raise ValueError('Expected NAME=COMMAND: {!r}'.format(text))
+        return cls(name, command)
+
+
+class Match:
+    """One game between two engines
+
+    """
+
+    def __init__(self, number, black, white, board_size=9, komi=7.5, max_moves=None):
+        """
+        :param black: pool of black engine
+        :param white: pool of white engine
+        :param max_moves: moves before the game is stopped unfinished, default 3 times the points of the board
+        """
+        self.number = number
+        self.games = {
+            StoneColor.BLACK: Game(StoneColor.WHITE, PooledGTP(black), board_size=board_size, komi=komi),
+            StoneColor.WHITE: Game(StoneColor.BLACK, PooledGTP(white), board_size=board_size, komi=komi),
+        }
+        self.board_size = board_size
+        self.komi = komi
+        self.max_moves = max_moves or board_size * board_size * 3
+        self.moves = []
+        self.latencies = {StoneColor.BLACK: [], StoneColor.WHITE: []}
+        self.result = None
+        self.error = None
+
+    def play(self):
+        """Play the game to its end
+
+        :return: result, e.g. B+3.5, W+R, 0 for a draw, or None if unfinished
+        """
+        try:
+            for game in self.games.values():
+                game.setup()
+            color = StoneColor.BLACK
+            while len(self.moves) < self.max_moves:
+                mover = self.games[color]
+                other = self.games[_opponent(color)]
+                started = time.perf_counter()
+                move = mover.computer_play()
+                self.latencies[color].append(time.perf_counter() - started)
+                self.moves.append(move)
+                if move == Move.RESIGN:
+                    self.result = '{}+R'.format(_opponent(color).value.upper())
+                    break
+                if mover.state == GameState.END:
+                    self.result = mover.final_score()
+                    break
+                other.player_play(move)
+                color = _opponent(color)
+        except (GameEngineError, GameMoveInvalidError, GTPConnectionBrokenException, OSError, ValueError) as e:
+            logger.warning('play: game {} failed: {}'.format(self.number, e))
+            self.error = str(e) or type(e).__name__
+        finally:
+            for game in self.games.values():
+                game.close()
+        return self.result
+
+    @property
+    def winner(self):
+        """Color of winner, None for draws and unfinished games
+
+        """
+        if not self.result or self.result[0] not in 'BW':
+            return None
+        return StoneColor(self.result[0].lower())
+
+
+def _opponent(color):
+    return StoneColor.WHITE if color == StoneColor.BLACK else StoneColor.BLACK
+
+
+class SelfPlay:
+    """Play matches between two engine configs and collect statistic
+
+    """
+
+    def __init__(self, engines, output_dir, games=100, workers=4, board_size=9, komi=7.5, max_moves=None):
+        """
+        :param engines: two EngineConfig
+        :param output_dir: directory for SGF files and results.jsonl
+        :param games: games to play, colors alternate
+        :param workers: games played at once
+        """
+        if len(engines) != 2:
+            raise ValueError('Expected two engine configs')
+        self._engines = engines
+        self._output_dir = output_dir
+        self._games = games
+        self._workers = workers
+        self._board_size = board_size
+        self._komi = komi
+        self._max_moves = max_moves
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._results = None
+        self.stats = {engine.name: {'games': 0, 'wins': 0.0, 'as_black': 0, 'wins_as_black': 0.0, 'latencies': []}
+                      for engine in engines}
+        self.unfinished = 0
+        self.errors = 0
+
+    def run(self, report=None):
+        """Play every game
+
+        :param report: file a line per finished game is written to, None for no progress
+        :return: summary dict
+        """
+        os.makedirs(self._output_dir, exist_ok=True)
+        for engine in self._engines:
+            pool = GTPPool(engine.command, min_size=0, max_size=self._workers, board_size=self._board_size,
+                           komi=self._komi)
+            pool.start()
+            self._pools[engine.name] = pool
+        started = time.perf_counter()
+        try:
+            with open(os.path.join(self._output_dir, 'results.jsonl'), 'a', encoding='utf8') as self._results:
+                with concurrent.futures.ThreadPoolExecutor(self._workers) as executor:
+                    futures = [executor.submit(self._play, number) for number in range(1, self._games + 1)]
+                    for future in concurrent.futures.as_completed(futures):
+                        match = future.result()
+                        if report is not None:
+                            report.write('game {}: {} {} moves\n'.format(
+                                match.number, match.result or match.error or 'unfinished', len(match.moves)))
+                            report.flush()
+        finally:
+            for pool in self._pools.values():
+                pool.close()
+        return self.summary(time.perf_counter() - started)
+
+    def summary(self, elapsed=None):
+        engines = {}
+        for name, stats in self.stats.items():
+            latencies = stats['latencies']
+            low, high = wilson_interval(stats['wins'], stats['games'])
+            engines[name] = {
+                'games': stats['games'],
+                'wins': stats['wins'],
+                'win_rate': stats['wins'] / stats['games'] if stats['games'] else 0.0,
+                'win_rate_95': [round(low, 4), round(high, 4)],
+                'win_rate_as_black': stats['wins_as_black'] / stats['as_black'] if stats['as_black'] else 0.0,
+                'moves': len(latencies),
+                'move_seconds': {
+                    'mean': sum(latencies) / len(latencies),
+                    'p50': percentile(latencies, 0.5),
+                    'p90': percentile(latencies, 0.9),
+                    'p99': percentile(latencies, 0.99),
+                    'max': max(latencies),
+                } if latencies else {},
+            }
+        summary = {'engines': engines, 'unfinished': self.unfinished, 'errors': self.errors}
+        if elapsed is not None:
+            summary['seconds'] = round(elapsed, 3)
+            summary['games_per_minute'] = sum(stats['games'] for stats in self.stats.values()) / 2 / elapsed * 60
+        return summary
+
+    def _play(self, number):
+        black, white = self._engines if number % 2 else reversed(self._engines)
+        match = Match(number, self._pools[black.name], self._pools[white.name], board_size=self._board_size,
+                      komi=self._komi, max_moves=self._max_moves)
+        match.play()
+        self._record(match, {StoneColor.BLACK: black, StoneColor.WHITE: white})
+        return match
+
+    def _record(self, match, engines):
+        text = sgf.dumps(self._board_size, self._komi, match.moves, match.result,
+                         PB=engines[StoneColor.BLACK].name, PW=engines[StoneColor.WHITE].name)
+        with open(os.path.join(self._output_dir, 'game-{:05d}.sgf'.format(match.number)), 'w', encoding='utf8') as f:
+            f.write(text)
+        record = {
+            'game': match.number,
+            'black': engines[StoneColor.BLACK].name,
+            'white': engines[StoneColor.WHITE].name,
+            'result': match.result,
+            'moves': len(match.moves),
+        }
+        if match.error is not None:
+            record['error'] = match.error
+        record['black_seconds'] = round(sum(match.latencies[StoneColor.BLACK]), 3)
+        record['white_seconds'] = round(sum(match.latencies[StoneColor.WHITE]), 3)
+        with self._lock:
+            self._results.write(json.dumps(record) + '\n')
+            self._results.flush()
+            for color, engine in engines.items():
+                self.stats[engine.name]['latencies'].extend(match.latencies[color])
+            if match.error is not None:
+                self.errors += 1
+                return
+            if match.result is None:
+                self.unfinished += 1
+                return
+            winner = match.winner
+            for color, engine in engines.items():
+                stats = self.stats[engine.name]
+                score = 0.5 if winner is None else float(winner == color)
+                stats['games'] += 1
+                stats['wins'] += score
+                if color == StoneColor.BLACK:
+                    stats['as_black'] += 1
+                    stats['wins_as_black'] += score
+
+
+def format_summary(summary):
+    lines = []
+    for name, stats in summary['engines'].items():
+        lines.append('{}: {:g}/{} wins, win rate {:.1%} (95% CI {:.1%} - {:.1%}), as black {:.1%}'.format(
+            name, stats['wins'], stats['games'], stats['win_rate'], stats['win_rate_95'][0],
+            stats['win_rate_95'][1], stats['win_rate_as_black']))
+        seconds = stats['move_seconds']
+        if seconds:
+            lines.append('  {} moves, seconds per move: mean {:.3f} p50 {:.3f} p90 {:.3f} p99 {:.3f} max {:.3f}'.format(
+                stats['moves'], seconds['mean'], seconds['p50'], seconds['p90'], seconds['p99'], seconds['max']))
+    lines.append('unfinished {}  errors {}'.format(summary['unfinished'], summary['errors']))
+    if 'seconds' in summary:
+        lines.append('{:.1f}s, {:.1f} games/min'.format(summary['seconds'], summary['games_per_minute']))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play two GTP engine configs against each other')
+    parser.add_argument('--engine', action='append', required=True, type=EngineConfig.parse,
+                        help='NAME=COMMAND, given twice')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='games played at once')
+    parser.add_argument('--board-size', type=int, default=9)
+    parser.add_argument('--komi', type=float, default=7.5)
+    parser.add_argument('--max-moves', type=int, default=None, help='moves before a game is stopped unfinished')
+    parser.add_argument('--output-dir', default='selfplay')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if len(args.engine) != 2 or args.engine[0].name == args.engine[1].name:
+        parser.error('give two --engine options with different names')
+
+    selfplay = SelfPlay(args.engine, args.output_dir, games=args.games, workers=args.workers,
+                        board_size=args.board_size, komi=args.komi, max_moves=args.max_moves)
+    summary = selfplay.run(report=sys.stderr)
+    with open(os.path.join(args.output_dir, 'summary.json'), 'w', encoding='utf8') as f:
+        json.dump(summary, f, indent=2)
+    print(format_summary(summary))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Reading and writing of SGF game records
+
+Only what is needed to replay a game is read: board size, komi, setup stones and
+the moves of the main line. Variations other than the first are skipped.
+"""
+from .gtp.entities import Move, MAX_BOARD_SIZE
+
+__ALL__ = ['SGFGame', 'parse', 'dumps', 'SGFError']
+
+
+class SGFGame:
+    """Main line of an SGF game tree
+
+    """
+
+    def __init__(self, properties, nodes):
+        """
+        :param properties: properties of the root node, dict of name to list of values
+        :param nodes: property dicts of the following nodes of the main line
+        """
+        self.properties = properties
+        self.size = int(self._get('SZ', '19').split(':')[0])
+        if not 1 <= self.size <= MAX_BOARD_SIZE:
+            raise SGFError('Unsupported board size: {}'.format(self.size))
+        self.komi = float(self._get('KM', '0') or 0)
+        self.result = self._get('RE')
+        self.setup = [(color, move) for name, color in (('AB', 'b'), ('AW', 'w'))
+                      for value in properties.get(name, ()) for move in self._points(value)]
+        self.moves = []
+        for node in [properties] + nodes:
+            for name, color in (('B', 'b'), ('W', 'w')):
+                for value in node.get(name, ()):
+                    self.moves.append((color, self._move(value)))
+
+    def _get(self, name, default=None):
+        values = self.properties.get(name)
+        return values[0] if values else default
+
+    def _points(self, value):
+        """Moves of point or compressed point list, e.g. aa:cc
+
+        """
+        if ':' not in value:
+            return [self._move(value)]
+        first, last = (self._move(point) for point in value.split(':', 1))
+        return [Move.from_point(row, col)
+                for row in range(min(first.row_index, last.row_index), max(first.row_index, last.row_index) + 1)
+                for col in range(min(first.col_index, last.col_index), max(first.col_index, last.col_index) + 1)]
+
+    def _move(self, value):
+        if value == '' or (value == 'tt' and self.size <= 19):
+            return Move.PASS
+        if len(value) != 2:
+            raise SGFError('Invalid point: {!r}'.format(value))
+        col = ord(value[0]) - ord('a')
+        row = ord(value[1]) - ord('a')
+        if not (0 <= col < self.size and 0 <= row < self.size):
+            raise SGFError('Point outside board: {!r}'.format(value))
+        return Move.from_point(self.size - 1 - row, col)
+
+
+def parse(text):
+    """Parse SGF collection
+
+    :param text: SGF text
+    :return: list of SGFGame, one per game tree
+    """
+    parser = _Parser(text)
+    games = []
+    while parser.skip_space():
+        nodes = parser.game_tree()
+        if nodes:
+            games.append(SGFGame(nodes[0], nodes[1:]))
+    return games
+
+
+def dumps(size, komi, moves, result=None, **properties):
+    """Write game as SGF
+
+    :param size: board size
+    :param komi: komi
+    :param moves: moves in play order, black plays first, resign moves are skipped
+    :param result: game result, e.g. B+3.5
+    :param properties: more root properties, e.g. PB='pachi'
+    :return: SGF text
+    """
+    root = [('GM', 1), ('FF', 4), ('SZ', size), ('KM', komi)]
+    if result is not None:
+        root.append(('RE', result))
+    root.extend(sorted(properties.items()))
+    text = ['(;', ''.join('{}[{}]'.format(name, _escape(value)) for name, value in root)]
+    for index, move in enumerate(moves):
+        move = Move(move)
+        if move == Move.RESIGN:
+            continue
+        if move == Move.PASS:
+            point = ''
+        else:
+            point = chr(ord('a') + move.col_index) + chr(ord('a') + size - 1 - move.row_index)
+        text.append(';{}[{}]'.format('BW'[index % 2], point))
+    text.append(')\n')
+    return ''.join(text)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace(']', '\\]')
+
+
+class _Parser:
+
+    def __init__(self, text):
+        self._text = text
+        self._pos = 0
+
+    def skip_space(self):
+        """Skip to next non-space character
+
+        :return: False at end of text
+        """
+        while self._pos < len(self._text) and self._text[self._pos].isspace():
+            self._pos += 1
+        return self._pos < len(self._text)
+
+    def game_tree(self):
+        """Read game tree, return property dicts of its main line
+
+        """
+        self._expect('(')
+        nodes = []
+        while self.skip_space() and self._text[self._pos] == ';':
+            self._pos += 1
+            nodes.append(self._node())
+        first = True
+        while self.skip_space() and self._text[self._pos] == '(':
+            variation = self.game_tree()
+            if first:
+                nodes.extend(variation)
+                first = False
+        self._expect(')')
+        return nodes
+
+    def _node(self):
+        properties = {}
+        while self.skip_space() and self._text[self._pos].isalpha():
+            start = self._pos
+            while self._pos < len(self._text) and self._text[self._pos].isalpha():
+                self._pos += 1
+            name = ''.join(c for c in self._text[start:self._pos] if c.isupper())
+            values = properties.setdefault(name, [])
+            while self.skip_space() and self._text[self._pos] == '[':
+                values.append(self._value())
+        return properties
+
+    def _value(self):
+        self._pos += 1
+        chars = []
+        while True:
+            if self._pos >= len(self._text):
+                raise SGFError('Unterminated property value')
+            c = self._text[self._pos]
+            self._pos += 1
+            if c == ']':
+                return ''.join(chars)
+            if c == '\\':
+                if self._pos >= len(self._text):
+                    raise SGFError('Unterminated property value')
+                c = self._text[self._pos]
+                self._pos += 1
+            chars.append(c)
+
+    def _expect(self, c):
+        if not self.skip_space() or self._text[self._pos] != c:
+            raise SGFError('Expected {!r} at offset {}'.format(c, self._pos))
+        self._pos += 1
+
+
+class SGFError(ValueError):
+    pass
@@ -0,0 +1,183 @@
+"""Durable storage of games
+
+GameStore keeps settings and moves of every chat's game in SQLite, so games can be
+rebuilt by replaying their moves after the bot restarts.
+"""
+import logging
+import sqlite3
+import threading
+import time
+
+__ALL__ = ['GameStore', 'GameRecord']
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (
+    chat_id INTEGER PRIMARY KEY,
+    player_color TEXT NOT NULL,
+    board_size INTEGER NOT NULL,
+    komi REAL NOT NULL,
+    final_score TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS moves (
+    chat_id INTEGER NOT NULL,
+    number INTEGER NOT NULL,
+    move TEXT NOT NULL,
+    PRIMARY KEY (chat_id, number)
+);
+'''
+
+
+class GameRecord:
+    """Stored settings and moves of a game
+
+    """
+
+    def __init__(self, chat_id, player_color, board_size, komi, moves, final_score=None):
+        self.chat_id = chat_id
+        self.player_color = player_color
+        self.board_size = board_size
+        self.komi = komi
+        self.moves = moves
+        self.final_score = final_score
+
+    @property
+    def is_finished(self):
+        return self.final_score is not None
+
+
+class GameStore:
+    """Store games in SQLite
+
+    Writes are committed in batches: when batch_size writes are pending, or when the
+    oldest pending write is commit_interval seconds old. synchronous is the SQLite
+    synchronous pragma, e.g. OFF, NORMAL or FULL, which decides how often SQLite
+    calls fsync.
+    """
+
+    def __init__(self, path, synchronous='NORMAL', commit_interval=1.0, batch_size=64):
+        if synchronous.upper() not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+            raise ValueError('Unknown synchronous mode: {}'.format(synchronous))
+        self._path = path
+        self._synchronous = synchronous.upper()
+        self._commit_interval = commit_interval
+        self._batch_size = batch_size
+        self._connection = None
+        self._pending = 0
+        self._pending_since = None
+        self._lock = threading.RLock()
+        self._closed = threading.Event()
+        self._flush_thread = None
+
+    def open(self):
+        self._connection = sqlite3.connect(self._path, check_same_thread=False, isolation_level='DEFERRED')
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous={}'.format(self._synchronous))
+        self._connection.executescript(_SCHEMA)
+        self._connection.commit()
+        self._closed.clear()
+        self._flush_thread = threading.Thread(target=self._flush_loop, name='game-store-flush', daemon=True)
+        self._flush_thread.start()
+
+    def close(self):
+        self._closed.set()
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def create_game(self, chat_id, player_color, board_size, komi):
+        """Start a new game of chat, replacing the previous one
+
+        """
+        with self._lock:
+            self._connection.execute('DELETE FROM moves WHERE chat_id = ?', (chat_id,))
+            self._connection.execute('INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, NULL, ?)',
+                                     (chat_id, str(player_color), board_size, komi, time.time()))
+            self._written()
+
+    def record_move(self, chat_id, number, move):
+        """Record move
+
+        :param chat_id: chat of the game
+        :param number: one-based move number
+        :param move: Move
+        :return:
+        """
+        with self._lock:
+            self._connection.execute('INSERT OR REPLACE INTO moves VALUES (?, ?, ?)', (chat_id, number, str(move)))
+            self._written()
+
+    def truncate_moves(self, chat_id, moves):
+        """Drop moves after move number, e.g. after undo
+
+        :param chat_id: chat of the game
+        :param moves: number of moves to keep
+        """
+        with self._lock:
+            self._connection.execute('DELETE FROM moves WHERE chat_id = ? AND number > ?', (chat_id, moves))
+            self._written()
+
+    def delete_game(self, chat_id):
+        """Forget game of chat, e.g. after its engine failed
+
+        """
+        with self._lock:
+            self._connection.execute('DELETE FROM moves WHERE chat_id = ?', (chat_id,))
+            self._connection.execute('DELETE FROM games WHERE chat_id = ?', (chat_id,))
+            self._written()
+
+    def finish_game(self, chat_id, final_score):
+        with self._lock:
+            self._connection.execute('UPDATE games SET final_score = ? WHERE chat_id = ?', (str(final_score), chat_id))
+            self._written()
+
+    def load_game(self, chat_id):
+        """Load game of chat
+
+        :return: GameRecord, or None if chat has no game
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT player_color, board_size, komi, final_score FROM games WHERE chat_id = ?',
+                (chat_id,)).fetchone()
+            if row is None:
+                return None
+            moves = [move for move, in self._connection.execute(
+                'SELECT move FROM moves WHERE chat_id = ? ORDER BY number', (chat_id,))]
+        player_color, board_size, komi, final_score = row
+        return GameRecord(chat_id, player_color, board_size, komi, moves, final_score)
+
+    def flush(self):
+        """Commit pending writes
+
+        """
+        with self._lock:
+            if self._pending:
+                self._connection.commit()
+                self._pending = 0
+                self._pending_since = None
+
+    def _written(self):
+        self._pending += 1
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        if self._pending >= self._batch_size or self._commit_interval <= 0:
+            self.flush()
+
+    def _flush_loop(self):
+        interval = self._commit_interval if self._commit_interval > 0 else 1.0
+        while not self._closed.wait(interval / 2):
+            with self._lock:
+                if self._pending_since is not None and time.monotonic() - self._pending_since >= interval:
+                    self.flush()
@@ -1,16 +1,44 @@
+import functools
 import gettext
 import os
+import time
 from telegram.ext import Updater
 from . import config
 from . import handlers
+from .. import metrics
 
 localedir = os.path.abspath(os.path.join(os.path.dirname(__file__), 'translations'))
 translation = gettext.translation(__name__, localedir=localedir, languages=[config.LANGUAGE])
 translation.install()
 
+TELEGRAM_SECONDS = metrics.histogram('telego_telegram_request_seconds', 'Time of Telegram API requests',
+                                     ('method',))
+
+
+def _instrument_bot(bot):
+    """Time requests that send messages
+
+    """
+
+    def timed(method, histogram):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+
+        return wrapper
+
+    for name in ('send_message', 'send_photo', 'edit_message_text'):
+        setattr(bot, name, timed(getattr(bot, name), TELEGRAM_SECONDS.labels(name)))
+
 
 def create_updater():
     updater = Updater(token=config.TOKEN)
+    if metrics.is_enabled():
+        _instrument_bot(updater.bot)
 
     handlers.register_handlers(updater.dispatcher)
 
@@ -22,6 +50,10 @@ def main():
 
     logging.basicConfig(level=logging.DEBUG)
 
+    if config.METRICS_PORT:
+        metrics.enable()
+        metrics.MetricsServer(config.METRICS_PORT).start()
+        logging.info('metrics served on port {}'.format(config.METRICS_PORT))
     updater = create_updater()
     if config.USE_WEBHOOK:
         logging.info('telego started using webhook')
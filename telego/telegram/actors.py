@@ -0,0 +1,161 @@
+"""Per-chat serialized execution of handlers
+
+Every chat gets a mailbox of pending handler calls. Calls of one chat run one at a
+time in arrival order, while calls of different chats run in parallel on a
+bounded set of worker threads, so games never see two commands at once.
+"""
+import collections
+import concurrent.futures
+import functools
+import logging
+import threading
+
+__ALL__ = ['ChatExecutor', 'ChatMailboxFullError', 'serialize_by_chat']
+
+logger = logging.getLogger(__name__)
+
+
+class _Mailbox:
+
+    def __init__(self):
+        self.calls = collections.deque()
+        self.busy = False
+
+
+class ChatExecutor:
+    """Run calls of a chat in order, and calls of different chats in parallel
+
+    A call that returns a concurrent Future keeps its chat busy until the Future is
+    done, so work handed off to other threads, e.g. a queued computer move, is
+    finished before the chat's next call starts.
+    """
+
+    def __init__(self, workers=8, mailbox_size=16):
+        """
+        :param workers: number of threads that run calls
+        :param mailbox_size: pending calls per chat before new calls are refused
+        """
+        self._mailbox_size = mailbox_size
+        self._mailboxes = {}
+        self._ready = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._workers = [threading.Thread(target=self._work, name='chat-worker-{}'.format(index), daemon=True)
+                         for index in range(workers)]
+        self._completed = 0
+        self._rejected = 0
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self):
+        """Stop workers after pending calls are run
+
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def submit(self, chat_id, func, *args, **kwargs):
+        """Queue call in chat's mailbox
+
+        :return: concurrent Future of the call's result
+        :raise ChatMailboxFullError: chat has mailbox_size pending calls
+        """
+        future = concurrent.futures.Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('Executor is stopped')
+            mailbox = self._mailboxes.get(chat_id)
+            if mailbox is None:
+                mailbox = self._mailboxes[chat_id] = _Mailbox()
+            if len(mailbox.calls) >= self._mailbox_size:
+                self._rejected += 1
+                raise ChatMailboxFullError(chat_id)
+            mailbox.calls.append((future, func, args, kwargs))
+            if not mailbox.busy and len(mailbox.calls) == 1:
+                self._ready.append(chat_id)
+                self._cond.notify()
+        return future
+
+    def stats(self):
+        with self._cond:
+            return {
+                'chats': len(self._mailboxes),
+                'ready': len(self._ready),
+                'pending': sum(len(mailbox.calls) for mailbox in self._mailboxes.values()),
+                'completed': self._completed,
+                'rejected': self._rejected,
+            }
+
+    def _next(self):
+        with self._cond:
+            while not self._ready:
+                if self._closed and not any(mailbox.busy for mailbox in self._mailboxes.values()):
+                    return None
+                self._cond.wait()
+            chat_id = self._ready.popleft()
+            mailbox = self._mailboxes[chat_id]
+            mailbox.busy = True
+            return chat_id, mailbox.calls.popleft()
+
+    def _work(self):
+        while True:
+            taken = self._next()
+            if taken is None:
+                return
+            chat_id, (future, func, args, kwargs) = taken
+            if not future.set_running_or_notify_cancel():
+                self._done(chat_id)
+                continue
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                logger.error('_work: call of chat {} failed: {}'.format(chat_id, e), exc_info=e)
+                future.set_exception(e)
+                self._done(chat_id)
+                continue
+            future.set_result(result)
+            if isinstance(result, concurrent.futures.Future):
+                result.add_done_callback(lambda _: self._done(chat_id))
+            else:
+                self._done(chat_id)
+
+    def _done(self, chat_id):
+        with self._cond:
+            self._completed += 1
+            mailbox = self._mailboxes[chat_id]
+            mailbox.busy = False
+            if mailbox.calls:
+                self._ready.append(chat_id)
+            else:
+                del self._mailboxes[chat_id]
+            self._cond.notify_all()
+
+
+class ChatMailboxFullError(Exception):
+    pass
+
+
+def serialize_by_chat(executor, callback):
+    """Wrap handler callback to run on executor
+
+    Updates that do not fit in their chat's mailbox are dropped.
+
+    :param executor: started ChatExecutor
+    :param callback: handler callback taking bot and update
+    :return: callback for the dispatcher
+    """
+
+    @functools.wraps(callback)
+    def wrapper(bot, update, **kwargs):
+        chat_id = update.message.chat_id
+        try:
+            executor.submit(chat_id, callback, bot, update, **kwargs)
+        except ChatMailboxFullError:
+            logger.warning('serialize_by_chat: drop update of chat {}, mailbox is full'.format(chat_id))
+
+    return wrapper
@@ -9,3 +9,48 @@ LANGUAGE = os.getenv('TELEGO_LANGUAGE', 'zh_TW')
 USE_WEBHOOK = bool(os.getenv('TELEGO_USE_WEBHOOK', False))
 WEBHOOK_URL = os.getenv('TELEGO_WEBHOOK_URL', None)
 WEBHOOK_PORT = int(os.getenv('PORT', 0) or os.getenv('TELEGO_WEBHOOK_PORT', 0)) or 80
+GTP_POOL_MIN_SIZE = int(os.getenv('TELEGO_GTP_POOL_MIN_SIZE', 1))
+GTP_POOL_MAX_SIZE = int(os.getenv('TELEGO_GTP_POOL_MAX_SIZE', 4))
+GTP_POOL_REFILL_INTERVAL = float(os.getenv('TELEGO_GTP_POOL_REFILL_INTERVAL', 5))
+GTP_POOL_ACQUIRE_TIMEOUT = float(os.getenv('TELEGO_GTP_POOL_ACQUIRE_TIMEOUT', 30))
+USE_ASYNC_ENGINE = bool(os.getenv('TELEGO_USE_ASYNC_ENGINE', False))
+SUPERKO = bool(os.getenv('TELEGO_SUPERKO', False))
+BOARD_RENDERER = os.getenv('TELEGO_BOARD_RENDERER', 'text')
+BOARD_IMAGE_POINT_SIZE = int(os.getenv('TELEGO_BOARD_IMAGE_POINT_SIZE', 24))
+RENDER_CACHE_SIZE = int(os.getenv('TELEGO_RENDER_CACHE_SIZE', 1024))
+STORE_PATH = os.getenv('TELEGO_STORE_PATH', None)
+STORE_SYNCHRONOUS = os.getenv('TELEGO_STORE_SYNCHRONOUS', 'NORMAL')
+STORE_COMMIT_INTERVAL = float(os.getenv('TELEGO_STORE_COMMIT_INTERVAL', 1))
+STORE_BATCH_SIZE = int(os.getenv('TELEGO_STORE_BATCH_SIZE', 64))
+GTP_MUX_ENGINES = int(os.getenv('TELEGO_GTP_MUX_ENGINES', 0))
+SCHEDULER_SLOTS = int(os.getenv('TELEGO_SCHEDULER_SLOTS', 0))
+SCHEDULER_MAX_QUEUE = int(os.getenv('TELEGO_SCHEDULER_MAX_QUEUE', 64))
+SCHEDULER_CHAT_RATE = float(os.getenv('TELEGO_SCHEDULER_CHAT_RATE', 0.5))
+SCHEDULER_CHAT_BURST = int(os.getenv('TELEGO_SCHEDULER_CHAT_BURST', 3))
+LATENCY_TARGET = float(os.getenv('TELEGO_LATENCY_TARGET', 0))
+MOVE_TIME_MIN = int(os.getenv('TELEGO_MOVE_TIME_MIN', 1))
+MOVE_TIME_MAX = int(os.getenv('TELEGO_MOVE_TIME_MAX', 10))
+MOVE_CACHE_SIZE = int(os.getenv('TELEGO_MOVE_CACHE_SIZE', 4096))
+MOVE_CACHE_PATH = os.getenv('TELEGO_MOVE_CACHE_PATH', None)
+MOVE_CACHE_ENGINE_ID = os.getenv('TELEGO_MOVE_CACHE_ENGINE_ID', None) or GTP_COMMAND
+MOVE_CACHE_MAX_DEPTH = int(os.getenv('TELEGO_MOVE_CACHE_MAX_DEPTH', 12))
+MOVE_CACHE_RANDOMNESS = float(os.getenv('TELEGO_MOVE_CACHE_RANDOMNESS', 0.1))
+MOVE_BOOK_PATH = os.getenv('TELEGO_MOVE_BOOK_PATH', None)
+METRICS_PORT = int(os.getenv('TELEGO_METRICS_PORT', 0))
+OUTBOX_GLOBAL_RATE = float(os.getenv('TELEGO_OUTBOX_GLOBAL_RATE', 30))
+OUTBOX_CHAT_RATE = float(os.getenv('TELEGO_OUTBOX_CHAT_RATE', 1))
+OUTBOX_CHAT_BURST = int(os.getenv('TELEGO_OUTBOX_CHAT_BURST', 3))
+OUTBOX_WORKERS = int(os.getenv('TELEGO_OUTBOX_WORKERS', 4))
+CHAT_WORKERS = int(os.getenv('TELEGO_CHAT_WORKERS', 8))
+CHAT_MAILBOX_SIZE = int(os.getenv('TELEGO_CHAT_MAILBOX_SIZE', 16))
+GTP_REMOTE_HOSTS = [host for host in os.getenv('TELEGO_GTP_REMOTE_HOSTS', '').split(',') if host.strip()]
+GTP_REMOTE_POOL_SIZE = int(os.getenv('TELEGO_GTP_REMOTE_POOL_SIZE', 4))
+GTP_REMOTE_TIMEOUT = float(os.getenv('TELEGO_GTP_REMOTE_TIMEOUT', 60))
+GTP_REMOTE_RETRY_INTERVAL = float(os.getenv('TELEGO_GTP_REMOTE_RETRY_INTERVAL', 30))
+GTP_COMMAND_TIMEOUT = float(os.getenv('TELEGO_GTP_COMMAND_TIMEOUT', 30))
+GTP_GENMOVE_TIMEOUT = float(os.getenv('TELEGO_GTP_GENMOVE_TIMEOUT', 120))
+GTP_MAX_RESTARTS = int(os.getenv('TELEGO_GTP_MAX_RESTARTS', 2))
+GAME_COMPACT_AFTER = float(os.getenv('TELEGO_GAME_COMPACT_AFTER', 600))
+GAME_COMPACT_INTERVAL = float(os.getenv('TELEGO_GAME_COMPACT_INTERVAL', 60))
+ENGINE_PROFILES = os.getenv('TELEGO_ENGINE_PROFILES', '')
+ENGINE_PROFILE_DEFAULT = os.getenv('TELEGO_ENGINE_PROFILE_DEFAULT', None)
@@ -1,20 +1,74 @@
+import asyncio
+import collections
+import functools
+import io
 import logging
+import math
+import threading
+import time
 from telegram.ext import CommandHandler
 from .. import config
+from ..actors import ChatExecutor, ChatMailboxFullError, serialize_by_chat
+from ..loop import EventLoopThread
+from ..outbox import Outbox
+from ...cache import LRUCache
+from ...compact import CompactGame
 from ...game import *
-from ...gtp.base import GTP
+from ...gtp.aio import AsyncGTP
+from ...gtp.farm import EngineFarm, FarmGTP
+from ...gtp.mux import EngineMultiplexer, MultiplexedGTP
+from ...gtp.pool import GTPPool, PooledGTP, GTPPoolExhaustedException
+from ...gtp.supervisor import SupervisedGTP, SupervisorStats
+from ... import metrics
+from ...movecache import MoveCache
+from ...profiles import EngineProfile, Tier, parse_profiles
+from ...render import AsciiRenderer, ImageRenderer
+from ...scheduler import GenmoveScheduler, SchedulerQueueFullError, SchedulerRateLimitedError
+from ...store import GameStore
+from ...timecontrol import AdaptiveTimeControl, FixedTimeControl
 
 logger = logging.getLogger(__name__)
 
+_BOARD_KEY = 'board'
+_HISTORY_KEY = 'history'
+
 
 class GameHandler:
     """Manage game states for every chats
 
     """
 
-    def __init__(self, gtp_command):
+    def __init__(self, gtp_factory=None, gtp_command=None, event_loop=None, superko=False, renderer=None,
+                 store=None, scheduler=None, time_control=None, move_cache=None,
+                 outbox=None, tiers=None):
+        """
+        :param gtp_factory: callable that takes the key of a game, its chat id, and returns GTP connection of a new
+                            blocking game, e.g. PooledGTP of a pool
+        :param gtp_command: engine command used by asyncio games
+        :param event_loop: EventLoopThread that drives asyncio games, None to use blocking games
+        :param superko: reject player moves that repeat an earlier position
+        :param renderer: AsciiRenderer or ImageRenderer, default AsciiRenderer
+        :param store: GameStore that keeps games across restarts, None to keep games in memory only
+        :param scheduler: started GenmoveScheduler that runs computer moves, None to run them right away
+        :param time_control: AdaptiveTimeControl shared by games, None to keep engine default time
+        :param move_cache: MoveCache shared by games, None to always ask engine
+        :param outbox: started Outbox that sends messages, None to send them right away
+        :param tiers: Tier of every difficulty level, the first one is the default level. None for one level of
+                      gtp_factory, gtp_command, scheduler, time_control and move_cache
+        """
+        if tiers is None:
+            tiers = [Tier('default', gtp_factory=gtp_factory, gtp_command=gtp_command, scheduler=scheduler,
+                          time_control=time_control, move_cache=move_cache)]
         self._games = {}
-        self._gtp_command = gtp_command
+        self._used = {}
+        self._tiers = collections.OrderedDict((tier.name, tier) for tier in tiers)
+        self._game_tiers = {}
+        self._event_loop = event_loop
+        self._superko = superko
+        self._renderer = renderer or AsciiRenderer()
+        self._board_file_ids = LRUCache(config.RENDER_CACHE_SIZE)
+        self._store = store
+        self._outbox = outbox
 
     def start(self, bot, update, args):
         """Start game
@@ -23,8 +77,9 @@ class GameHandler:
 
         :param bot:
         :param update:
-        :param args: expect args[0] is player's stone color, can be W or B. Use B if not not provide this argument.
-        :return:
+        :param args: player's stone color, W or B, and difficulty level, a level name or number, in any order.
+                     Use B and the first level if not provided.
+        :return: Future of computer's first move if it is played in the background
         """
         logger.debug('game start: enter')
         if self._is_game_active(update.message.chat_id):
@@ -32,21 +87,39 @@ class GameHandler:
             logger.debug('game start: exit')
             return
         logger.info('game start: receive args {}'.format(args))
+        player_color = StoneColor.BLACK
+        tier = None
+        for arg in args:
+            if arg.lower() in ('b', 'w') or len(self._tiers) == 1:
+                player_color = arg.lower()
+                continue
+            tier = self._find_tier(arg)
+            if tier is None:
+                self._send(bot, update.message.chat_id, _("Unknown level, choose one of: {}").format(
+                    ', '.join(self._tiers)))
+                logger.debug('game start: exit')
+                return
+        self._send(bot, update.message.chat_id, _("Starting game..."))
         try:
-            player_color = args[0].lower()
-        except IndexError:
-            player_color = StoneColor.BLACK
-        bot.send_message(chat_id=update.message.chat_id, text=_("Starting game..."))
-        try:
-            self._initialize_game(update.message.chat_id, player_color)
+            self._initialize_game(update.message.chat_id, player_color, tier)
         except ValueError as e:
             logger.warning('game start: received ValueError: {}'.format(e))
-            bot.send_message(chat_id=update.message.chat_id, text=_("Invalid color"))
+            self._send(bot, update.message.chat_id, _("Invalid color"))
+            logger.debug('game start: exit')
+            return
+        except GTPPoolExhaustedException:
+            logger.warning('game start: no engine available')
+            self._send(bot, update.message.chat_id, _("Server is busy, please try again later"))
             logger.debug('game start: exit')
             return
         game = self._get_game(update.message.chat_id)
-        bot.send_message(chat_id=update.message.chat_id, text=self._render_board(game.board), parse_mode='Markdown')
+        computer_move = None
+        if game.is_computer_turn():
+            computer_move = self._computer_turn(bot, update, game)
+        else:
+            self._send_board(bot, update.message.chat_id, game.board)
         logger.debug('game start: exit')
+        return computer_move
 
     def play(self, bot, update, args):
         """Player  play
@@ -56,9 +129,10 @@ class GameHandler:
         :param bot:
         :param update:
         :param args:  except args[0] is move, can be [A-J][1-9], e.g. C3, J7, ...etc.
-        :return:
+        :return: Future of computer's move if it is played in the background
         """
         logger.debug('game play: enter')
+        started = time.monotonic()
         if not self._is_game_active(update.message.chat_id):
             logger.info('game play: ignore command, game is not started yet.')
             logger.debug('game play: exit')
@@ -67,27 +141,36 @@ class GameHandler:
         try:
             move = Move(args[0])
             logger.info('game play: player play: {}'.format(move))
-            game.player_play(move)
-            bot.send_message(chat_id=update.message.chat_id, text=self._render_board(game.board), parse_mode='Markdown')
-        except (ValueError, IndexError, GameEngineError, GameMoveInvalidError) as e:
+            game.check_player_move(move)
+            if not game.ends_game(move) and not self._admit(bot, update.message.chat_id):
+                logger.debug('game play: exit')
+                return
+            self._wait(game.player_play(move))
+            self._record_move(update.message.chat_id, game)
+        except GameMoveIllegalError as e:
+            logger.info('game play: player move is illegal: {}'.format(e.reason))
+            self._send(bot, update.message.chat_id, self._illegal_move_message(e.reason))
+            logger.debug('game play: exit')
+            return
+        except GTPPoolExhaustedException:
+            logger.warning('game play: no engine available')
+            self._send(bot, update.message.chat_id, _("Server is busy, please try again later"))
+            logger.debug('game play: exit')
+            return
+        except (ValueError, IndexError, GameEngineError, GameMoveInvalidError, GameTurnError) as e:
             logger.warning('game play: player move is rejected: {}'.format(e))
-            bot.send_message(chat_id=update.message.chat_id, text=_("Invalid move"))
+            self._send(bot, update.message.chat_id, _("Invalid move"))
             logger.debug('game play: exit')
             return
         if game.state == GameState.END:
             logger.info('play: game end')
-            self.final_score(bot, update)
+            self._send_board(bot, update.message.chat_id, game.board)
+            self._end_game(bot, update, game)
             logger.debug('game play: exit')
             return
-        bot.send_message(chat_id=update.message.chat_id, text=_("Waiting for computer..."))
-        move = game.computer_play()
-        logger.info('game play: computer play: {}'.format(move))
-        bot.send_message(chat_id=update.message.chat_id, text=_("Computer: {}").format(move))
-        bot.send_message(chat_id=update.message.chat_id, text=self._render_board(game.board), parse_mode='Markdown')
-        if game.state == GameState.END:
-            logger.info('play: game end')
-            self.final_score(bot, update)
+        computer_move = self._computer_turn(bot, update, game, started=started)
         logger.debug('game play: exit')
+        return computer_move
 
     def board(self, bot, update):
         """Display board
@@ -104,7 +187,7 @@ class GameHandler:
             logger.debug('game board: exit')
             return
         game = self._get_game(update.message.chat_id)
-        bot.send_message(chat_id=update.message.chat_id, text=self._render_board(game.board), parse_mode='Markdown')
+        self._send_board(bot, update.message.chat_id, game.board)
         logger.debug('game board: exit')
 
     def final_score(self, bot, update):
@@ -122,30 +205,576 @@ class GameHandler:
             logger.debug('game final_score: exit')
             return
         game = self._get_game(update.message.chat_id)
+        if game is None:
+            logger.info('game final_score: ignore command, game is not started yet.')
+            logger.debug('game final_score: exit')
+            return
         final_score = game.final_score()
-        bot.send_message(chat_id=update.message.chat_id, text=final_score)
+        self._send(bot, update.message.chat_id, final_score)
         logger.debug('game final_score: exit')
 
-    def _initialize_game(self, chat_id, player_color):
-        gtp = GTP(self._gtp_command)
-        game = Game(player_color, gtp=gtp)
-        game.setup()
-        self._games[chat_id] = game
+    def undo(self, bot, update):
+        """Take back player's last move and computer's reply
+
+        If game is end, or game is not started yet, this method will do nothing.
+
+        :param bot:
+        :param update:
+        :return: Future of computer's move if it is computer's turn afterwards
+        """
+        logger.debug('game undo: enter')
+        chat_id = update.message.chat_id
+        if not self._is_game_active(chat_id):
+            logger.info('game undo: ignore command, game is not started yet.')
+            logger.debug('game undo: exit')
+            return
+        game = self._get_game(chat_id)
+        count = len(game.moves)
+        try:
+            self._wait(game.undo())
+        except GameUndoError:
+            self._send(bot, chat_id, _("Nothing to undo"))
+            logger.debug('game undo: exit')
+            return
+        except GameEngineError as e:
+            logger.warning('game undo: engine failed to undo: {}'.format(e))
+            self._send(bot, chat_id, _("Engine cannot undo"))
+        undone = count - len(game.moves)
+        if not undone:
+            logger.debug('game undo: exit')
+            return
+        if self._store is not None:
+            self._store.truncate_moves(chat_id, len(game.moves))
         if game.is_computer_turn():
-            game.computer_play()
+            logger.debug('game undo: exit')
+            return self._computer_turn(bot, update, game)
+        self._send_board(bot, chat_id, game.board, caption=_("Took back {} moves").format(undone))
+        logger.debug('game undo: exit')
+
+    def history(self, bot, update, args):
+        """Display moves of game, or board after a move
+
+        :param bot:
+        :param update:
+        :param args: args[0] is move number, 0 for the empty board. List moves if not provided.
+        :return:
+        """
+        logger.debug('game history: enter')
+        chat_id = update.message.chat_id
+        game = self._get_game(chat_id)
+        if game is None:
+            logger.info('game history: ignore command, game is not started yet.')
+            logger.debug('game history: exit')
+            return
+        moves = game.moves
+        if not args:
+            if not moves:
+                self._send(bot, chat_id, _("No moves yet"))
+            else:
+                lines = ['{}. {} {}'.format(number, 'B' if number % 2 else 'W', move)
+                         for number, move in enumerate(moves, 1)]
+                lines.append(_("Send /history N to see the board after move N"))
+                self._send(bot, chat_id, '\n'.join(lines))
+            logger.debug('game history: exit')
+            return
+        try:
+            number = int(args[0])
+            if not 0 <= number <= len(moves):
+                raise ValueError(number)
+        except ValueError:
+            self._send(bot, chat_id, _("Invalid move number"))
+            logger.debug('game history: exit')
+            return
+        position = game.history[number]
+        caption = _("Move {}/{}: {}").format(number, len(moves), position.move or '-')
+        self._send_board(bot, chat_id, position, caption=caption, key=_HISTORY_KEY)
+        logger.debug('game history: exit')
+
+    def score(self, bot, update):
+        """Display score estimate of current position
+
+        Score is counted locally by area, dead stones are not removed.
+
+        :param bot:
+        :param update:
+        :return:
+        """
+        logger.debug('game score: enter')
+        game = self._get_game(update.message.chat_id)
+        if game is None:
+            logger.info('game score: ignore command, game is not started yet.')
+            logger.debug('game score: exit')
+            return
+        score = game.estimate_score()
+        self._send(bot, update.message.chat_id, _("Estimated score: {} (black {}, white {}, komi {:g})").format(
+            score, score.black, score.white, score.komi))
+        logger.debug('game score: exit')
+
+    def _admit(self, bot, chat_id):
+        """Check whether scheduler accepts another computer move of chat
+
+        :return: True if accepted, otherwise user is told why
+        """
+        scheduler = self._tier_of(chat_id).scheduler
+        if scheduler is None:
+            return True
+        try:
+            scheduler.admit(chat_id)
+        except SchedulerQueueFullError:
+            logger.warning('_admit: genmove queue is full')
+            self._send(bot, chat_id, _("Server is busy, please try again later"))
+            return False
+        except SchedulerRateLimitedError as e:
+            logger.info('_admit: chat {} is rate limited'.format(chat_id))
+            self._send(bot, chat_id, _("You are playing too fast, please wait {} seconds").format(
+                math.ceil(e.retry_after)))
+            return False
+        return True
+
+    def stats(self):
+        """Number of games in memory and how many of them are being played
+
+        """
+        games = list(self._games.values())
+        return {
+            'games': len(games),
+            'active': sum(1 for game in games if game.state == GameState.ACTIVE),
+            'dormant': sum(1 for game in games if isinstance(game, CompactGame)),
+        }
+
+    def compact_idle_games(self, idle_seconds, submit=None):
+        """Compact games of chats without commands for idle_seconds
+
+        A compacted game gives its engine back and is kept as a CompactGame, it is
+        rebuilt when the chat sends a command again.
+
+        :param idle_seconds: seconds since the last command of chat
+        :param submit: callable(chat_id, func, *args) that runs func in order with the commands of chat,
+                       e.g. ChatExecutor.submit, None to compact in this thread
+        :return: number of idle games
+        """
+        now = time.monotonic()
+        idle = [chat_id for chat_id, used in list(self._used.items()) if now - used >= idle_seconds]
+        for chat_id in idle:
+            if submit is None:
+                self._compact_game(chat_id, idle_seconds)
+                continue
+            try:
+                submit(chat_id, self._compact_game, chat_id, idle_seconds)
+            except ChatMailboxFullError:
+                logger.info('compact_idle_games: chat {} is busy'.format(chat_id))
+        return len(idle)
+
+    def _compact_game(self, chat_id, idle_seconds):
+        used = self._used.get(chat_id)
+        if used is None or time.monotonic() - used < idle_seconds:
+            return
+        self._used.pop(chat_id, None)
+        game = self._games.get(chat_id)
+        if game is None or isinstance(game, CompactGame):
+            return
+        if game.state == GameState.ACTIVE:
+            self._wait(game.close())
+        self._games[chat_id] = game.compact()
+        logger.debug('_compact_game: compacted game of chat {}'.format(chat_id))
+
+    def _resume_game(self, chat_id, compact):
+        """Rebuild compacted game of chat
+
+        :return: game, None if engine is not available
+        """
+        game = self._create_game(chat_id, compact.player_color, compact=compact, tier=self._tier_of(chat_id))
+        if compact.state == GameState.ACTIVE:
+            try:
+                self._wait(game.resume())
+            except (GTPPoolExhaustedException, GameEngineError) as e:
+                logger.warning('_resume_game: failed to resume game of chat {}: {}'.format(chat_id, e))
+                self._wait(game.close())
+                return None
+        self._games[chat_id] = game
+        return game
+
+    def _computer_turn(self, bot, update, game, started=None):
+        """Let computer play and show its move
+
+        The board is sent with a waiting note, which is replaced by computer's move
+        when it is played. With a scheduler the move is queued and shown when a
+        thinking slot has played it. Otherwise asyncio games are handed off to the
+        event loop, so the dispatcher worker does not wait for the engine.
+
+        :param started: monotonic time the user's command arrived, for latency accounting
+        :return: Future that is done when computer's move is shown, None if it is shown already
+        """
+        chat_id = update.message.chat_id
+        if started is None:
+            started = time.monotonic()
+        tier = self._tier_of(chat_id)
+        if tier.scheduler is not None:
+            position = tier.scheduler.position(chat_id)
+            if position > 1:
+                caption = _("Waiting for computer... #{} in line").format(position)
+            else:
+                caption = _("Waiting for computer...")
+            self._send_board(bot, chat_id, game.board, caption=caption)
+            ticket = tier.scheduler.submit(chat_id, lambda: self._play_computer_move(game, tier))
+            ticket.add_done_callback(
+                lambda future: self._scheduled_computer_played(bot, update, game, future, started,
+                                                               ticket.started - ticket.queued))
+            return ticket.future
+        self._send_board(bot, chat_id, game.board, caption=_("Waiting for computer..."))
+        if self._event_loop is None:
+            move = self._play_computer_move(game, tier)
+            self._computer_played(bot, update, game, move, started)
+            return None
+        return self._event_loop.spawn(self._async_computer_turn(bot, update, game, tier, started))
+
+    def _play_computer_move(self, game, tier):
+        """Let computer play and account engine time to tier
+
+        """
+        started = time.monotonic()
+        try:
+            return self._wait(game.computer_play())
+        finally:
+            tier.engine_used(time.monotonic() - started)
+
+    async def _async_computer_turn(self, bot, update, game, tier, started):
+        engine_started = time.monotonic()
+        try:
+            move = await game.computer_play()
+        except Exception as e:
+            await self._event_loop.run_blocking(self._computer_failed, bot, update, game, e)
+            return
+        finally:
+            tier.engine_used(time.monotonic() - engine_started)
+        await self._event_loop.run_blocking(self._computer_played, bot, update, game, move, started)
+
+    def _scheduled_computer_played(self, bot, update, game, future, started, queue_wait):
+        error = future.exception()
+        if error is not None:
+            self._computer_failed(bot, update, game, error)
+            return
+        self._computer_played(bot, update, game, future.result(), started, queue_wait)
+
+    def _computer_failed(self, bot, update, game, error):
+        """Drop game whose computer move failed, so the chat can start a new game
+
+        """
+        chat_id = update.message.chat_id
+        logger.error('game play: computer failed to play: {}'.format(str(error) or type(error).__name__))
+        if self._games.get(chat_id) is game:
+            del self._games[chat_id]
+            self._used.pop(chat_id, None)
+            if self._store is not None:
+                self._store.delete_game(chat_id)
+        try:
+            self._wait(game.close())
+        except Exception as e:
+            logger.warning('game play: failed to close game: {}'.format(e))
+        self._send(bot, chat_id, _("Computer failed to play, the game is over. Send /start to play again"))
+
+    def _computer_played(self, bot, update, game, move, started, queue_wait=0.0):
+        logger.info('game play: computer play: {}'.format(move))
+        tier = self._tier_of(update.message.chat_id)
+        latency = time.monotonic() - started
+        tier.move_played(latency)
+        if tier.time_control is not None and game.move_time is not None and not game.cache_hit:
+            tier.time_control.observe(latency, game.move_time, queue_wait)
+        self._record_move(update.message.chat_id, game)
+        self._send_board(bot, update.message.chat_id, game.board, caption=_("Computer: {}").format(move), edit=True)
+        if game.state == GameState.END:
+            logger.info('play: game end')
+            self._end_game(bot, update, game)
+
+    def _end_game(self, bot, update, game):
+        self._wait(game.close())
+        if self._store is not None:
+            self._store.finish_game(update.message.chat_id, game.final_score())
+        self.final_score(bot, update)
+
+    def _initialize_game(self, chat_id, player_color, tier=None):
+        tier = tier or self._default_tier
+        game = self._create_game(chat_id, player_color, tier=tier)
+        try:
+            self._wait(game.setup())
+        except Exception:
+            self._wait(game.close())
+            raise
+        previous_game = self._games.get(chat_id)
+        if previous_game is not None and not isinstance(previous_game, CompactGame):
+            self._wait(previous_game.close())
+        self._games[chat_id] = game
+        if tier is self._default_tier:
+            self._game_tiers.pop(chat_id, None)
+        else:
+            self._game_tiers[chat_id] = tier.name
+        tier.game_started()
+        if self._store is not None:
+            self._store.create_game(chat_id, game.player_color.value, game.board_size, game.komi)
+
+    def _restore_game(self, chat_id):
+        """Rebuild unfinished game of chat from store
+
+        Moves are replayed into a new engine. If the bot stopped while computer was
+        thinking, computer plays again.
+
+        :return: Game, or None if chat has no unfinished game
+        """
+        record = self._store.load_game(chat_id)
+        if record is None or record.is_finished:
+            return None
+        logger.info('_restore_game: replay {} moves of chat {}'.format(len(record.moves), chat_id))
+        game = self._create_game(chat_id, record.player_color, board_size=record.board_size, komi=record.komi,
+                                 tier=self._tier_of(chat_id))
+        try:
+            self._wait(game.setup())
+            self._wait(game.replay(record.moves))
+            if game.state == GameState.ACTIVE and game.is_computer_turn():
+                self._wait(game.computer_play())
+                self._record_move(chat_id, game)
+        except (GTPPoolExhaustedException, GameEngineError, GameMoveInvalidError, ValueError) as e:
+            logger.warning('_restore_game: failed to restore game of chat {}: {}'.format(chat_id, e))
+            self._wait(game.close())
+            return None
+        self._games[chat_id] = game
+        return game
+
+    def _record_move(self, chat_id, game):
+        if self._store is not None:
+            self._store.record_move(chat_id, len(game.moves), game.moves[-1])
+
+    def _create_game(self, chat_id, player_color, board_size=9, komi=5.5, compact=None, tier=None):
+        """Create game on engines of tier, or rebuild it from CompactGame
+
+        :param chat_id: chat of the game, the key that places it on the same engine host every time
+        """
+        tier = tier or self._default_tier
+        if self._event_loop is None:
+            game_class, gtp = Game, tier.gtp_factory(chat_id)
+        else:
+            game_class, gtp = AsyncGame, AsyncGTP(tier.gtp_command)
+        if compact is not None:
+            return game_class.from_compact(compact, gtp, time_control=tier.time_control,
+                                           move_cache=tier.move_cache)
+        return game_class(player_color, gtp=gtp, board_size=board_size, komi=komi,
+                          superko=self._superko, time_control=tier.time_control,
+                          move_cache=tier.move_cache)
+
+    @property
+    def _default_tier(self):
+        return next(iter(self._tiers.values()))
+
+    def _tier_of(self, chat_id):
+        """Tier of chat's game
+
+        """
+        return self._tiers.get(self._game_tiers.get(chat_id)) or self._default_tier
+
+    def _find_tier(self, level):
+        """Find tier by name or 1-based number
+
+        :return: Tier, None if there is no such level
+        """
+        tier = self._tiers.get(level.lower())
+        if tier is None and level.isdigit() and 1 <= int(level) <= len(self._tiers):
+            tier = list(self._tiers.values())[int(level) - 1]
+        return tier
+
+    def _wait(self, result):
+        """Wait for result of game method
+
+        Coroutines returned by asyncio games are run on the event loop.
+        """
+        if asyncio.iscoroutine(result):
+            return self._event_loop.submit(result).result()
+        return result
 
     @staticmethod
-    def _render_board(board):
-        return "```\n{}\n```".format(board.render())
+    def _illegal_move_message(reason):
+        if reason == IllegalMoveReason.OCCUPIED:
+            return _("Invalid move: the point is occupied")
+        elif reason == IllegalMoveReason.SUICIDE:
+            return _("Invalid move: suicide is not allowed")
+        elif reason == IllegalMoveReason.KO:
+            return _("Invalid move: ko, play elsewhere first")
+        elif reason == IllegalMoveReason.SUPERKO:
+            return _("Invalid move: the position would repeat")
+        return _("Invalid move")
+
+    def _send(self, bot, chat_id, text):
+        if self._outbox is not None:
+            self._outbox.send_message(bot, chat_id, text)
+        else:
+            bot.send_message(chat_id=chat_id, text=text)
+
+    def _send_board(self, bot, chat_id, board, caption=None, edit=False, key=_BOARD_KEY):
+        """Send board as text or image
+
+        Boards are queued under one key per chat, so a board that is not sent yet is
+        replaced by a newer one. Images of positions that were uploaded before are sent
+        by their Telegram file_id.
+
+        :param caption: text shown with the board
+        :param edit: replace the last board message of chat instead of sending another, text boards only
+        :param key: outbox key of the message
+        """
+        if not isinstance(self._renderer, ImageRenderer):
+            text = self._render_board(board, caption)
+            if self._outbox is None:
+                bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown')
+            elif edit:
+                self._outbox.edit_message(bot, chat_id, key, text, parse_mode='Markdown')
+            else:
+                self._outbox.send_message(bot, chat_id, text, key=key, parse_mode='Markdown')
+            return
+        image_key = self._renderer.key(board)
+        file_id = self._board_file_ids.get(image_key)
+        photo = file_id if file_id is not None else io.BytesIO(self._renderer.render(board))
+
+        def uploaded(message):
+            if file_id is None:
+                self._board_file_ids.put(image_key, message.photo[-1].file_id)
+
+        if self._outbox is None:
+            uploaded(bot.send_photo(chat_id=chat_id, photo=photo, caption=caption))
+        else:
+            self._outbox.send_photo(bot, chat_id, photo, key=key, callback=uploaded, caption=caption)
+
+    def _render_board(self, board, caption=None):
+        text = "```\n{}\n```".format(self._renderer.render(board))
+        if caption:
+            text = "{}\n{}".format(caption, text)
+        return text
 
     def _get_game(self, chat_id):
-        return self._games.get(chat_id, None)
+        game = self._games.get(chat_id, None)
+        if isinstance(game, CompactGame):
+            game = self._resume_game(chat_id, game)
+        elif game is None and self._store is not None:
+            game = self._restore_game(chat_id)
+        if game is not None:
+            self._used[chat_id] = time.monotonic()
+        return game
 
     def _is_game_active(self, chat_id):
         game = self._get_game(chat_id)
         return bool(game) and game.state == GameState.ACTIVE
 
 
+def _compact_idle_games(game_handler, executor):
+    while True:
+        time.sleep(config.GAME_COMPACT_INTERVAL)
+        try:
+            game_handler.compact_idle_games(config.GAME_COMPACT_AFTER, submit=executor.submit)
+        except RuntimeError as e:
+            logger.info('_compact_idle_games: stop: {}'.format(e))
+            return
+
+
+def _supervised_gtp_factory(command, prefix):
+    """Factory of engines with command deadlines, None if supervision is disabled
+
+    :param command: engine command
+    :param prefix: name prefix of metric collectors
+    """
+    if not config.GTP_COMMAND_TIMEOUT:
+        return None
+    stats = SupervisorStats()
+    metrics.add_collector(prefix + '_gtp_supervisor', stats.stats, 'Engine supervisor statistic')
+    return functools.partial(SupervisedGTP, command,
+                             timeout=config.GTP_COMMAND_TIMEOUT,
+                             genmove_timeout=config.GTP_GENMOVE_TIMEOUT or None,
+                             max_restarts=config.GTP_MAX_RESTARTS,
+                             stats=stats)
+
+
+def _engine_profiles():
+    """Engine profiles of difficulty tiers, the default one first
+
+    Without TELEGO_ENGINE_PROFILES there is one profile of TELEGO_GTP_COMMAND.
+    """
+    if not config.ENGINE_PROFILES:
+        return [EngineProfile('default', config.GTP_COMMAND,
+                              min_engines=config.GTP_POOL_MIN_SIZE,
+                              max_engines=config.GTP_MUX_ENGINES or config.GTP_POOL_MAX_SIZE,
+                              slots=config.SCHEDULER_SLOTS,
+                              max_queue=config.SCHEDULER_MAX_QUEUE)]
+    profiles = parse_profiles(config.ENGINE_PROFILES)
+    if config.ENGINE_PROFILE_DEFAULT:
+        default = [profile for profile in profiles if profile.name == config.ENGINE_PROFILE_DEFAULT]
+        if not default:
+            raise ValueError('Unknown default engine profile: {}'.format(config.ENGINE_PROFILE_DEFAULT))
+        profiles.remove(default[0])
+        profiles.insert(0, default[0])
+    return profiles
+
+
+def _create_tier(profile, prefix, gtp_factory=None):
+    """Create engines, scheduler, time control and move cache of a tier
+
+    :param profile: EngineProfile of tier
+    :param prefix: name prefix of metric collectors of tier
+    :param gtp_factory: factory of engines shared by every tier, None to start engines of profile
+    :return: Tier
+    """
+    scheduler = GenmoveScheduler(slots=profile.slots,
+                                 max_queue=profile.max_queue,
+                                 chat_rate=config.SCHEDULER_CHAT_RATE or None,
+                                 chat_burst=config.SCHEDULER_CHAT_BURST)
+    scheduler.start()
+    metrics.add_collector(prefix + '_scheduler', scheduler.stats, 'Genmove scheduler statistic')
+    time_control = None
+    if config.LATENCY_TARGET:
+        max_time = profile.move_time or config.MOVE_TIME_MAX
+        time_control = AdaptiveTimeControl(config.LATENCY_TARGET,
+                                           min_time=min(config.MOVE_TIME_MIN, max_time),
+                                           max_time=max_time,
+                                           scheduler=scheduler)
+    elif profile.move_time:
+        time_control = FixedTimeControl(profile.move_time)
+    if time_control is not None:
+        metrics.add_collector(prefix + '_time_control', time_control.stats, 'Time control statistic')
+    move_cache = None
+    if config.MOVE_CACHE_SIZE:
+        if config.ENGINE_PROFILES:
+            engine_id = '{} move_time={}'.format(' '.join(profile.command), profile.move_time)
+        else:
+            engine_id = config.MOVE_CACHE_ENGINE_ID
+        move_cache = MoveCache(config.MOVE_CACHE_SIZE,
+                               path=config.MOVE_CACHE_PATH,
+                               engine_id=engine_id,
+                               max_depth=config.MOVE_CACHE_MAX_DEPTH,
+                               randomness=config.MOVE_CACHE_RANDOMNESS)
+        move_cache.open()
+        if config.MOVE_BOOK_PATH:
+            move_cache.load_book(config.MOVE_BOOK_PATH)
+        metrics.add_collector(prefix + '_move_cache', move_cache.stats, 'Move cache statistic')
+    gtp_command = None
+    if gtp_factory is None:
+        if config.USE_ASYNC_ENGINE:
+            gtp_command = profile.command
+        elif config.GTP_MUX_ENGINES:
+            multiplexer = EngineMultiplexer(profile.command, max_engines=profile.max_engines,
+                                            factory=_supervised_gtp_factory(profile.command, prefix),
+                                            acquire_timeout=config.GTP_POOL_ACQUIRE_TIMEOUT)
+            gtp_factory = functools.partial(MultiplexedGTP, multiplexer)
+            metrics.add_collector(prefix + '_gtp_mux', multiplexer.stats, 'Engine multiplexer statistic')
+        else:
+            gtp_pool = GTPPool(profile.command,
+                               min_size=profile.min_engines,
+                               max_size=profile.max_engines,
+                               refill_interval=config.GTP_POOL_REFILL_INTERVAL,
+                               acquire_timeout=config.GTP_POOL_ACQUIRE_TIMEOUT,
+                               factory=_supervised_gtp_factory(profile.command, prefix))
+            gtp_pool.start()
+            metrics.add_collector(prefix + '_gtp_pool', gtp_pool.stats, 'Engine pool statistic')
+            gtp_factory = functools.partial(PooledGTP, gtp_pool)
+    tier = Tier(profile.name, gtp_factory=gtp_factory, gtp_command=gtp_command, scheduler=scheduler,
+                time_control=time_control, move_cache=move_cache)
+    metrics.add_collector('telego_tier_' + profile.name, tier.stats, 'Difficulty tier statistic')
+    return tier
+
+
 def register_handlers(dispatcher):
     """Register go game handlers
 
@@ -154,19 +783,78 @@ def register_handlers(dispatcher):
       - /play
       - /board
       - /final_score
+      - /score
+      - /undo
+      - /history
 
     :param dispatcher:
     :param game_handler:
     :return:
     """
-    game_handler = GameHandler(gtp_command=config.GTP_COMMAND)
+    store = None
+    if config.STORE_PATH:
+        store = GameStore(config.STORE_PATH,
+                          synchronous=config.STORE_SYNCHRONOUS,
+                          commit_interval=config.STORE_COMMIT_INTERVAL,
+                          batch_size=config.STORE_BATCH_SIZE)
+        store.open()
+    if config.BOARD_RENDERER == 'image':
+        renderer = ImageRenderer(cache_size=config.RENDER_CACHE_SIZE, point_size=config.BOARD_IMAGE_POINT_SIZE)
+    else:
+        renderer = AsciiRenderer(cache_size=config.RENDER_CACHE_SIZE)
+    outbox = Outbox(global_rate=config.OUTBOX_GLOBAL_RATE,
+                    chat_rate=config.OUTBOX_CHAT_RATE,
+                    chat_burst=config.OUTBOX_CHAT_BURST,
+                    workers=config.OUTBOX_WORKERS)
+    outbox.start()
+    profiles = _engine_profiles()
+    event_loop = None
+    farm_factory = None
+    if config.USE_ASYNC_ENGINE:
+        event_loop = EventLoopThread()
+        event_loop.start()
+    elif config.GTP_REMOTE_HOSTS:
+        farm = EngineFarm(config.GTP_REMOTE_HOSTS,
+                          pool_size=config.GTP_REMOTE_POOL_SIZE,
+                          min_size=config.GTP_POOL_MIN_SIZE,
+                          timeout=config.GTP_REMOTE_TIMEOUT,
+                          retry_interval=config.GTP_REMOTE_RETRY_INTERVAL,
+                          refill_interval=config.GTP_POOL_REFILL_INTERVAL)
+        farm.start()
+        metrics.add_collector('telego_gtp_farm', farm.stats, 'Engine farm statistic')
+        farm_factory = functools.partial(FarmGTP, farm)
+        if len(profiles) > 1:
+            logger.warning('register_handlers: remote engines serve every game, use only profile {}'.format(
+                profiles[0].name))
+            profiles = profiles[:1]
+    if config.ENGINE_PROFILES:
+        tiers = [_create_tier(profile, 'telego_tier_' + profile.name, farm_factory) for profile in profiles]
+    else:
+        tiers = [_create_tier(profiles[0], 'telego', farm_factory)]
+    game_handler = GameHandler(event_loop=event_loop, superko=config.SUPERKO, renderer=renderer, store=store,
+                               outbox=outbox, tiers=tiers)
+    metrics.add_collector('telego_games', game_handler.stats, 'Games in memory')
+    metrics.add_collector('telego_outbox', outbox.stats, 'Outgoing message statistic')
+
+    executor = ChatExecutor(workers=config.CHAT_WORKERS, mailbox_size=config.CHAT_MAILBOX_SIZE)
+    executor.start()
+    metrics.add_collector('telego_chat_executor', executor.stats, 'Chat executor statistic')
+    if config.GAME_COMPACT_AFTER:
+        threading.Thread(target=_compact_idle_games, args=(game_handler, executor), name='game-compaction',
+                         daemon=True).start()
 
-    start_handler = CommandHandler('start', game_handler.start, pass_args=True)
-    play_handler = CommandHandler('play', game_handler.play, pass_args=True)
-    board_handler = CommandHandler('board', game_handler.board)
-    final_score_handler = CommandHandler('final_score', game_handler.final_score)
+    start_handler = CommandHandler('start', serialize_by_chat(executor, game_handler.start), pass_args=True)
+    play_handler = CommandHandler('play', serialize_by_chat(executor, game_handler.play), pass_args=True)
+    board_handler = CommandHandler('board', serialize_by_chat(executor, game_handler.board))
+    final_score_handler = CommandHandler('final_score', serialize_by_chat(executor, game_handler.final_score))
+    score_handler = CommandHandler('score', serialize_by_chat(executor, game_handler.score))
+    undo_handler = CommandHandler('undo', serialize_by_chat(executor, game_handler.undo))
+    history_handler = CommandHandler('history', serialize_by_chat(executor, game_handler.history), pass_args=True)
 
     dispatcher.add_handler(start_handler)
     dispatcher.add_handler(play_handler)
     dispatcher.add_handler(board_handler)
     dispatcher.add_handler(final_score_handler)
+    dispatcher.add_handler(score_handler)
+    dispatcher.add_handler(undo_handler)
+    dispatcher.add_handler(history_handler)
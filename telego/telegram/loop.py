@@ -0,0 +1,64 @@
+"""Background asyncio event loop
+
+Handlers run on dispatcher worker threads; they hand coroutines to this loop
+instead of blocking while an engine is thinking.
+"""
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopThread:
+    """Run an asyncio event loop in a daemon thread
+
+    """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name='telego-event-loop', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def submit(self, coro):
+        """Schedule coroutine on the loop
+
+        :param coro: coroutine to run
+        :return: concurrent.futures.Future of coroutine result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def spawn(self, coro):
+        """Schedule coroutine on the loop without waiting for it
+
+        Exceptions are logged since nobody waits for the result.
+
+        :param coro: coroutine to run
+        :return: concurrent.futures.Future of coroutine result
+        """
+        future = self.submit(coro)
+        future.add_done_callback(self._log_exception)
+        return future
+
+    def run_blocking(self, func, *args):
+        """Await blocking function on the loop's default executor
+
+        :param func: blocking callable, e.g. a bot request
+        :return: awaitable result of func
+        """
+        return self._loop.run_in_executor(None, func, *args)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    @staticmethod
+    def _log_exception(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error('coroutine failed: {}'.format(future.exception()), exc_info=future.exception())
@@ -0,0 +1,263 @@
+"""Rate limited outgoing messages
+
+Telegram limits how fast a bot may send, globally and per chat. Outbox queues
+outgoing messages and sends them from worker threads within those limits, so
+handlers never wait for Telegram. Messages queued under a key replace an unsent
+message of the same key, so a board that is already outdated is never sent.
+"""
+import collections
+import logging
+import threading
+import time
+from telegram.error import BadRequest, RetryAfter
+from ..cache import LRUCache
+from ..ratelimit import TokenBucket
+
+__ALL__ = ['Outbox']
+
+logger = logging.getLogger(__name__)
+
+
+class _Item:
+
+    def __init__(self, bot, chat_id, kind, key, kwargs, callback):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.kind = kind
+        self.key = key
+        self.kwargs = kwargs
+        self.callback = callback
+        self.attempts = 0
+
+
+class _Chat:
+
+    def __init__(self, rate, burst):
+        self.queue = collections.deque()
+        self.bucket = TokenBucket(rate, burst)
+        self.busy = False
+        self.blocked_until = 0.0
+
+
+class Outbox:
+    """Send messages from a queue within Telegram rate limits
+
+    Messages of a chat are sent in order, one at a time. A message rejected with
+    RetryAfter is sent again after the delay Telegram asks for.
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3, workers=4, max_attempts=5, max_chats=65536):
+        """
+        :param global_rate: messages per second over all chats
+        :param chat_rate: messages per second of a chat
+        :param chat_burst: messages a chat may get in a burst
+        :param workers: number of threads that send
+        :param max_attempts: attempts to send a message before it is dropped
+        :param max_chats: number of chats whose keyed messages can be edited
+        """
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._max_attempts = max_attempts
+        self._chats = {}
+        self._order = collections.deque()
+        self._ordered = set()
+        self._message_ids = LRUCache(max_chats)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._workers = [threading.Thread(target=self._work, name='outbox-{}'.format(index), daemon=True)
+                         for index in range(workers)]
+        self._sent = 0
+        self._coalesced = 0
+        self._retried = 0
+        self._dropped = 0
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self):
+        """Stop workers after queued messages are sent
+
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+
+    def send_message(self, bot, chat_id, text, key=None, callback=None, **kwargs):
+        """Queue text message
+
+        :param key: replace unsent message of the same key in chat, and allow edit_message() of this message
+        :param callback: called with sent Message
+        """
+        kwargs.update(chat_id=chat_id, text=text)
+        self._put(_Item(bot, chat_id, 'send_message', key, kwargs, callback))
+
+    def send_photo(self, bot, chat_id, photo, key=None, callback=None, **kwargs):
+        """Queue photo, see send_message()
+
+        """
+        kwargs.update(chat_id=chat_id, photo=photo)
+        self._put(_Item(bot, chat_id, 'send_photo', key, kwargs, callback))
+
+    def edit_message(self, bot, chat_id, key, text, **kwargs):
+        """Replace text of the last message sent with key
+
+        If that message is not sent yet, its text is replaced before it is sent. If no
+        message was sent with key, a new message is sent.
+        """
+        kwargs.update(chat_id=chat_id, text=text)
+        with self._cond:
+            chat = self._chats.get(chat_id)
+            if chat is not None:
+                for item in reversed(chat.queue):
+                    if item.key == key and item.kind in ('send_message', 'edit_message_text'):
+                        item.kwargs.update(kwargs)
+                        self._coalesced += 1
+                        return
+        self._put(_Item(bot, chat_id, 'edit_message_text', key, kwargs, None), replace=False)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'queued': sum(len(chat.queue) for chat in self._chats.values()),
+                'sent': self._sent,
+                'coalesced': self._coalesced,
+                'retried': self._retried,
+                'dropped': self._dropped,
+            }
+
+    def _put(self, item, replace=True):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('Outbox is stopped')
+            chat = self._chats.get(item.chat_id)
+            if chat is None:
+                chat = self._chats[item.chat_id] = _Chat(self._chat_rate, self._chat_burst)
+            if replace and item.key is not None:
+                stale = [queued for queued in chat.queue if queued.key == item.key]
+                for queued in stale:
+                    chat.queue.remove(queued)
+                self._coalesced += len(stale)
+            chat.queue.append(item)
+            self._schedule(item.chat_id)
+            self._cond.notify()
+
+    def _schedule(self, chat_id):
+        """Put chat in the round robin of chats with queued messages
+
+        """
+        if chat_id not in self._ordered:
+            self._ordered.add(chat_id)
+            self._order.append(chat_id)
+
+    def _next(self):
+        """Take next message whose chat is within its rate limit
+
+        :return: (item, chat), or None when stopped and queue is empty
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = None
+                for _ in range(len(self._order)):
+                    chat_id = self._order[0]
+                    self._order.rotate(-1)
+                    chat = self._chats[chat_id]
+                    if chat.busy:
+                        continue
+                    if not chat.queue:
+                        # rotated chat is the last one
+                        self._order.pop()
+                        self._ordered.discard(chat_id)
+                        if chat.bucket.is_full():
+                            del self._chats[chat_id]
+                        continue
+                    delay = max(chat.blocked_until - now, chat.bucket.delay(), self._global.delay())
+                    if delay > 0:
+                        wait = delay if wait is None else min(wait, delay)
+                        continue
+                    if not chat.bucket.consume():
+                        continue
+                    if not self._global.consume():
+                        chat.bucket.refund()
+                        continue
+                    chat.busy = True
+                    return chat.queue.popleft(), chat
+                if self._closed and not self._order:
+                    return None
+                self._cond.wait(wait)
+
+    def _work(self):
+        while True:
+            taken = self._next()
+            if taken is None:
+                return
+            item, chat = taken
+            retry_after = self._deliver(item)
+            with self._cond:
+                chat.busy = False
+                if retry_after is not None:
+                    chat.queue.appendleft(item)
+                    chat.blocked_until = time.monotonic() + retry_after
+                    self._schedule(item.chat_id)
+                self._cond.notify_all()
+
+    def _deliver(self, item):
+        """Send item
+
+        :return: seconds to wait before sending item again, or None if item is done
+        """
+        kwargs = dict(item.kwargs)
+        if item.kind == 'edit_message_text':
+            message_id = self._message_ids.get((item.chat_id, item.key))
+            if message_id is None:
+                kind = 'send_message'
+            else:
+                kind = 'edit_message_text'
+                kwargs['message_id'] = message_id
+        else:
+            kind = item.kind
+            photo = kwargs.get('photo')
+            if hasattr(photo, 'seek'):
+                photo.seek(0)
+        item.attempts += 1
+        try:
+            message = getattr(item.bot, kind)(**kwargs)
+        except RetryAfter as e:
+            if item.attempts >= self._max_attempts:
+                logger.warning('_deliver: drop message to chat {} after {} attempts'.format(
+                    item.chat_id, item.attempts))
+                self._count('_dropped')
+                return None
+            logger.info('_deliver: chat {} retry after {}s'.format(item.chat_id, e.retry_after))
+            self._count('_retried')
+            return e.retry_after
+        except BadRequest as e:
+            if kind == 'edit_message_text':
+                if 'not modified' in str(e).lower():
+                    return None
+                # e.g. the player deleted the message, send it again as a new message
+                logger.info('_deliver: edit in chat {} rejected, send new message: {}'.format(item.chat_id, e))
+                self._message_ids.pop((item.chat_id, item.key))
+                self._count('_retried')
+                return 0
+            logger.warning('_deliver: {} to chat {} rejected: {}'.format(kind, item.chat_id, e))
+            self._count('_dropped')
+            return None
+        except Exception as e:
+            logger.warning('_deliver: {} to chat {} failed: {}'.format(kind, item.chat_id, e))
+            self._count('_dropped')
+            return None
+        self._count('_sent')
+        if item.key is not None and kind != 'edit_message_text':
+            self._message_ids.put((item.chat_id, item.key), message.message_id)
+        if item.callback is not None:
+            item.callback(message)
+        return None
+
+    def _count(self, name):
+        with self._cond:
+            setattr(self, name, getattr(self, name) + 1)
@@ -0,0 +1,144 @@
+"""Load adaptive time control
+
+Computer moves wait for a thinking slot and then think for the whole time budget,
+so latency of a move grows with the queue in front of it. AdaptiveTimeControl
+shrinks the per-move budget while the host is busy, and gives it back when the
+host is quiet, to keep latency of /play under a target.
+"""
+import logging
+import os
+import threading
+
+__ALL__ = ['AdaptiveTimeControl', 'FixedTimeControl']
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveTimeControl:
+    """Choose engine time per move from current load
+
+    Latency of a move is modelled as overhead + budget * (1 + queued / slots): the
+    move waits for the moves queued ahead of it, each thinking about as long as it
+    will. Overhead, the part of latency that is neither waiting in the queue nor
+    thinking, is learned from observed latencies. The budget is further divided by the CPU load per core when
+    engines run slower than real time.
+    """
+
+    def __init__(self, target_latency, min_time=1, max_time=10, scheduler=None, smoothing=0.2):
+        """
+        :param target_latency: wanted seconds from /play to computer move
+        :param min_time: shortest budget in seconds
+        :param max_time: longest budget in seconds, used when host is quiet
+        :param scheduler: GenmoveScheduler whose queue depth is taken into account
+        :param smoothing: weight of new observations in overhead average
+        """
+        if not 0 < min_time <= max_time:
+            raise ValueError('Time budget must satisfy 0 < min_time <= max_time')
+        self._target_latency = target_latency
+        self._min_time = min_time
+        self._max_time = max_time
+        self._scheduler = scheduler
+        self._smoothing = smoothing
+        self._overhead = 0.0
+        self._lock = threading.Lock()
+        self._budgets = 0
+        self._cut_budgets = 0
+        self._cut_seconds = 0
+        self._observed = 0
+        self._over_target = 0
+        self._last_budget = max_time
+
+    def budget(self):
+        """Time budget of the next computer move
+
+        :return: whole seconds between min_time and max_time
+        """
+        queued = 0
+        slots = os.cpu_count() or 1
+        if self._scheduler is not None:
+            queued = self._scheduler.queue_depth()
+            slots = self._scheduler.slots
+        load = self._load_per_core()
+        with self._lock:
+            available = self._target_latency - self._overhead
+            budget = available / (1 + queued / slots) / max(load, 1.0)
+            budget = int(min(max(budget, self._min_time), self._max_time))
+            self._budgets += 1
+            if budget < self._max_time:
+                self._cut_budgets += 1
+                self._cut_seconds += self._max_time - budget
+            if budget != self._last_budget:
+                logger.info('budget: {}s, queued {}, load {:.2f}, overhead {:.2f}s'.format(
+                    budget, queued, load, self._overhead))
+            self._last_budget = budget
+            return budget
+
+    def observe(self, latency, budget, queue_wait=0.0):
+        """Record latency of a computer move
+
+        :param latency: seconds from /play to computer move
+        :param budget: time budget the move was played with
+        :param queue_wait: seconds the move waited for a thinking slot, budget() accounts for it already
+        """
+        with self._lock:
+            overhead = max(latency - queue_wait - budget, 0.0)
+            if self._observed == 0:
+                self._overhead = overhead
+            else:
+                self._overhead += self._smoothing * (overhead - self._overhead)
+            self._observed += 1
+            if latency > self._target_latency:
+                self._over_target += 1
+
+    def stats(self):
+        """Statistics of issued budgets
+
+        cut_ratio is the share of budgets below max_time, and mean_cut the mean
+        seconds taken away from max_time per budget.
+        """
+        with self._lock:
+            return {
+                'budgets': self._budgets,
+                'cut_budgets': self._cut_budgets,
+                'cut_ratio': self._cut_budgets / self._budgets if self._budgets else 0.0,
+                'mean_cut': self._cut_seconds / self._budgets if self._budgets else 0.0,
+                'last_budget': self._last_budget,
+                'overhead': self._overhead,
+                'observed': self._observed,
+                'over_target': self._over_target,
+            }
+
+    @staticmethod
+    def _load_per_core():
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (AttributeError, OSError):
+            return 0.0
+
+
+class FixedTimeControl:
+    """Same time budget for every move
+
+    """
+
+    def __init__(self, move_time):
+        """
+        :param move_time: seconds per move
+        """
+        if move_time <= 0:
+            raise ValueError('Move time must be positive')
+        self._move_time = int(move_time)
+        self._budgets = 0
+
+    def budget(self):
+        self._budgets += 1
+        return self._move_time
+
+    def observe(self, latency, budget, queue_wait=0.0):
+        pass
+
+    def stats(self):
+        return {
+            'budgets': self._budgets,
+            'last_budget': self._move_time,
+        }